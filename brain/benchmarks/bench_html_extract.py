@@ -0,0 +1,137 @@
+"""
+Benchmark page content extraction for the web search routes.
+
+Compares the previous path (read the whole body, build a BeautifulSoup
+`html.parser` tree, take the title and first 10 paragraphs) with
+`utils.html_extract`, fed in 64 KiB chunks as the body would stream in and
+stopped early or at the byte cap, with each available parser backend.
+Reports time per page, peak traced memory and how much of the body was read.
+
+Without --pages, documentation-style pages are generated at a few sizes
+(head with scripts and styles, navigation, then sections of paragraphs, code
+and tables). Point --pages at a directory of saved *.html files to use real
+documents.
+
+Run from the brain/ directory:
+    python -m benchmarks.bench_html_extract [--pages DIR] [--repeat 5]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from bs4 import BeautifulSoup
+
+from utils.html_extract import HtmlExtractor, etree
+from utils.page_fetcher import MAX_BYTES
+
+CHUNK = 65536
+
+
+def legacy_extract(body: bytes) -> Dict[str, str]:
+    """The previous fetch_full_content parsing (of `response.text`, the whole body decoded)."""
+    soup = BeautifulSoup(body.decode("utf-8", errors="replace"), "html.parser")
+    title = soup.title.string.strip() if soup.title and soup.title.string else "No title"
+    paragraphs = [p.get_text(strip=True) for p in soup.find_all("p")]
+    paragraphs = [p for p in paragraphs if p]
+    return {"scraped_title": title, "content": "\n".join(paragraphs[:10]) if paragraphs else "No readable content."}
+
+
+def bounded_extract(backend: str) -> Callable[[bytes], Dict[str, str]]:
+    def extract(body: bytes) -> Dict[str, str]:
+        extractor = HtmlExtractor(backend)
+        read = 0
+        while read < len(body) and read < MAX_BYTES:
+            chunk = body[read:read + CHUNK]
+            read += len(chunk)
+            if extractor.feed(chunk.decode("utf-8", errors="replace")):
+                break
+        extract.bytes_read = read
+        return extractor.close()
+    extract.bytes_read = 0
+    return extract
+
+
+def synthetic_page(size: int, seed: int) -> str:
+    """A documentation-like page of roughly `size` bytes."""
+    rng = random.Random(seed)
+    words = ("request response client server async await module function handler value "
+             "connection pool timeout cache index query parser buffer stream token").split()
+
+    def sentence() -> str:
+        return " ".join(rng.choice(words) for _ in range(rng.randint(8, 20))).capitalize() + "."
+
+    head = ["<!DOCTYPE html><html><head><meta charset='utf-8'><title>Reference &mdash; Section", str(seed),
+            "</title>", "<style>", "body{margin:0} .nav a{color:#333}" * 200, "</style>",
+            "<script>", "window.__DATA__ = {" + ",".join(f'"k{i}": "{sentence()}"' for i in range(300)) + "};",
+            "</script></head><body><nav class='nav'><ul>",
+            "".join(f"<li><a href='/docs/{i}'>{rng.choice(words)}</a></li>" for i in range(400)),
+            "</ul></nav><main>"]
+    body: List[str] = []
+    length = sum(len(part) for part in head)
+    section = 0
+    while length < size:
+        section += 1
+        parts = [f"<section><h2>Section {section}</h2>"]
+        for _ in range(rng.randint(2, 5)):
+            parts.append(f"<p>{sentence()} <code>{rng.choice(words)}()</code> {sentence()}</p>")
+        parts.append("<pre><code>" + "\n".join(sentence() for _ in range(10)) + "</code></pre>")
+        parts.append("<table>" + "".join(f"<tr><td>{rng.choice(words)}</td><td>{sentence()}</td></tr>"
+                                         for _ in range(10)) + "</table></section>")
+        chunk = "".join(parts)
+        body.append(chunk)
+        length += len(chunk)
+    return "".join(head + body + ["</main></body></html>"])
+
+
+def measure(fn: Callable[[bytes], Dict[str, str]], body: bytes, repeat: int) -> Tuple[float, float, Dict[str, str]]:
+    """Mean milliseconds per call and peak traced memory (MiB) of one call."""
+    result = fn(body)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    elapsed_ms = (time.perf_counter() - started) / repeat * 1000
+    tracemalloc.start()
+    fn(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_ms, peak / (1024 * 1024), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=Path, help="directory of saved *.html pages")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = [(path.name, path.read_bytes()) for path in sorted(args.pages.glob("*.html"))]
+    else:
+        pages = [(f"synthetic-{size // 1000}k", synthetic_page(size, seed).encode("utf-8"))
+                 for seed, size in enumerate((50_000, 500_000, 2_000_000, 6_000_000))]
+
+    backends = ["html.parser"] + (["lxml"] if etree is not None else [])
+    extractors = [("bs4 full", legacy_extract)] + [(f"bounded {b}", bounded_extract(b)) for b in backends]
+
+    print(f"{'page':<22} {'KiB':>6} {'path':<20} {'ms':>9} {'peak MiB':>9} {'KiB read':>9} {'same':>5}")
+    totals = {name: [0.0, 0.0] for name, _ in extractors}
+    for name, body in pages:
+        size_kib = len(body) // 1024
+        reference = None
+        for path, fn in extractors:
+            ms, peak, result = measure(fn, body, args.repeat)
+            read_kib = getattr(fn, "bytes_read", len(body)) // 1024
+            reference = reference or result
+            totals[path][0] += ms
+            totals[path][1] = max(totals[path][1], peak)
+            print(f"{name:<22} {size_kib:>6} {path:<20} {ms:>9.2f} {peak:>9.2f} {read_kib:>9} "
+                  f"{'yes' if result == reference else 'no':>5}")
+    print()
+    for path, (ms, peak) in totals.items():
+        print(f"{'total':<22} {'':>6} {path:<20} {ms:>9.2f} {peak:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark structured-output parsing on model outputs.
+
+Compares the per-router cleanup that used to run on every response (fence
+regexes, a greedy `\\{.*\\}` search, json.loads, then json_repair) with
+`utils.output_schema.parse_json`, and shows which tier each sample needs.
+
+The bundled samples (benchmarks/data/model_outputs.jsonl) cover the shapes
+seen in the routers' "RAW ... OUTPUT" logs: clean, pretty-printed, fenced,
+wrapped in prose, truncated and otherwise malformed. Point --samples at a
+JSONL file of {"endpoint", "kind", "text"} records to use captured outputs.
+
+Run from the brain/ directory:
+    python -m benchmarks.bench_output_parsing [--samples path] [--repeat 200]
+"""
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+
+from json_repair import repair_json
+
+from utils.output_schema import parse_json_tiered
+
+DEFAULT_SAMPLES = Path(__file__).parent / "data" / "model_outputs.jsonl"
+
+
+def legacy_parse(text: str):
+    """The previous router pipeline (gemini_ai.generate_roadmap)."""
+    text = text.strip()
+    if text.startswith("```json"):
+        text = re.sub(r"^```json\s*", "", text)
+    if text.endswith("```"):
+        text = re.sub(r"\s*```$", "", text)
+    json_match = re.search(r"\{.*\}", text, re.DOTALL)
+    if json_match:
+        text = json_match.group()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(repair_json(text))
+
+
+def _time(fn, text: str, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        try:
+            fn(text)
+        except Exception:
+            pass
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=Path, default=DEFAULT_SAMPLES)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    samples = [json.loads(line) for line in args.samples.read_text().splitlines() if line.strip()]
+    print(f"{'endpoint':<12} {'kind':<20} {'bytes':>6} {'tier':<10} {'legacy us':>10} {'new us':>8}")
+    totals = [0.0, 0.0]
+    for sample in samples:
+        text = sample["text"]
+        try:
+            _, tier = parse_json_tiered(text)
+        except json.JSONDecodeError:
+            tier = "failed"
+        legacy_us = _time(legacy_parse, text, args.repeat)
+        new_us = _time(parse_json_tiered, text, args.repeat)
+        totals[0] += legacy_us
+        totals[1] += new_us
+        print(f"{sample.get('endpoint', '-'):<12} {sample.get('kind', '-'):<20} {len(text):>6} {tier:<10} "
+              f"{legacy_us:>10.1f} {new_us:>8.1f}")
+    print(f"{'total':<12} {'':<20} {'':>6} {'':<10} {totals[0]:>10.1f} {totals[1]:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark roadmap graph repair on synthetic roadmaps.
+
+Builds roadmaps of increasing size with a mix of typical model mistakes
+(dangling and duplicate edges, self loops, orphans, back edges) and times
+`utils.roadmap_graph.repair_graph` on each.
+
+Run from the brain/ directory:
+    python -m benchmarks.bench_roadmap_graph [--sizes 100 1000 5000 20000] [--repeat 5]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from utils.roadmap_graph import repair_graph
+
+
+def synthetic_roadmap(size: int, seed: int = 0):
+    rng = random.Random(seed)
+    types = ["topic", "project", "quiz", "milestone"]
+    nodes = [{"id": "start", "type": "start"}]
+    nodes += [{"id": str(i), "type": rng.choice(types)} for i in range(1, size - 1)]
+    nodes.append({"id": "end", "type": "end"})
+    ids = [n["id"] for n in nodes]
+
+    edges = []
+    for source, target in zip(ids, ids[1:]):
+        if rng.random() < 0.05:
+            continue  # leaves orphans and unreachable nodes behind
+        edges.append({"id": f"e{source}-{target}", "source": source, "target": target})
+    for _ in range(size // 10):
+        a, b = sorted(rng.sample(range(1, size - 1), 2))
+        edges.append({"id": f"x{a}-{b}", "source": ids[a], "target": ids[b]})  # branch
+        edges.append({"id": f"c{b}-{a}", "source": ids[b], "target": ids[a]})  # cycle
+    for _ in range(size // 20):
+        edges.append(dict(rng.choice(edges)))  # duplicate
+        edges.append({"id": "dangling", "source": rng.choice(ids), "target": "missing"})
+        node_id = rng.choice(ids)
+        edges.append({"id": "self", "source": node_id, "target": node_id})
+    rng.shuffle(edges)
+    return nodes, edges
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[15, 100, 1000, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>8} {'edges':>8} {'median ms':>10} {'us/node':>8}  fixes")
+    for size in args.sizes:
+        nodes, edges = synthetic_roadmap(size)
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            _, report = repair_graph(nodes, [dict(e) for e in edges])
+            timings.append(time.perf_counter() - started)
+        median = statistics.median(timings)
+        fixes = ", ".join(f"{k}={v}" for k, v in sorted(report.counts.items()))
+        print(f"{size:>8} {len(edges):>8} {median * 1000:>10.2f} {median * 1e6 / size:>8.2f}  {fixes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Benchmark /tts/speak synthesis under concurrent voice interviews.
+
+Compares the previous path (a process-wide lock held around
+`Communicate.save()` to a temp file, which is then read back into memory
+before anything is sent) with `utils.tts_engine.synthesize`, which runs
+requests concurrently under the per-voice limit and hands each chunk on as
+edge-tts delivers it. Reports time to first audio byte and total time per
+request (p50 / p95) and requests per second, at several concurrency levels.
+
+With --lengths, compares instead one synthesis of the whole text with
+`synthesize_segments` (sentence segments synthesized ahead in parallel) for
+texts of the given lengths: time to first audio, total time and retries.
+
+By default edge-tts is simulated: each request connects after --connect-ms
+and then delivers --chunks audio chunks --chunk-ms apart, like the service
+does for a sentence or two. Pass --live to synthesize with the real service
+(needs network access; keep --requests small to stay clear of throttling).
+
+Run from the brain/ directory:
+    python -m benchmarks.bench_tts [--concurrency 1 4 16] [--requests 32] [--live]
+    python -m benchmarks.bench_tts --lengths 200 1000 4000 10000 [--fail-rate 0.05]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from typing import Callable, Dict, List, Tuple
+
+import edge_tts
+
+from utils import tts_engine
+from utils.tts_engine import prepare_text, synthesize, synthesize_segments
+
+VOICE = "en-US-AndrewNeural"
+TEXT = "Tell me about a time you had to debug a production issue under pressure. What was your approach?"
+
+
+class SimulatedCommunicate:
+    """Stands in for edge_tts.Communicate with the service's timing."""
+
+    connect_ms = 150.0
+    chunk_ms = 40.0
+    chunks = 20
+    chunk_size = 4608
+    chars_per_chunk = 0  # > 0: audio proportional to the text instead of `chunks`
+    fail_rate = 0.0
+
+    def __init__(self, text: str, voice: str, **kwargs):
+        self.text = text
+        self.voice = voice
+
+    async def stream(self):
+        await asyncio.sleep(self.connect_ms / 1000)
+        if random.random() < self.fail_rate:
+            raise ConnectionError("simulated connection drop")
+        chunks = -(-len(self.text) // self.chars_per_chunk) if self.chars_per_chunk else self.chunks
+        for _ in range(chunks):
+            await asyncio.sleep(self.chunk_ms / 1000)
+            yield {"type": "audio", "data": b"\xff" * self.chunk_size}
+
+    async def save(self, path: str):
+        with open(path, "wb") as f:
+            async for message in self.stream():
+                f.write(message["data"])
+
+
+# The old route held a threading.Lock across an await: a second request
+# blocked the event loop thread on it (and could never be let go by the
+# first). An asyncio.Lock gives the same serialization without hanging
+# the benchmark, so the legacy numbers are its best case.
+legacy_lock: asyncio.Lock
+
+
+async def legacy_request(communicate_cls) -> Tuple[float, float]:
+    """The previous /speak: global lock, save to a temp file, read back, then send."""
+    started = time.perf_counter()
+    temp_file = os.path.join(tempfile.gettempdir(), f"bench_tts_{uuid.uuid4()}.mp3")
+    async with legacy_lock:
+        await communicate_cls(prepare_text(TEXT), VOICE).save(temp_file)
+    with open(temp_file, "rb") as f:
+        audio = f.read()
+    os.remove(temp_file)
+    assert audio
+    # The whole file goes out at once: first byte and last byte together
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+
+async def streaming_request(communicate_cls) -> Tuple[float, float]:
+    started = time.perf_counter()
+    first_byte = None
+    async for _ in synthesize(prepare_text(TEXT), VOICE):
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+    return first_byte, time.perf_counter() - started
+
+
+async def run(request: Callable, communicate_cls, concurrency: int, requests: int) -> Dict[str, float]:
+    """`requests` requests, at most `concurrency` in flight (like that many interviews)."""
+    global legacy_lock
+    legacy_lock = asyncio.Lock()
+    gate = asyncio.Semaphore(concurrency)
+    timings: List[Tuple[float, float]] = []
+
+    async def one():
+        async with gate:
+            timings.append(await request(communicate_cls))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - started
+    first = sorted(t[0] * 1000 for t in timings)
+    total = sorted(t[1] * 1000 for t in timings)
+    return {
+        "ttfb_p50": statistics.median(first),
+        "ttfb_p95": first[int(0.95 * (len(first) - 1))],
+        "total_p50": statistics.median(total),
+        "total_p95": total[int(0.95 * (len(total) - 1))],
+        "rps": requests / wall,
+    }
+
+
+SENTENCES = [
+    "A closure keeps the variables of the scope it was created in alive.",
+    "The event loop runs one callback at a time, so long work blocks everything else.",
+    "Promises settle once, and their handlers always run asynchronously.",
+    "Prefer composition of small functions over deep inheritance hierarchies.",
+]
+
+
+def long_text(length: int) -> str:
+    """Course-explanation-like text of about `length` characters, in paragraphs."""
+    rng = random.Random(length)
+    paragraphs, paragraph, size = [], [], 0
+    while size < length:
+        sentence = rng.choice(SENTENCES)
+        paragraph.append(sentence)
+        size += len(sentence) + 1
+        if len(paragraph) == 5:
+            paragraphs.append(" ".join(paragraph))
+            paragraph = []
+    return "\n\n".join(paragraphs + [" ".join(paragraph)]).strip()
+
+
+async def time_text(make_chunks: Callable[[], object]) -> Tuple[float, float]:
+    started = time.perf_counter()
+    first_byte = None
+    async for _ in make_chunks():
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+    return first_byte, time.perf_counter() - started
+
+
+def compare_lengths(lengths: List[int]):
+    print(f"{'chars':>6} {'path':<10} {'first audio ms':>15} {'total ms':>9} {'retries':>8}")
+    for length in lengths:
+        text = prepare_text(long_text(length))
+        for name, make_chunks in (
+            ("single", lambda: synthesize(text, VOICE, timeout=600)),
+            ("pipelined", lambda: synthesize_segments(text, VOICE)),
+        ):
+            retries = tts_engine.tts_stats.segment_retries
+            try:
+                first, total = asyncio.run(time_text(make_chunks))
+                print(f"{length:>6} {name:<10} {first * 1000:>15.0f} {total * 1000:>9.0f} "
+                      f"{tts_engine.tts_stats.segment_retries - retries:>8}")
+            except Exception as e:
+                print(f"{length:>6} {name:<10} {'failed: ' + type(e).__name__:>15}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--per-voice", type=int, default=tts_engine.PER_VOICE_CONCURRENCY)
+    parser.add_argument("--connect-ms", type=float, default=SimulatedCommunicate.connect_ms)
+    parser.add_argument("--chunk-ms", type=float, default=SimulatedCommunicate.chunk_ms)
+    parser.add_argument("--chunks", type=int, default=SimulatedCommunicate.chunks)
+    parser.add_argument("--live", action="store_true", help="use the real edge-tts service")
+    parser.add_argument("--lengths", type=int, nargs="+", help="compare single vs pipelined at these text lengths")
+    parser.add_argument("--chars-per-chunk", type=int, default=25, help="simulated audio per text (--lengths)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="simulated failed syntheses (--lengths)")
+    args = parser.parse_args()
+
+    if args.live:
+        communicate_cls = edge_tts.Communicate
+    else:
+        SimulatedCommunicate.connect_ms = args.connect_ms
+        SimulatedCommunicate.chunk_ms = args.chunk_ms
+        SimulatedCommunicate.chunks = args.chunks
+        communicate_cls = SimulatedCommunicate
+        tts_engine.edge_tts.Communicate = SimulatedCommunicate
+    tts_engine.voice_limiter.per_voice = args.per_voice
+
+    if args.lengths:
+        SimulatedCommunicate.chars_per_chunk = args.chars_per_chunk
+        SimulatedCommunicate.fail_rate = args.fail_rate
+        compare_lengths(args.lengths)
+        return
+
+    print(f"{'edge-tts' if args.live else 'simulated edge-tts'}, {args.requests} requests, "
+          f"{args.per_voice} per voice")
+    print(f"{'path':<10} {'conc':>5} {'ttfb p50':>9} {'ttfb p95':>9} {'total p50':>10} {'total p95':>10} {'req/s':>7}")
+    for concurrency in args.concurrency:
+        for name, request in (("legacy", legacy_request), ("streaming", streaming_request)):
+            tts_engine.voice_limiter._semaphores.clear()
+            r = asyncio.run(run(request, communicate_cls, concurrency, args.requests))
+            print(f"{name:<10} {concurrency:>5} {r['ttfb_p50']:>9.0f} {r['ttfb_p95']:>9.0f} "
+                  f"{r['total_p50']:>10.0f} {r['total_p95']:>10.0f} {r['rps']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from routers import tts, ai_chat, gemini_ai, lms, web_search, quiz, roadmap, performance_moniter
+from utils import llm_gateway, page_fetcher
+from utils.admission import OverloadedError, admission
+from utils.health import health_registry
+from utils.model_scheduler import PINNED_MODELS
+from utils.piper_engine import PRELOAD as PIPER_PRELOAD, piper_engine
+from utils.pregeneration import pipeline
 from pathlib import Path
 import tempfile
 import os
+import asyncio
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -43,6 +51,15 @@ app.include_router(roadmap.router, prefix="/roadmap", tags=["AI based Roadmap Ge
 app.include_router(performance_moniter.router, prefix="/performance", tags=["Performance Moniter"])
 
 
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    """Reject requests that could not be admitted instead of letting them hang"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.get("/", response_model=dict)
 async def root():
     """Root endpoint with API information"""
@@ -56,23 +73,41 @@ async def root():
         },
         "endpoints": {
             "/tts/speak": "POST - Convert text to speech",
+            "/tts/audio/{key}": "GET - Cached speech by its ETag",
             "/tts/voices": "GET - List available voices",
             "/tts/health": "GET - TTS health check",
+            "/health": "GET - Aggregated health of all dependencies",
+            "/health/live": "GET - Liveness probe",
+            "/health/ready": "GET - Readiness probe",
             "/ai/chat": "POST - AI chat conversation"
         }
     }
 
 @app.get("/health")
 async def global_health_check():
-    """Global health check for all services"""
+    """Global health check for all services (cached dependency probes)"""
+    overall = health_registry.overall()
+    unhealthy = [name for name, check in overall["checks"].items() if check["status"] != "healthy"]
     return {
-        "status": "healthy",
+        **overall,
         "service": "Voice Interview API",
         "version": "2.0.0",
         "services": ["TTS", "AI Chat"],
-        "message": "All services operational"
+        "message": "All services operational" if not unhealthy else f"Not healthy: {', '.join(unhealthy)}"
     }
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: the process and its event loop respond (no dependency checks)"""
+    live = health_registry.liveness()
+    return JSONResponse(status_code=200 if live["status"] == "alive" else 503, content=live)
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: the critical dependencies were up at their last probe"""
+    ready = health_registry.readiness()
+    return JSONResponse(status_code=200 if ready["status"] == "ready" else 503, content=ready)
+
 @app.on_event("startup")
 async def startup_event():
     """Startup event handler"""
@@ -85,13 +120,34 @@ async def startup_event():
         os.makedirs(temp_dir)
     
     logger.info(f"Using temporary directory: {temp_dir}")
+    
+    # Warm pinned Ollama models, start tracking which models are resident and
+    # evaluate their static system prompts ahead of the first request
+    asyncio.create_task(_warm_llm_backend())
+    # Probe dependencies in the background; health endpoints serve the cached results
+    await health_registry.start()
+    # Start the Piper workers so the ONNX voice is loaded before the first local synthesis
+    if PIPER_PRELOAD:
+        asyncio.create_task(piper_engine.start())
     logger.info("Voice Interview API started successfully!")
 
+async def _warm_llm_backend():
+    await admission.backend.start(llm_gateway.get_client)
+    await llm_gateway.prime_prefixes(PINNED_MODELS)
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Shutdown event handler"""
     logger.info("Voice Interview API shutting down...")
     
+    # Stop background LLM work and release pooled Ollama and web connections
+    await pipeline.stop()
+    await health_registry.stop()
+    await admission.backend.stop()
+    await llm_gateway.close_client()
+    await page_fetcher.close_client()
+    piper_engine.shutdown()
+    
     # Cleanup any remaining temp files
     temp_dir = tempfile.gettempdir()
     try:
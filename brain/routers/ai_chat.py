@@ -2,12 +2,14 @@ from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List
+import asyncio
 import os
 import google.generativeai as genai
 from dotenv import load_dotenv
 import logging
 import re
 from typing import List, Dict
+from utils.health import health_registry
 
 
 # Configure logging
@@ -94,40 +96,17 @@ async def chat(data: ChatRequest):
 
 @router.get("/health")
 async def ai_health_check():
-    """Health check for AI chat service"""
-    try:
-        # Check if API key is configured
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            return {
-                "status": "unhealthy",
-                "service": "AI Chat Service",
-                "error": "Google API key not configured",
-                "model": "gemini-1.5-flash"
-            }
-        
-        # Test basic model initialization
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        
-        # Simple test generation (non-streaming)
-        test_response = model.generate_content("Hello, this is a health check.")
-        
-        return {
-            "status": "healthy",
-            "service": "AI Chat Service",
-            "model": "gemini-1.5-flash",
-            "api_key_configured": True,
-            "test_response_length": len(test_response.text) if test_response.text else 0
-        }
-        
-    except Exception as e:
-        logger.error(f"AI health check failed: {e}")
-        return {
-            "status": "unhealthy",
-            "service": "AI Chat Service",
-            "error": str(e),
-            "model": "gemini-1.5-flash"
-        }
+    """Cached health of the AI chat service (Gemini is probed in the background, not per call)"""
+    check = health_registry.get("gemini")
+    return {
+        "status": check.current_status,
+        "service": "AI Chat Service",
+        "model": "gemini-1.5-flash",
+        "api_key_configured": bool(os.getenv("GOOGLE_API_KEY")),
+        "error": check.error,
+        "checked_at": check.checked_at,
+        "age_seconds": check.age_seconds
+    }
 
 @router.get("/models")
 async def get_available_models():
@@ -198,3 +177,13 @@ async def generate_example():
             status_code=500,
             detail=f"Failed to generate example: {str(e)}"
         )
+
+
+async def _probe_gemini() -> dict:
+    # Model metadata only: checks the key and reachability without spending generation quota
+    if not os.getenv("GOOGLE_API_KEY"):
+        raise RuntimeError("Google API key not configured")
+    model = await asyncio.to_thread(genai.get_model, "models/gemini-1.5-flash")
+    return {"model": model.name}
+
+health_registry.register("gemini", _probe_gemini, interval=300)
@@ -1,12 +1,22 @@
+import asyncio
 import json
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Response
 from fastapi.responses import StreamingResponse
-import ollama
-from pydantic import BaseModel, ValidationError
-from typing import List
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, List, Literal, Optional, Tuple
 import os
-import re
+import time
 from dotenv import load_dotenv
+from routers.roadmap import schedule_pregeneration
+from utils import llm_cache, llm_gateway
+from utils.admission import OverloadedError
+from utils.cache_control import cache_policy
+from utils.json_stream import JsonArrayStreamParser
+from utils.micro_batcher import MicroBatcher
+from utils.output_schema import ParseRecord, json_schema, parse_json, parse_stats, validate
+from utils.prefix_cache import prefix_cache, prefix_hash
+from utils.semantic_cache import semantic_cache
+from utils.roadmap_graph import CompactRoadmapBuilder, repair_graph
 
 router = APIRouter()
 
@@ -17,17 +27,82 @@ class DescriptionRequest(BaseModel):
 class DescriptionResponse(BaseModel):
     description: str
 
+class DescriptionBatchRequest(BaseModel):
+    items: List[DescriptionRequest] = Field(..., min_length=1, max_length=100)
+
+class DescriptionBatchResponse(BaseModel):
+    descriptions: List[DescriptionResponse]
+
+# Compact mode: the model writes only (type, label, description) steps and the
+# server synthesizes ids, edges and positions, cutting decoded tokens
+ROADMAP_COMPACT_DEFAULT = os.getenv("ROADMAP_COMPACT_DEFAULT", "false").lower() in ("1", "true", "yes")
+
 class RoadmapRequest(BaseModel):
     prompt: str
+    compact: bool = ROADMAP_COMPACT_DEFAULT
+    # Opt-in background generation of node content once the roadmap is ready
+    pregenerate: bool = False
+    difficulty: Literal["easy", "medium", "hard"] = "medium"
+    title: Optional[str] = None
 
 class RoadmapResponse(BaseModel):
     nodes: list
     edges: list
 
-@router.post("/api/description", response_model=DescriptionResponse)
-async def generate_description(data: DescriptionRequest):
-    # 1. Simplified system prompt focusing on a single 'description' field
-    system_prompt = """
+# -------- Model output shapes (compiled into decoding constraints) --------
+
+class IndexedDescription(BaseModel):
+    index: int
+    description: str
+
+class GeneratedDescriptions(BaseModel):
+    descriptions: List[IndexedDescription]
+
+RoadmapNodeType = Literal["start", "course", "milestone", "project", "concept", "topic", "step", "quiz", "end"]
+
+class GeneratedNodeData(BaseModel):
+    label: str
+    description: str
+
+class GeneratedPosition(BaseModel):
+    x: int
+    y: int
+
+class GeneratedNode(BaseModel):
+    id: str
+    type: RoadmapNodeType
+    data: GeneratedNodeData
+    position: GeneratedPosition
+
+class GeneratedEdge(BaseModel):
+    id: str
+    source: str
+    target: str
+
+class GeneratedRoadmap(BaseModel):
+    nodes: List[GeneratedNode]
+    edges: List[GeneratedEdge]
+
+class CompactBranch(BaseModel):
+    type: Literal["course", "milestone", "project", "concept", "topic", "step", "quiz"]
+    label: str
+    description: str
+
+class CompactStep(CompactBranch):
+    children: List[CompactBranch] = []
+
+class CompactRoadmap(BaseModel):
+    steps: List[CompactStep]
+
+DESCRIPTION_MODEL = "qwen3:1.7b"
+
+# Concurrent single-description calls arriving within this window are merged
+# into one batch generation (0 disables micro-batching)
+DESCRIPTION_BATCH_WINDOW_MS = float(os.getenv("DESCRIPTION_BATCH_WINDOW_MS", "50"))
+DESCRIPTION_MAX_BATCH = int(os.getenv("DESCRIPTION_MAX_BATCH", "16"))
+
+# 1. Simplified system prompt focusing on a single 'description' field
+DESCRIPTION_SYSTEM_PROMPT = """
     You are a specialized AI assistant that generates a detailed description in a structured JSON format.
     You MUST adhere to the following JSON schema:
     {
@@ -40,25 +115,50 @@ async def generate_description(data: DescriptionRequest):
     - The 'description' field MUST contain a clear explanation that is 5 to 6 lines in length.
     """
 
-    # 2. User prompt remains simple
-    user_prompt = f"Generate a detailed description (5-6 lines) for the concept '{data.label}' within the context of '{data.context}'."
+DESCRIPTION_BATCH_SYSTEM_PROMPT = """
+    You are a specialized AI assistant that generates detailed descriptions for several concepts at once in a structured JSON format.
+    You MUST adhere to the following JSON schema:
+    {
+      "descriptions": [
+        {
+          "index": 0,
+          "description": "A detailed explanation of the concept, approximately 5 to 6 lines long, suitable for a beginner."
+        }
+      ]
+    }
+    
+    CRITICAL RULES:
+    - Your entire response MUST be a single, valid JSON object and nothing else.
+    - Do NOT include any introductory text, closing remarks, or markdown like ```json.
+    - Return exactly one entry per numbered concept, using the concept's number as its 'index'.
+    - Every 'description' field MUST contain a clear explanation that is 5 to 6 lines in length.
+    """
 
-    try:
-        response = ollama.generate(
-            model="qwen3:1.7b",
-            prompt=user_prompt,
-            system=system_prompt,
-            options={"temperature": 0.6},
-            format="json" # Enforces JSON output
-        )
+# Single and batch descriptions share num_ctx: Ollama reloads the model when it changes
+DESCRIPTION_OPTIONS = {"temperature": 0.6, "num_ctx": 8192}
 
-        raw_response = response["response"]
-        parsed_json = json.loads(raw_response)
-        
-        # 3. Validate directly against your DescriptionResponse model
-        validated_data = DescriptionResponse.model_validate(parsed_json)
+# Decoding is constrained to these schemas instead of plain format="json"
+DESCRIPTION_FORMAT = json_schema(DescriptionResponse)
+DESCRIPTION_BATCH_FORMAT = json_schema(GeneratedDescriptions)
+ROADMAP_FORMAT = json_schema(GeneratedRoadmap)
+ROADMAP_COMPACT_FORMAT = json_schema(CompactRoadmap)
+
+@router.post("/api/description", response_model=DescriptionResponse)
+async def generate_description(data: DescriptionRequest, cache_control: Optional[str] = Header(default=None)):
+    use_cache = llm_cache.cache_allowed(cache_control)
+    try:
+        if use_cache:
+            # Serve cached descriptions before joining a batch
+            hit = await llm_gateway.lookup(
+                DESCRIPTION_MODEL, _description_prompt(data), DESCRIPTION_SYSTEM_PROMPT, DESCRIPTION_OPTIONS,
+                DESCRIPTION_FORMAT
+            )
+            if hit is not None:
+                return validate(DescriptionResponse, parse_json(hit.text))
 
-        return validated_data # FastAPI will serialize this Pydantic object correctly
+        if DESCRIPTION_BATCH_WINDOW_MS > 0:
+            return await description_batcher.submit((data, use_cache))
+        return await _describe_single(data, use_cache)
 
     except json.JSONDecodeError:
         # AI's output was not valid JSON
@@ -66,430 +166,599 @@ async def generate_description(data: DescriptionRequest):
     except ValidationError as e:
         # JSON was valid, but didn't match {"description": "..."}
         raise HTTPException(status_code=500, detail=f"AI response did not match expected format: {e}")
+    except OverloadedError:
+        raise
     except Exception as e:
         # Catch-all for other errors
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/api/description/batch", response_model=DescriptionBatchResponse)
+async def generate_description_batch(data: DescriptionBatchRequest, cache_control: Optional[str] = Header(default=None)):
+    """Describe many (label, context) pairs with one generation per DESCRIPTION_MAX_BATCH items"""
+    use_cache = llm_cache.cache_allowed(cache_control)
+    chunks = [data.items[i:i + DESCRIPTION_MAX_BATCH] for i in range(0, len(data.items), DESCRIPTION_MAX_BATCH)]
+    try:
+        results = await asyncio.gather(*[_describe_batch(chunk, use_cache) for chunk in chunks])
+        return DescriptionBatchResponse(descriptions=[d for chunk in results for d in chunk])
+
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=500, detail="AI failed to generate valid JSON.")
+    except ValidationError as e:
+        raise HTTPException(status_code=500, detail=f"AI response did not match expected format: {e}")
+    except OverloadedError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _description_prompt(data: DescriptionRequest) -> str:
+    # 2. User prompt remains simple
+    return f"Generate a detailed description (5-6 lines) for the concept '{data.label}' within the context of '{data.context}'."
+
+async def _describe_single(data: DescriptionRequest, use_cache: bool) -> DescriptionResponse:
+    result = await llm_gateway.generate(
+        model=DESCRIPTION_MODEL,
+        prompt=_description_prompt(data),
+        system=DESCRIPTION_SYSTEM_PROMPT,
+        options=DESCRIPTION_OPTIONS,
+        format=DESCRIPTION_FORMAT, # Constrains output to the DescriptionResponse schema
+        cache=use_cache
+    )
+
+    record = parse_stats.start("description")
+    try:
+        parsed_json = parse_json(result.text, record)
+        # 3. Validate directly against your DescriptionResponse model
+        return validate(DescriptionResponse, parsed_json)
+    except (json.JSONDecodeError, ValidationError) as e:
+        if isinstance(e, ValidationError):
+            record.failed("validation_failures")
+        await llm_gateway.invalidate(result)
+        raise
+
+async def _describe_batch(items: List[DescriptionRequest], use_cache: bool) -> List[DescriptionResponse]:
+    """
+    Describe several concepts in one structured generation.
+
+    Entries the model skipped or mangled are generated individually, so a batch
+    always yields one description per item, in order.
+    """
+    if len(items) == 1:
+        return [await _describe_single(items[0], use_cache)]
+
+    concepts = "\n".join(
+        f"{i}. '{item.label}' within the context of '{item.context}'" for i, item in enumerate(items)
+    )
+    user_prompt = f"Generate a detailed description (5-6 lines) for each of the following concepts:\n{concepts}"
+
+    result = await llm_gateway.generate(
+        model=DESCRIPTION_MODEL,
+        prompt=user_prompt,
+        system=DESCRIPTION_BATCH_SYSTEM_PROMPT,
+        options=DESCRIPTION_OPTIONS,
+        format=DESCRIPTION_BATCH_FORMAT,
+        cache=use_cache
+    )
+
+    record = parse_stats.start("description_batch")
+    descriptions: Dict[int, DescriptionResponse] = {}
+    try:
+        entries = parse_json(result.text, record).get("descriptions", [])
+        for position, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                continue
+            index = entry.get("index", position)
+            if isinstance(index, int) and 0 <= index < len(items) and index not in descriptions:
+                try:
+                    descriptions[index] = validate(DescriptionResponse, entry)
+                except ValidationError:
+                    continue
+    except (json.JSONDecodeError, AttributeError) as e:
+        if isinstance(e, AttributeError):
+            record.failed("invalid_format")
+        print(f"🔧 Batch description output unusable ({e}), describing items individually")
+
+    if use_cache:
+        # Let later single-description calls for these items hit the cache
+        for i, description in descriptions.items():
+            await llm_gateway.remember(
+                DESCRIPTION_MODEL, _description_prompt(items[i]), description.model_dump_json(),
+                DESCRIPTION_SYSTEM_PROMPT, DESCRIPTION_OPTIONS, DESCRIPTION_FORMAT
+            )
+
+    missing = [i for i in range(len(items)) if i not in descriptions]
+    if missing:
+        record.repaired("items_regenerated", len(missing))
+        if len(missing) < len(items):
+            print(f"🔧 Batch description missing {len(missing)}/{len(items)} items, describing them individually")
+        else:
+            await llm_gateway.invalidate(result)
+        singles = await asyncio.gather(*[_describe_single(items[i], use_cache) for i in missing])
+        descriptions.update(zip(missing, singles))
+
+    return [descriptions[i] for i in range(len(items))]
+
+async def _run_description_batch(entries: List[Tuple[DescriptionRequest, bool]]) -> List[DescriptionResponse]:
+    # A merged batch only uses the cache if every caller allowed it
+    return await _describe_batch([item for item, _ in entries], all(use_cache for _, use_cache in entries))
+
+description_batcher = MicroBatcher(
+    "description",
+    _run_description_batch,
+    window_ms=DESCRIPTION_BATCH_WINDOW_MS,
+    max_batch=DESCRIPTION_MAX_BATCH,
+)
+
+ROADMAP_SYSTEM_PROMPT = (
+    "You are an expert learning roadmap creator. You must create comprehensive learning paths "
+    "that follow proven educational structures.\n\n"
+    
+    "CRITICAL REQUIREMENTS:\n"
+    "- Respond ONLY with valid JSON - no explanations, no markdown, no extra text\n"
+    "- Your response MUST start with '{' and end with '}'\n"
+    "- Generate exactly this JSON structure:\n"
+    "{\n"
+    "  \"nodes\": [\n"
+    "    {\n"
+    "      \"id\": \"unique_id\",\n"
+    "      \"type\": \"start|course|milestone|project|concept|topic|step|quiz|end\",\n"
+    "      \"data\": {\n"
+    "        \"label\": \"Node title\",\n"
+    "        \"description\": \"Detailed description of what to learn/do\"\n"
+    "      },\n"
+    "      \"position\": { \"x\": 100 + on each new node, \"y\": 100 (should be maintained) }\n"
+    "    }\n"
+    "  ],\n"
+    "  \"edges\": [\n"
+    "    {\n"
+    "      \"id\": \"edge_id\",\n"
+    "      \"source\": \"source_node_id\",\n"
+    "      \"target\": \"target_node_id\"\n"
+    "    }\n"
+    "  ]\n"
+    "}\n\n"
+    
+    "MANDATORY NODE TYPE RESTRICTIONS:\n"
+    "- EXACTLY ONE 'start' node (id: 'start') at the beginning\n"
+    "- EXACTLY ONE 'end' node (id: 'end') at the completion\n"
+    "- Use ONLY these node types: start, course, milestone, project, concept, topic, step, quiz, end\n"
+    "- NEVER use any other node types (no 'assessment', 'task', etc.)\n\n"
+    
+    "ROADMAP STRUCTURE REQUIREMENTS:\n"
+    "- A Single Roadmap should minimum of 10 nodes"
+    "- Generate 12-15 nodes total (including start and end)\n"
+    "- Node distribution: start(1) + course(2-3) + concept(2-3) + topic(3-4) + project(2-3) + milestone(1-2) + quiz(1-2) + step(1-2) + end(1)\n"
+    "- Position nodes in logical flow: x increases by 200-300, y varies for branching (100, 300, 500)\n\n"
+    
+    "LEARNING PATH RULES:\n"
+    "1. START: Begin with exactly one 'start' node\n"
+    "2. FOUNDATION: Follow with 'course' or 'concept' nodes for basics\n"
+    "3. TOPICS: Add 'topic' nodes for specific subject areas\n"
+    "4. PROJECTS: Place 'project' nodes after every 2-3 topic/concept nodes\n"
+    "5. STEPS: Use 'step' nodes for detailed learning actions\n"
+    "6. QUIZZES: Insert 'quiz' nodes randomly throughout (not in sequence)\n"
+    "7. MILESTONES: Add 'milestone' nodes at major achievement points\n"
+    "8. END: Finish with exactly one 'end' node\n\n"
+    
+    "NODE TYPE DEFINITIONS:\n"
+    "- start: Starting point of learning journey\n"
+    "- course: Structured learning content or course\n"
+    "- milestone: Important achievement or checkpoint\n"
+    "- project: Hands-on project or practical application\n"
+    "- concept: Core concept or theoretical knowledge\n"
+    "- topic: Specific topic or subject area\n"
+    "- step: Individual step in the learning process\n"
+    "- quiz: Quick quiz to test knowledge\n"
+    "- end: Completion or end goal\n\n"
+    
+    "EDGE REQUIREMENTS:\n"
+    "- Create logical learning progressions\n"
+    "- Ensure every node (except 'end') connects to at least one next node\n"
+    "- Ensure every node (except 'start') has at least one incoming connection\n"
+    "- Edge IDs format: 'e{source}-{target}'\n\n"
+
+    "EDGE CONNECTIVITY RULES:\n"
+    "- EVERY node must be connected in the learning path\n"
+    "- Source and target IDs in edges MUST exactly match node IDs\n"
+    "- Create a linear progression: start → [learning nodes] → end\n"
+    "- No orphaned nodes (nodes with no connections)\n"
+    "- Example valid edge: {\"id\": \"e1-2\", \"source\": \"1\", \"target\": \"2\"}\n"
+    "- Double-check all edge references match existing node IDs\n\n"
+    
+    "CONTENT QUALITY:\n"
+    "- Descriptions must be specific and actionable (15-35 words each)\n"
+    "- Labels should be clear and concise (2-5 words)\n"
+    "- Projects should combine multiple learned concepts\n"
+    "- Quizzes should test recent learning\n"
+    "- Milestones should mark significant progress points\n\n"
+    
+    "Remember: Use ONLY the specified node types. Output ONLY valid JSON. No other text allowed."
+)
+
+ROADMAP_COMPACT_SYSTEM_PROMPT = (
+    "You are an expert learning roadmap creator. You must create comprehensive learning paths "
+    "that follow proven educational structures.\n\n"
+
+    "CRITICAL REQUIREMENTS:\n"
+    "- Respond ONLY with valid JSON - no explanations, no markdown, no extra text\n"
+    "- Generate exactly this JSON structure:\n"
+    "{\n"
+    "  \"steps\": [\n"
+    "    {\"type\": \"course|milestone|project|concept|topic|step|quiz\", \"label\": \"Node title\", "
+    "\"description\": \"What to learn/do\"},\n"
+    "    {\"type\": \"topic\", \"label\": \"...\", \"description\": \"...\", \"children\": [<steps learned in parallel>]}\n"
+    "  ]\n"
+    "}\n"
+    "- List steps in learning order; the next step follows the previous one\n"
+    "- Use 'children' only for topics that can be learned in parallel after their parent step\n"
+    "- Do NOT write ids, positions, edges, or start/end steps - they are added automatically\n\n"
+
+    "ROADMAP STRUCTURE REQUIREMENTS:\n"
+    "- Generate 10-13 steps in total\n"
+    "- Mix: course(2-3) + concept(2-3) + topic(3-4) + project(2-3) + milestone(1-2) + quiz(1-2) + step(1-2)\n"
+    "- Foundations first, a project after every 2-3 topic/concept steps, quizzes spread out, milestones at major achievements\n\n"
+
+    "CONTENT QUALITY:\n"
+    "- Descriptions must be specific and actionable (15-35 words each)\n"
+    "- Labels should be clear and concise (2-5 words)\n\n"
+
+    "Remember: Use ONLY the specified step types. Output ONLY valid JSON. No other text allowed."
+)
+
+
+ROADMAP_MODEL = "gemma3:latest"
+
+# Static system prompts: their evaluated prefix is reused across requests
+prefix_cache.register("description", DESCRIPTION_MODEL, DESCRIPTION_SYSTEM_PROMPT,
+                      {"num_ctx": DESCRIPTION_OPTIONS["num_ctx"]})
+prefix_cache.register("description_batch", DESCRIPTION_MODEL, DESCRIPTION_BATCH_SYSTEM_PROMPT,
+                      {"num_ctx": DESCRIPTION_OPTIONS["num_ctx"]})
+prefix_cache.register("roadmap", ROADMAP_MODEL, ROADMAP_SYSTEM_PROMPT)
+prefix_cache.register("roadmap_compact", ROADMAP_MODEL, ROADMAP_COMPACT_SYSTEM_PROMPT)
+
+
 @router.post("/api/generate-roadmap", response_model=RoadmapResponse)
-async def generate_roadmap(data: RoadmapRequest):
+async def generate_roadmap(data: RoadmapRequest, response: Response, cache_control: Optional[str] = Header(default=None)):
+    result = None
+    record = None
     try:
-        # Enhanced system prompt with template structure and strict JSON enforcement
-        system_prompt = (
-            "You are an expert learning roadmap creator. You must create comprehensive learning paths "
-            "that follow proven educational structures.\n\n"
-            
-            "CRITICAL REQUIREMENTS:\n"
-            "- Respond ONLY with valid JSON - no explanations, no markdown, no extra text\n"
-            "- Your response MUST start with '{' and end with '}'\n"
-            "- Generate exactly this JSON structure:\n"
-            "{\n"
-            "  \"nodes\": [\n"
-            "    {\n"
-            "      \"id\": \"unique_id\",\n"
-            "      \"type\": \"start|course|milestone|project|concept|topic|step|quiz|end\",\n"
-            "      \"data\": {\n"
-            "        \"label\": \"Node title\",\n"
-            "        \"description\": \"Detailed description of what to learn/do\"\n"
-            "      },\n"
-            "      \"position\": { \"x\": 100 + on each new node, \"y\": 100 (should be maintained) }\n"
-            "    }\n"
-            "  ],\n"
-            "  \"edges\": [\n"
-            "    {\n"
-            "      \"id\": \"edge_id\",\n"
-            "      \"source\": \"source_node_id\",\n"
-            "      \"target\": \"target_node_id\"\n"
-            "    }\n"
-            "  ]\n"
-            "}\n\n"
-            
-            "MANDATORY NODE TYPE RESTRICTIONS:\n"
-            "- EXACTLY ONE 'start' node (id: 'start') at the beginning\n"
-            "- EXACTLY ONE 'end' node (id: 'end') at the completion\n"
-            "- Use ONLY these node types: start, course, milestone, project, concept, topic, step, quiz, end\n"
-            "- NEVER use any other node types (no 'assessment', 'task', etc.)\n\n"
-            
-            "ROADMAP STRUCTURE REQUIREMENTS:\n"
-            "- A Single Roadmap should minimum of 10 nodes"
-            "- Generate 12-15 nodes total (including start and end)\n"
-            "- Node distribution: start(1) + course(2-3) + concept(2-3) + topic(3-4) + project(2-3) + milestone(1-2) + quiz(1-2) + step(1-2) + end(1)\n"
-            "- Position nodes in logical flow: x increases by 200-300, y varies for branching (100, 300, 500)\n\n"
-            
-            "LEARNING PATH RULES:\n"
-            "1. START: Begin with exactly one 'start' node\n"
-            "2. FOUNDATION: Follow with 'course' or 'concept' nodes for basics\n"
-            "3. TOPICS: Add 'topic' nodes for specific subject areas\n"
-            "4. PROJECTS: Place 'project' nodes after every 2-3 topic/concept nodes\n"
-            "5. STEPS: Use 'step' nodes for detailed learning actions\n"
-            "6. QUIZZES: Insert 'quiz' nodes randomly throughout (not in sequence)\n"
-            "7. MILESTONES: Add 'milestone' nodes at major achievement points\n"
-            "8. END: Finish with exactly one 'end' node\n\n"
-            
-            "NODE TYPE DEFINITIONS:\n"
-            "- start: Starting point of learning journey\n"
-            "- course: Structured learning content or course\n"
-            "- milestone: Important achievement or checkpoint\n"
-            "- project: Hands-on project or practical application\n"
-            "- concept: Core concept or theoretical knowledge\n"
-            "- topic: Specific topic or subject area\n"
-            "- step: Individual step in the learning process\n"
-            "- quiz: Quick quiz to test knowledge\n"
-            "- end: Completion or end goal\n\n"
-            
-            "EDGE REQUIREMENTS:\n"
-            "- Create logical learning progressions\n"
-            "- Ensure every node (except 'end') connects to at least one next node\n"
-            "- Ensure every node (except 'start') has at least one incoming connection\n"
-            "- Edge IDs format: 'e{source}-{target}'\n\n"
-
-            "EDGE CONNECTIVITY RULES:\n"
-            "- EVERY node must be connected in the learning path\n"
-            "- Source and target IDs in edges MUST exactly match node IDs\n"
-            "- Create a linear progression: start → [learning nodes] → end\n"
-            "- No orphaned nodes (nodes with no connections)\n"
-            "- Example valid edge: {\"id\": \"e1-2\", \"source\": \"1\", \"target\": \"2\"}\n"
-            "- Double-check all edge references match existing node IDs\n\n"
-            
-            "CONTENT QUALITY:\n"
-            "- Descriptions must be specific and actionable (15-35 words each)\n"
-            "- Labels should be clear and concise (2-5 words)\n"
-            "- Projects should combine multiple learned concepts\n"
-            "- Quizzes should test recent learning\n"
-            "- Milestones should mark significant progress points\n\n"
-            
-            "Remember: Use ONLY the specified node types. Output ONLY valid JSON. No other text allowed."
+        # A roadmap generated for a similar enough prompt is served as-is
+        cache = cache_policy(cache_control, semantic_cache.enabled)
+        query = await semantic_cache.query(
+            _roadmap_namespace(data), data.prompt, lookup=cache["read"], store=cache["write"]
         )
+        if query.hit:
+            response.headers["X-Semantic-Cache"] = "hit"
+            response.headers["X-Semantic-Similarity"] = str(query.similarity)
+            print(f"✅ Semantic cache hit ({query.similarity}) for '{data.prompt}' → '{query.matched}'")
+            _schedule_roadmap_pregeneration(data, query.value, response)
+            return query.value
+        response.headers["X-Semantic-Cache"] = "miss"
+
+        # Enhanced system prompt with template structure and strict JSON enforcement
+        system_prompt = ROADMAP_COMPACT_SYSTEM_PROMPT if data.compact else ROADMAP_SYSTEM_PROMPT
 
         # Enhanced user prompt with template context
-        user_prompt = (
-            f"Create a comprehensive learning roadmap for: {data.prompt}\n\n"
-            
-            "Use these successful roadmap patterns as inspiration:\n"
-            "- Web Development: HTML → CSS → JavaScript → Framework → Backend → Full-stack Project\n"
-            "- Data Science: Python → SQL → Statistics → Data Manipulation → Visualization → ML → Project\n"
-            "- Cybersecurity: Networking → OS → Security Principles → Defensive/Offensive → Practical Challenges\n"
-            "- Cloud Computing: IT Basics → Linux → Cloud Provider → IaC → Containers → Deployment Project\n"
-            "- Mobile Development: Language → UI/UX → SDK → APIs → State Management → Published App\n\n"
-            
-            "Structure your roadmap with:\n"
-            "1. Foundation topics (3-4 nodes)\n"
-            "2. Core concepts (4-5 nodes)\n"
-            "3. Practical application (2-3 project nodes)\n"
-            "4. Advanced topics (3-4 nodes)\n"
-            "5. Capstone project (1 node)\n"
-            "6. Assessment checkpoints (1-2 nodes)\n\n"
-            
-            "Generate the JSON roadmap now:"
-        )
+        user_prompt = _build_roadmap_user_prompt(data.prompt)
 
         # Generate using Ollama with strict JSON format
-        response = ollama.generate(
-            model="gemma3:latest",
+        result = await llm_gateway.generate(
+            model=ROADMAP_MODEL,
             prompt=user_prompt,
             system=system_prompt,
-            format="json"  # Enforces JSON output
+            format=ROADMAP_COMPACT_FORMAT if data.compact else ROADMAP_FORMAT  # Constrains output to the roadmap schema
         )
 
-        print("🧪 RAW Ollama OUTPUT:", response["response"])
+        print("🧪 RAW Ollama OUTPUT:", result.text)
+        record = parse_stats.start("roadmap_compact" if data.compact else "roadmap")
 
-        # Parse and validate the JSON response
-        text = response["response"].strip()
-        
-        # Additional cleaning in case of any formatting issues
-        if text.startswith('```json'):
-            text = re.sub(r'^```json\s*', '', text)
-        if text.endswith('```'):
-            text = re.sub(r'\s*```$', '', text)
-        
-        # Extract JSON if wrapped in extra text
-        json_match = re.search(r'\{.*\}', text, re.DOTALL)
-        if json_match:
-            text = json_match.group()
-        
-        # Attempt JSON repair if needed
-        try:
-            parsed = json.loads(text)
-        except json.JSONDecodeError:
-            print("🔧 Attempting JSON repair...")
-            from json_repair import repair_json
-            repaired_text = repair_json(text)
-            parsed = json.loads(repaired_text)
-
-        # Validate required structure
-        if "nodes" not in parsed or "edges" not in parsed:
-            raise ValueError("Missing required keys 'nodes' or 'edges' in AI response")
+        # Parse the JSON response (fences/extra text stripped and repaired only if needed)
+        parsed = parse_json(result.text, record)
+        if not isinstance(parsed, dict):
+            raise ValueError("AI response is not a JSON object")
+
+        if data.compact:
+            parsed = _build_compact_roadmap(parsed)
+        else:
+            # Validate required structure
+            if "nodes" not in parsed or "edges" not in parsed:
+                raise ValueError("Missing required keys 'nodes' or 'edges' in AI response")
         
-        if not isinstance(parsed["nodes"], list) or not isinstance(parsed["edges"], list):
-            raise ValueError("'nodes' and 'edges' must be arrays")
+            if not isinstance(parsed["nodes"], list) or not isinstance(parsed["edges"], list):
+                raise ValueError("'nodes' and 'edges' must be arrays")
         
-        if len(parsed["nodes"]) < 5:
-            raise ValueError(f"Insufficient nodes generated: {len(parsed['nodes'])}. Minimum 5 required.")
+            if len(parsed["nodes"]) < 5:
+                raise ValueError(f"Insufficient nodes generated: {len(parsed['nodes'])}. Minimum 5 required.")
 
-        # Clean up any extra fields that shouldn't be there
-        if "capstone" in parsed:
-            del parsed["capstone"]
+            # Clean up any extra fields that shouldn't be there
+            if "capstone" in parsed:
+                del parsed["capstone"]
         
-        # Validate and fix node structure
-        node_ids = set()
-        for i, node in enumerate(parsed["nodes"]):
-            # Check required fields
-            required_fields = ["id", "type", "data", "position"]
-            for field in required_fields:
-                if field not in node:
-                    print(f"🔧 Fixing Node {i}: Adding missing field '{field}'")
-                    if field == "position":
-                        # Add default position based on index
-                        node["position"] = {"x": (i % 5) * 250, "y": (i // 5) * 200}
-                    elif field == "data":
-                        node["data"] = {"label": f"Node {i}", "description": "Auto-generated node"}
-                    elif field == "id":
-                        node["id"] = f"node_{i}"
-                    elif field == "type":
-                        node["type"] = "topic"
-            
-            # Check for duplicate IDs and fix them
-            original_id = node["id"]
-            counter = 1
-            while node["id"] in node_ids:
-                node["id"] = f"{original_id}_{counter}"
-                counter += 1
-                print(f"🔧 Fixed duplicate ID: {original_id} → {node['id']}")
-            node_ids.add(node["id"])
-            
-            # Validate and fix data field
-            data = node.get("data", {})
-            if "label" not in data:
-                # Check if there's a 'title' field we can use instead
-                if "title" in data:
-                    print(f"🔧 Node {i}: Converting 'title' to 'label'")
-                    data["label"] = data["title"]
-                    # Optionally remove the title field to avoid confusion
-                    # del data["title"]
-                else:
-                    print(f"🔧 Node {i}: Adding missing label")
-                    data["label"] = f"Learning Topic {i+1}"
-            
-            # Ensure description exists
-            if "description" not in data:
-                print(f"🔧 Node {i}: Adding missing description")
-                data["description"] = f"Learn about {data.get('label', 'this topic')}"
-            
-            # Validate position field
-            position = node.get("position", {})
-            if not isinstance(position, dict) or "x" not in position or "y" not in position:
-                print(f"🔧 Fixing position for Node {i}")
-                node["position"] = {"x": (i % 5) * 250, "y": (i // 5) * 200}
+            # Validate and fix node structure
+            node_ids = set()
+            for i, node in enumerate(parsed["nodes"]):
+                _fix_node(node, i, node_ids, record)
 
-        # ENHANCED EDGE VALIDATION AND AUTO-FIX
-        valid_node_ids = {node["id"] for node in parsed["nodes"]}
-        fixed_edges = []
-        connected_nodes = set()
-        
-        print("🔍 Starting edge validation and repair...")
-        
-        # Step 1: Validate existing edges and remove invalid ones
-        for i, edge in enumerate(parsed["edges"]):
-            # Check required fields
-            required_fields = ["id", "source", "target"]
-            edge_valid = True
-            
-            for field in required_fields:
-                if field not in edge:
-                    print(f"🔧 Edge {i} missing required field: {field}")
-                    edge_valid = False
-                    break
-            
-            if not edge_valid:
-                continue
-            
-            # Validate that source and target nodes exist
-            if edge["source"] not in valid_node_ids:
-                print(f"🔧 Edge {i}: Invalid source '{edge['source']}' - node doesn't exist")
-                continue
-            
-            if edge["target"] not in valid_node_ids:
-                print(f"🔧 Edge {i}: Invalid target '{edge['target']}' - node doesn't exist")
-                continue
-            
-            # Avoid self-referencing edges
-            if edge["source"] == edge["target"]:
-                print(f"🔧 Edge {i}: Self-referencing edge detected - skipping")
-                continue
-            
-            # Edge is valid
-            fixed_edges.append(edge)
-            connected_nodes.add(edge["source"])
-            connected_nodes.add(edge["target"])
-        
-        print(f"🔍 Valid edges found: {len(fixed_edges)}")
-        print(f"🔍 Connected nodes: {len(connected_nodes)}/{len(valid_node_ids)}")
-        
-        # Step 2: Find orphaned nodes and create connections
-        orphaned_nodes = valid_node_ids - connected_nodes
-        if orphaned_nodes:
-            print(f"🔧 Found {len(orphaned_nodes)} orphaned nodes: {orphaned_nodes}")
-            
-            # Strategy: Create a logical learning path
-            node_list = parsed["nodes"]
-            
-            # Find start and end nodes
-            start_nodes = [n for n in node_list if n["type"] == "start"]
-            end_nodes = [n for n in node_list if n["type"] == "end"]
-            
-            # If we have too few edges, create a complete linear path
-            if len(fixed_edges) < len(node_list) - 1:
-                print("🔧 Creating complete linear learning path...")
-                fixed_edges = []
-                connected_nodes = set()
-                
-                for i in range(len(node_list) - 1):
-                    current_node = node_list[i]
-                    next_node = node_list[i + 1]
-                    
-                    edge_id = f"e{current_node['id']}-{next_node['id']}"
-                    fixed_edges.append({
-                        "id": edge_id,
-                        "source": current_node["id"],
-                        "target": next_node["id"]
-                    })
-                    connected_nodes.add(current_node["id"])
-                    connected_nodes.add(next_node["id"])
-                
-                print(f"🔧 Created {len(fixed_edges)} linear connections")
-            
-            else:
-                # Connect orphaned nodes to existing path
-                for orphaned_id in orphaned_nodes:
-                    orphaned_node = next((n for n in node_list if n["id"] == orphaned_id), None)
-                    if not orphaned_node:
-                        continue
-                    
-                    # Find a suitable connection based on node type
-                    if orphaned_node["type"] == "start" and end_nodes:
-                        # Connect start to first learning node
-                        learning_nodes = [n for n in node_list if n["type"] not in ["start", "end"]]
-                        if learning_nodes:
-                            target_id = learning_nodes[0]["id"]
-                            fixed_edges.append({
-                                "id": f"e{orphaned_id}-{target_id}",
-                                "source": orphaned_id,
-                                "target": target_id
-                            })
-                            print(f"🔧 Connected start node {orphaned_id} to {target_id}")
-                    
-                    elif orphaned_node["type"] == "end":
-                        # Connect last learning node to end
-                        learning_nodes = [n for n in node_list if n["type"] not in ["start", "end"]]
-                        if learning_nodes:
-                            source_id = learning_nodes[-1]["id"]
-                            fixed_edges.append({
-                                "id": f"e{source_id}-{orphaned_id}",
-                                "source": source_id,
-                                "target": orphaned_id
-                            })
-                            print(f"🔧 Connected {source_id} to end node {orphaned_id}")
-                    
-                    else:
-                        # Connect to nearby nodes in the sequence
-                        node_index = next((i for i, n in enumerate(node_list) if n["id"] == orphaned_id), -1)
-                        if node_index > 0:
-                            prev_node = node_list[node_index - 1]
-                            fixed_edges.append({
-                                "id": f"e{prev_node['id']}-{orphaned_id}",
-                                "source": prev_node["id"],
-                                "target": orphaned_id
-                            })
-                            print(f"🔧 Connected {prev_node['id']} to orphaned {orphaned_id}")
-                        
-                        if node_index < len(node_list) - 1:
-                            next_node = node_list[node_index + 1]
-                            fixed_edges.append({
-                                "id": f"e{orphaned_id}-{next_node['id']}",
-                                "source": orphaned_id,
-                                "target": next_node["id"]
-                            })
-                            print(f"🔧 Connected orphaned {orphaned_id} to {next_node['id']}")
-        
-        # Step 3: Ensure start and end nodes are properly connected
-        start_nodes = [n for n in parsed["nodes"] if n["type"] == "start"]
-        end_nodes = [n for n in parsed["nodes"] if n["type"] == "end"]
-        
-        if start_nodes:
-            start_id = start_nodes[0]["id"]
-            # Ensure start node has outgoing connections
-            has_outgoing = any(edge["source"] == start_id for edge in fixed_edges)
-            if not has_outgoing:
-                learning_nodes = [n for n in parsed["nodes"] if n["type"] not in ["start", "end"]]
-                if learning_nodes:
-                    target_id = learning_nodes[0]["id"]
-                    fixed_edges.append({
-                        "id": f"e{start_id}-{target_id}",
-                        "source": start_id,
-                        "target": target_id
-                    })
-                    print(f"🔧 Added outgoing edge from start: {start_id} → {target_id}")
-        
-        if end_nodes:
-            end_id = end_nodes[0]["id"]
-            # Ensure end node has incoming connections
-            has_incoming = any(edge["target"] == end_id for edge in fixed_edges)
-            if not has_incoming:
-                learning_nodes = [n for n in parsed["nodes"] if n["type"] not in ["start", "end"]]
-                if learning_nodes:
-                    source_id = learning_nodes[-1]["id"]
-                    fixed_edges.append({
-                        "id": f"e{source_id}-{end_id}",
-                        "source": source_id,
-                        "target": end_id
-                    })
-                    print(f"🔧 Added incoming edge to end: {source_id} → {end_id}")
-        
-        # Step 4: Remove duplicate edges
-        unique_edges = []
-        seen_connections = set()
-        
-        for edge in fixed_edges:
-            connection = (edge["source"], edge["target"])
-            if connection not in seen_connections:
-                unique_edges.append(edge)
-                seen_connections.add(connection)
-            else:
-                print(f"🔧 Removed duplicate edge: {edge['source']} → {edge['target']}")
-        
-        parsed["edges"] = unique_edges
-        
-        # Final validation summary
-        final_connected_nodes = set()
-        for edge in parsed["edges"]:
-            final_connected_nodes.add(edge["source"])
-            final_connected_nodes.add(edge["target"])
-        
-        print(f"✅ Edge validation complete:")
-        print(f"   - Total nodes: {len(parsed['nodes'])}")
-        print(f"   - Total edges: {len(parsed['edges'])}")
-        print(f"   - Connected nodes: {len(final_connected_nodes)}/{len(valid_node_ids)}")
-        print(f"   - Orphaned nodes: {len(valid_node_ids - final_connected_nodes)}")
+            # Validate and repair edges (dangling, duplicate, orphans, cycles, reachability)
+            parsed["edges"], report = repair_graph(parsed["nodes"], parsed["edges"])
+            record.repaired("graph_repairs", len(report.actions))
+            response.headers["X-Graph-Repairs"] = str(len(report.actions))
+            print(f"✅ Edge validation complete: {report.summary()}")
 
         print(f"✅ Successfully generated roadmap with {len(parsed['nodes'])} nodes and {len(parsed['edges'])} edges")
-        
+        if cache["write"]:
+            await semantic_cache.store(query, {"nodes": parsed["nodes"], "edges": parsed["edges"]})
+
+        _schedule_roadmap_pregeneration(data, parsed, response)
         return parsed
 
     except json.JSONDecodeError as e:
         print(f"🚨 JSON Parse Error: {e}")
-        print(f"🚨 Raw response: {response.get('response', 'N/A')}")
+        print(f"🚨 Raw response: {result.text if result else 'N/A'}")
         raise HTTPException(
             status_code=500, 
             detail=f"AI generated invalid JSON format. Parse error: {str(e)}"
         )
     except ValueError as e:
+        if record:
+            record.failed("validation_failures")
         print(f"🚨 Validation Error: {e}")
         raise HTTPException(
             status_code=500, 
             detail=f"AI response validation failed: {str(e)}"
         )
+    except OverloadedError:
+        raise
     except Exception as e:
         print(f"🚨 Generation Error: {e}")
         raise HTTPException(
             status_code=500, 
             detail=f"Failed to generate roadmap: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/api/generate-roadmap/stream")
+async def generate_roadmap_stream(data: RoadmapRequest, cache_control: Optional[str] = Header(default=None)):
+    """
+    Stream a roadmap as NDJSON while the model is still decoding it.
+
+    Each node is emitted as a {"type": "node"} line as soon as its object closes
+    and has been fixed; edges are repaired once the whole graph is known and sent
+    as a final {"type": "edges"} line, followed by a {"type": "done"} summary.
+    A roadmap from the semantic cache is sent the same way, all at once.
+    """
+    started = time.perf_counter()
+    cache = cache_policy(cache_control, semantic_cache.enabled)
+    query = await semantic_cache.query(
+        _roadmap_namespace(data), data.prompt, lookup=cache["read"], store=cache["write"]
+    )
+    if query.hit:
+        return StreamingResponse(
+            _cached_roadmap_stream(data, query, started),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-AI-Model": ROADMAP_MODEL, "X-Semantic-Cache": "hit"}
+        )
+
+    chunks = llm_gateway.stream(
+        model=ROADMAP_MODEL,
+        prompt=_build_roadmap_user_prompt(data.prompt),
+        system=ROADMAP_COMPACT_SYSTEM_PROMPT if data.compact else ROADMAP_SYSTEM_PROMPT,
+        format=ROADMAP_COMPACT_FORMAT if data.compact else ROADMAP_FORMAT
+    )
+
+    # Wait for the first chunk here so admission and connection errors still
+    # become proper HTTP errors instead of a broken stream
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = ""
+    except OverloadedError:
+        raise
+    except Exception as e:
+        print(f"🚨 Generation Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate roadmap: {str(e)}")
+
+    async def event_stream():
+        parser = JsonArrayStreamParser(keys=["steps"] if data.compact else ["nodes", "edges"])
+        builder = CompactRoadmapBuilder() if data.compact else None
+        record = parse_stats.start("roadmap_compact_stream" if data.compact else "roadmap_stream")
+        nodes, edges, node_ids = [], [], set()
+        first_node_ms = None
+
+        async def all_chunks():
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+
+        try:
+            async for chunk in all_chunks():
+                for key, item in parser.feed(chunk):
+                    if not isinstance(item, dict):
+                        continue
+                    if key == "steps":
+                        new_nodes = builder.add(item)
+                        if not nodes:
+                            new_nodes = builder.nodes[:1] + new_nodes
+                    elif key == "nodes":
+                        new_nodes = [_fix_node(item, len(nodes), node_ids, record)]
+                    else:
+                        edges.append(item)
+                        continue
+                    for node in new_nodes:
+                        nodes.append(node)
+                        if first_node_ms is None:
+                            first_node_ms = round((time.perf_counter() - started) * 1000, 2)
+                        yield json.dumps({"type": "node", "data": node}) + "\n"
+
+            if builder is not None:
+                if builder.learning_nodes < 3:
+                    raise ValueError(f"Insufficient steps generated: {builder.learning_nodes}. Minimum 3 required.")
+                nodes, fixed_edges = builder.finish()
+                yield json.dumps({"type": "node", "data": nodes[-1]}) + "\n"
+                repairs = {}
+            else:
+                if len(nodes) < 5:
+                    raise ValueError(f"Insufficient nodes generated: {len(nodes)}. Minimum 5 required.")
+                fixed_edges, report = repair_graph(nodes, edges)
+                print(f"✅ Edge validation complete: {report.summary()}")
+                record.repaired("graph_repairs", len(report.actions))
+                repairs = report.counts
+            if parser.skipped:
+                record.repaired("skipped_objects", parser.skipped)
+            yield json.dumps({"type": "edges", "data": fixed_edges}) + "\n"
+            if cache["write"]:
+                await semantic_cache.store(query, {"nodes": nodes, "edges": fixed_edges})
+
+            job_id = None
+            if data.pregenerate:
+                job_id = schedule_pregeneration(nodes, fixed_edges, data.difficulty, data.title or data.prompt)
+
+            yield json.dumps({
+                "type": "done",
+                "nodes": len(nodes),
+                "edges": len(fixed_edges),
+                "skipped_objects": parser.skipped,
+                "repairs": repairs,
+                "pregeneration_id": job_id,
+                "first_node_ms": first_node_ms,
+                "total_ms": round((time.perf_counter() - started) * 1000, 2)
+            }) + "\n"
+            print(f"✅ Streamed roadmap with {len(nodes)} nodes and {len(fixed_edges)} edges (first node after {first_node_ms}ms)")
+
+        except Exception as e:
+            record.failed("stream_failures")
+            print(f"🚨 Streaming Error: {e}")
+            yield json.dumps({"type": "error", "detail": f"Failed to generate roadmap: {str(e)}"}) + "\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-AI-Model": ROADMAP_MODEL, "X-Semantic-Cache": "miss"}
+    )
+
+async def _cached_roadmap_stream(data: RoadmapRequest, query, started: float):
+    nodes, edges = query.value["nodes"], query.value["edges"]
+    for node in nodes:
+        yield json.dumps({"type": "node", "data": node}) + "\n"
+    yield json.dumps({"type": "edges", "data": edges}) + "\n"
+
+    job_id = None
+    if data.pregenerate:
+        job_id = schedule_pregeneration(nodes, edges, data.difficulty, data.title or data.prompt)
+    yield json.dumps({
+        "type": "done",
+        "nodes": len(nodes),
+        "edges": len(edges),
+        "semantic_cache": {"similarity": query.similarity, "matched": query.matched},
+        "pregeneration_id": job_id,
+        "first_node_ms": round((time.perf_counter() - started) * 1000, 2),
+        "total_ms": round((time.perf_counter() - started) * 1000, 2)
+    }) + "\n"
+    print(f"✅ Semantic cache hit ({query.similarity}) for '{data.prompt}' → '{query.matched}'")
+
+def _roadmap_namespace(data: RoadmapRequest) -> str:
+    """Roadmaps are only interchangeable when generated by the same model and system prompt"""
+    system_prompt = ROADMAP_COMPACT_SYSTEM_PROMPT if data.compact else ROADMAP_SYSTEM_PROMPT
+    name = "roadmap_compact" if data.compact else "roadmap"
+    return f"{name}:{prefix_hash(ROADMAP_MODEL + system_prompt)}"
+
+def _schedule_roadmap_pregeneration(data: RoadmapRequest, roadmap: dict, response: Response):
+    if data.pregenerate:
+        job_id = schedule_pregeneration(roadmap["nodes"], roadmap["edges"], data.difficulty, data.title or data.prompt)
+        response.headers["X-Pregeneration-Id"] = job_id
+
+def _build_compact_roadmap(parsed) -> dict:
+    """Expand compact model output ({"steps": [...]}) into nodes and edges"""
+    steps = parsed.get("steps") if isinstance(parsed, dict) else parsed
+    if not isinstance(steps, list):
+        raise ValueError("Missing required key 'steps' in AI response")
+
+    builder = CompactRoadmapBuilder()
+    for step in steps:
+        builder.add(step)
+    if builder.learning_nodes < 3:
+        raise ValueError(f"Insufficient steps generated: {builder.learning_nodes}. Minimum 3 required.")
+    nodes, edges = builder.finish()
+    print(f"✅ Built compact roadmap: {len(steps)} steps → {len(nodes)} nodes, {len(edges)} edges")
+    return {"nodes": nodes, "edges": edges}
+
+def _build_roadmap_user_prompt(prompt: str) -> str:
+    return (
+        f"Create a comprehensive learning roadmap for: {prompt}\n\n"
+        
+        "Use these successful roadmap patterns as inspiration:\n"
+        "- Web Development: HTML → CSS → JavaScript → Framework → Backend → Full-stack Project\n"
+        "- Data Science: Python → SQL → Statistics → Data Manipulation → Visualization → ML → Project\n"
+        "- Cybersecurity: Networking → OS → Security Principles → Defensive/Offensive → Practical Challenges\n"
+        "- Cloud Computing: IT Basics → Linux → Cloud Provider → IaC → Containers → Deployment Project\n"
+        "- Mobile Development: Language → UI/UX → SDK → APIs → State Management → Published App\n\n"
+        
+        "Structure your roadmap with:\n"
+        "1. Foundation topics (3-4 nodes)\n"
+        "2. Core concepts (4-5 nodes)\n"
+        "3. Practical application (2-3 project nodes)\n"
+        "4. Advanced topics (3-4 nodes)\n"
+        "5. Capstone project (1 node)\n"
+        "6. Assessment checkpoints (1-2 nodes)\n\n"
+        
+        "Generate the JSON roadmap now:"
+    )
+
+def _fix_node(node: dict, i: int, node_ids: set, record: Optional[ParseRecord] = None) -> dict:
+    """Add missing fields, de-duplicate the id and normalize data/position of node `i`"""
+    fixes = 0
+    # Check required fields
+    required_fields = ["id", "type", "data", "position"]
+    for field in required_fields:
+        if field not in node:
+            print(f"🔧 Fixing Node {i}: Adding missing field '{field}'")
+            fixes += 1
+            if field == "position":
+                # Add default position based on index
+                node["position"] = {"x": (i % 5) * 250, "y": (i // 5) * 200}
+            elif field == "data":
+                node["data"] = {"label": f"Node {i}", "description": "Auto-generated node"}
+            elif field == "id":
+                node["id"] = f"node_{i}"
+            elif field == "type":
+                node["type"] = "topic"
+    
+    # Check for duplicate IDs and fix them
+    original_id = node["id"]
+    counter = 1
+    while node["id"] in node_ids:
+        node["id"] = f"{original_id}_{counter}"
+        counter += 1
+        print(f"🔧 Fixed duplicate ID: {original_id} → {node['id']}")
+        fixes += 1
+    node_ids.add(node["id"])
+    
+    # Validate and fix data field
+    data = node.get("data", {})
+    if "label" not in data:
+        # Check if there's a 'title' field we can use instead
+        if "title" in data:
+            print(f"🔧 Node {i}: Converting 'title' to 'label'")
+            fixes += 1
+            data["label"] = data["title"]
+            # Optionally remove the title field to avoid confusion
+            # del data["title"]
+        else:
+            print(f"🔧 Node {i}: Adding missing label")
+            fixes += 1
+            data["label"] = f"Learning Topic {i+1}"
+    
+    # Ensure description exists
+    if "description" not in data:
+        print(f"🔧 Node {i}: Adding missing description")
+        fixes += 1
+        data["description"] = f"Learn about {data.get('label', 'this topic')}"
+    
+    # Validate position field
+    position = node.get("position", {})
+    if not isinstance(position, dict) or "x" not in position or "y" not in position:
+        print(f"🔧 Fixing position for Node {i}")
+        fixes += 1
+        node["position"] = {"x": (i % 5) * 250, "y": (i // 5) * 200}
+
+    if record:
+        record.repaired("node_fixes", fixes)
+    return node
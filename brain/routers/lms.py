@@ -6,16 +6,17 @@ from typing import Any, Dict, List, Literal, Optional
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import JSONResponse
 import httpx
-from json_repair import repair_json
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, ValidationError
 import asyncio
-import ollama
+from utils import llm_gateway
+from utils.admission import OverloadedError
+from utils.output_schema import json_schema, parse_json, parse_stats, validate
+from utils.prefix_cache import prefix_cache
 
 
 router = APIRouter()
 
 LLM_ENDPOINT = "http://127.0.0.1:1234/v1/completions"
-request_cache = {}
 
 # -------- SCHEMAS --------
 
@@ -79,39 +80,89 @@ class GeneratedCourse(BaseModel):
     resources: Resources
     projects: List[Project]
 
+# -------- PROMPTS --------
+
+DIFFICULTY_MODEL = "qwen3:1.7b"
+COURSE_MODEL = "gemma:2b"
+
+DIFFICULTY_SYSTEM_PROMPT = (
+    "You are a learning difficulty analyzer. Your ONLY job is to analyze the provided roadmap data "
+    "and determine its overall difficulty level.\n\n"
+    "STRICT RULES:\n"
+    "- You MUST respond with EXACTLY ONE WORD only\n"
+    "- Your response must be one of these three words: Easy, Medium, Hard\n"
+    "- Do NOT include any explanations, punctuation, or additional text\n"
+    "- Do NOT use quotes or any other formatting\n"
+    "- Analyze the complexity, depth, and prerequisites of the topics to determine difficulty\n\n"
+    "Examples of correct responses:\n"
+    "Easy\n"
+    "Medium\n"
+    "Hard\n\n"
+    "Remember: ONLY return the single difficulty word, nothing else."
+)
+
+COURSE_SYSTEM_PROMPT = (
+    "You are an expert course designer. Respond ONLY with valid JSON matching this schema:\n"
+    "{ "
+    "\"title\": \"Course title\", "
+    "\"description\": \"Course description\", "
+    "\"difficulty\": \"Beginner\" | \"Intermediate\" | \"Advanced\", "
+    "\"estimatedDuration\": \"Estimated total time to complete (e.g. '6 hours')\", "
+    "\"learningObjectives\": [\"What learners will gain\"], "
+    "\"prerequisites\": [\"What learners should know before starting\"], "
+    "\"sections\": ["
+    "{ \"name\": \"Section title\", \"content\": \"Detailed explanation or lesson\", \"duration\": \"X hours\" }"
+    "], "
+    "\"resources\": { "
+    "\"videos\": ["
+    "{ \"title\": \"Video title\", \"url\": \"https://example.com\", \"duration\": \"X minutes\" }"
+    "], "
+    "\"articles\": ["
+    "{ \"title\": \"Article title\", \"url\": \"https://example.com\", \"readTime\": \"X minutes\" }"
+    "], "
+    "\"tools\": ["
+    "{ \"name\": \"Tool name\", \"description\": \"What the tool is for\", \"url\": \"https://example.com\" }"
+    "]"
+    "}, "
+    "\"projects\": ["
+    "{ "
+    "\"title\": \"Project title\", "
+    "\"description\": \"Project details\", "
+    "\"difficulty\": \"Beginner\" | \"Intermediate\" | \"Advanced\", "
+    "\"estimatedTime\": \"Time to complete (e.g. '3 hours')\""
+    "}"
+    "] "
+    "} "
+    "Respond ONLY with a valid JSON object. No introductions. No explanations. No markdown. "
+    "Your output MUST start with '{' and end with '}'. If you do not know something, use an empty string (\"\")."
+)
+
+# Course output is constrained to the GeneratedCourse schema
+COURSE_FORMAT = json_schema(GeneratedCourse)
+
+# Static system prompts: their evaluated prefix is reused across requests
+prefix_cache.register("roadmap_difficulty", DIFFICULTY_MODEL, DIFFICULTY_SYSTEM_PROMPT)
+prefix_cache.register("course", COURSE_MODEL, COURSE_SYSTEM_PROMPT)
+
 # -------- DO NOT MODIFY: Roadmap Difficulty --------
 
 @router.post("/ai/roadmap-difficulty")
 async def get_roadmap_difficulty(request: DifficultyRequest):
-    system_prompt = (
-        "You are a learning difficulty analyzer. Your ONLY job is to analyze the provided roadmap data "
-        "and determine its overall difficulty level.\n\n"
-        "STRICT RULES:\n"
-        "- You MUST respond with EXACTLY ONE WORD only\n"
-        "- Your response must be one of these three words: Easy, Medium, Hard\n"
-        "- Do NOT include any explanations, punctuation, or additional text\n"
-        "- Do NOT use quotes or any other formatting\n"
-        "- Analyze the complexity, depth, and prerequisites of the topics to determine difficulty\n\n"
-        "Examples of correct responses:\n"
-        "Easy\n"
-        "Medium\n"
-        "Hard\n\n"
-        "Remember: ONLY return the single difficulty word, nothing else."
-    )
+    system_prompt = DIFFICULTY_SYSTEM_PROMPT
     
     user_prompt = f"Analyze this roadmap data and determine its difficulty level:\n\n{str(request.data)}"
     
     try:
-        response = ollama.generate(
-            model="qwen3:1.7b",
+        result = await llm_gateway.generate(
+            model=DIFFICULTY_MODEL,
             prompt=user_prompt,
             system=system_prompt
         )
         
-        print("🧪 RAW Ollama OUTPUT:", response["response"])
+        print("🧪 RAW Ollama OUTPUT:", result.text)
         
         # Extract, clean and validate the response
-        answer = response["response"].strip()
+        answer = result.text.strip()
         
         # Additional validation to ensure we only get valid responses
         valid_responses = ["Easy", "Medium", "Hard"]
@@ -128,6 +179,8 @@ async def get_roadmap_difficulty(request: DifficultyRequest):
         
         return JSONResponse(content={"difficulty": answer})
         
+    except OverloadedError:
+        raise
     except Exception as e:
         print("🔥 Ollama SDK error in roadmap difficulty:", str(e))
         return JSONResponse(content={"error": "Failed to get difficulty"}, status_code=500)
@@ -142,41 +195,7 @@ async def generate_course(request: CourseRequest):
     roadmap_id = request.roadmapId
 
     # 🧠 System prompt (behavior + schema enforcement)
-    system_prompt = (
-        "You are an expert course designer. Respond ONLY with valid JSON matching this schema:\n"
-        "{ "
-        "\"title\": \"Course title\", "
-        "\"description\": \"Course description\", "
-        "\"difficulty\": \"Beginner\" | \"Intermediate\" | \"Advanced\", "
-        "\"estimatedDuration\": \"Estimated total time to complete (e.g. '6 hours')\", "
-        "\"learningObjectives\": [\"What learners will gain\"], "
-        "\"prerequisites\": [\"What learners should know before starting\"], "
-        "\"sections\": ["
-        "{ \"name\": \"Section title\", \"content\": \"Detailed explanation or lesson\", \"duration\": \"X hours\" }"
-        "], "
-        "\"resources\": { "
-        "\"videos\": ["
-        "{ \"title\": \"Video title\", \"url\": \"https://example.com\", \"duration\": \"X minutes\" }"
-        "], "
-        "\"articles\": ["
-        "{ \"title\": \"Article title\", \"url\": \"https://example.com\", \"readTime\": \"X minutes\" }"
-        "], "
-        "\"tools\": ["
-        "{ \"name\": \"Tool name\", \"description\": \"What the tool is for\", \"url\": \"https://example.com\" }"
-        "]"
-        "}, "
-        "\"projects\": ["
-        "{ "
-        "\"title\": \"Project title\", "
-        "\"description\": \"Project details\", "
-        "\"difficulty\": \"Beginner\" | \"Intermediate\" | \"Advanced\", "
-        "\"estimatedTime\": \"Time to complete (e.g. '3 hours')\""
-        "}"
-        "] "
-        "} "
-        "Respond ONLY with a valid JSON object. No introductions. No explanations. No markdown. "
-        "Your output MUST start with '{' and end with '}'. If you do not know something, use an empty string (\"\")."
-    )
+    system_prompt = COURSE_SYSTEM_PROMPT
 
     # 🗣️ User prompt (actual request)
     user_prompt = (
@@ -188,19 +207,31 @@ async def generate_course(request: CourseRequest):
     )
 
     try:
-        response = ollama.generate(
-            model="gemma:2b",
+        result = await llm_gateway.generate(
+            model=COURSE_MODEL,
             prompt=user_prompt,
             system=system_prompt,
-            format="json"  # 🧠 THIS forces structured JSON output
+            format=COURSE_FORMAT,  # 🧠 THIS forces output matching the GeneratedCourse schema
+            # Identical course requests in flight share one generation (results are not cached)
+            coalesce=True
         )
 
-        print("🧪 RAW Ollama OUTPUT:", response["response"])
-
-        data = response["response"]
-        # Optional: validate against your schema
+        print("🧪 RAW Ollama OUTPUT:", result.text)
+
+        data = result.text
+        # Parse and validate for the parse statistics; the text is returned as before
+        record = parse_stats.start("course")
+        try:
+            validate(GeneratedCourse, parse_json(data, record))
+        except json.JSONDecodeError as e:
+            print("⚠️  Generated course is not valid JSON:", e)
+        except ValidationError as e:
+            record.failed("validation_failures")
+            print("⚠️  Generated course does not match the schema:", e.error_count(), "errors")
         return data
 
+    except OverloadedError:
+        raise
     except Exception as e:
         print("🔥 Ollama SDK error:", e)
         raise HTTPException(status_code=500, detail=str(e))
@@ -211,11 +242,11 @@ async def get_res(request: Request):
     data = await request.json()
     text = data.get('input', '')
 
-    response = ollama.generate(
+    result = await llm_gateway.generate(
         model='tinyllama:1.1b',
         prompt=text
     )
 
-    print(f"Response: {response['response']}")
+    print(f"Response: {result.text}")
 
-    return JSONResponse(content={"response": response['response']})
\ No newline at end of file
+    return JSONResponse(content={"response": result.text})
\ No newline at end of file
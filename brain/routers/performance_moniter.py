@@ -5,6 +5,13 @@ import asyncio
 from datetime import datetime
 from typing import Dict, Any
 import threading
+from routers import gemini_ai
+from utils import llm_gateway
+from utils.output_schema import parse_stats
+from utils.question_bank import question_bank
+from utils.semantic_cache import semantic_cache
+from utils.pregeneration import pipeline
+from utils.system_metrics import get_memory_metrics
 
 router = APIRouter()
 class PerformanceMonitor:
@@ -17,7 +24,6 @@ class PerformanceMonitor:
     def get_system_metrics(self) -> Dict[str, Any]:
         # CPU and Memory
         cpu_percent = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
         disk = psutil.disk_usage('/')
         
         # Network statistics
@@ -30,12 +36,7 @@ class PerformanceMonitor:
             "uptime_seconds": time.time() - self.start_time,
             "system": {
                 "cpu_percent": cpu_percent,
-                "memory": {
-                    "total_gb": round(memory.total / (1024**3), 2),
-                    "used_gb": round(memory.used / (1024**3), 2),
-                    "available_gb": round(memory.available / (1024**3), 2),
-                    "percent": memory.percent
-                },
+                "memory": get_memory_metrics(),
                 "disk": {
                     "total_gb": round(disk.total / (1024**3), 2),
                     "used_gb": round(disk.used / (1024**3), 2),
@@ -85,6 +86,18 @@ async def get_performance_metrics():
     """Endpoint for your admin panel to poll"""
     return monitor.get_system_metrics()
 
+@router.get("/llm/metrics")
+async def get_llm_metrics():
+    """LLM gateway metrics (response cache, coalescing, admission, batching, pre-generation, parsing, question bank, semantic cache)"""
+    return {
+        **llm_gateway.get_stats(),
+        "description_batching": gemini_ai.description_batcher.get_stats(),
+        "pregeneration": pipeline.get_stats(),
+        "parsing": parse_stats.get_stats(),
+        "question_bank": question_bank.get_stats(),
+        "semantic_cache": semantic_cache.get_stats()
+    }
+
 @router.post("/ai/inference")
 async def simulate_ai_inference():
     """Example AI endpoint with performance tracking"""
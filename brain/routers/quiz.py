@@ -1,9 +1,16 @@
 import uuid
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
 from pydantic import BaseModel, Field, ValidationError
-from typing import Literal, List
-import ollama
+from typing import Literal, List, Optional
 import json
+import time
+from fastapi.responses import StreamingResponse
+from utils import llm_cache, llm_gateway
+from utils.admission import OverloadedError
+from utils.json_stream import JsonArrayStreamParser
+from utils.output_schema import ParseRecord, json_schema, parse_json, parse_stats, validate
+from utils.prefix_cache import prefix_cache
+from utils.question_bank import question_bank
 
 router = APIRouter()
 
@@ -20,18 +27,15 @@ class QuestionItem(BaseModel):
     id: str
     question: str
     options: List[str] = Field(..., min_items=4, max_items=4)
-    correctAnswer: int  # 0, 1, 2, or 3
+    correctAnswer: int = Field(..., ge=0, le=3)  # 0, 1, 2, or 3
     explanation: str
 
 class QuestionResponse(BaseModel):
     questions: List[QuestionItem]
 
 
-# === Route ===
-@router.post("/questions/generate", response_model=QuestionResponse)
-async def generate_response(request: QuestionRequest):
-    print(request)
-    system_prompt = """
+# === Prompts ===
+QUIZ_SYSTEM_PROMPT = """
         You are an expert quiz generator. Your task is to generate a quiz in a strict JSON format.
         Return a JSON object with a single key: "questions", which contains an array of question objects.   
         EXAMPLE OUTPUT:
@@ -51,70 +55,224 @@ async def generate_response(request: QuestionRequest):
         - Each question needs: id, question, options (4 items), correctAnswer (0-3), explanation
         - No markdown or extra text""".strip()
 
-    user_prompt = (
-        f"Create {request.questionCount} {request.difficulty}-level multiple-choice questions about '{request.title}'.\n"
+QUIZ_MODEL = "gemma:2b"
+QUIZ_OPTIONS = {
+    "temperature": 0.7, 
+    "num_ctx": 5000,
+    "num_predict": 3500  # Add this - allows up to 2000 output tokens
+}
+# Decoding is constrained to the QuestionResponse schema
+QUIZ_FORMAT = json_schema(QuestionResponse)
+prefix_cache.register("quiz", QUIZ_MODEL, QUIZ_SYSTEM_PROMPT, {"num_ctx": QUIZ_OPTIONS["num_ctx"]})
+
+
+def _build_user_prompt(request: QuestionRequest, count: Optional[int] = None, avoid: Optional[List[dict]] = None) -> str:
+    """`count` overrides the requested number; `avoid` are questions the quiz already contains"""
+    prompt = (
+        f"Create {count or request.questionCount} {request.difficulty}-level multiple-choice questions about '{request.title}'.\n"
         f"Context: {request.description}\n"
+    )
+    if avoid:
+        prompt += "Do not repeat any of these questions:\n" + "".join(f"- {q['question']}\n" for q in avoid)
+    return prompt + (
         f"IMPORTANT: Each question must have exactly 4 answer options.\n"
         f"Return only the JSON object with the 'questions' array."
     )
 
+
+def _fix_question(q: dict, i: int, record: Optional[ParseRecord] = None) -> dict:
+    """Fix a malformed question in place before Pydantic validation"""
+    # Ensure unique IDs
+    if not q.get("id") or q.get("id") in ["unique-uuid-here", "q1", "q2", "q3", "q4", "q5"]:
+        q["id"] = f"q_{i+1}_{uuid.uuid4().hex[:8]}"
+
+    # Fix options - ensure exactly 4 options
+    options = q.get("options", [])
+    if len(options) < 4:
+        print(f"Warning: Question {i+1} has only {len(options)} options, padding to 4")
+        if record:
+            record.repaired("options_padded")
+        # Pad with generic options
+        while len(options) < 4:
+            options.append(f"Option {chr(65 + len(options))}")
+        q["options"] = options
+    elif len(options) > 4:
+        print(f"Warning: Question {i+1} has {len(options)} options, trimming to 4")
+        if record:
+            record.repaired("options_trimmed")
+        q["options"] = options[:4]
+
+    # Fix correctAnswer if it's out of range
+    correct_idx = q.get("correctAnswer", 0)
+    if correct_idx >= len(q["options"]) or correct_idx < 0:
+        print(f"Warning: Question {i+1} correctAnswer {correct_idx} is out of range, setting to 0")
+        if record:
+            record.repaired("answer_reset")
+        q["correctAnswer"] = 0
+
+    return q
+
+
+# === Route ===
+@router.post("/questions/generate", response_model=QuestionResponse)
+async def generate_response(request: QuestionRequest, cache_control: Optional[str] = Header(default=None)):
+    print(request)
+    use_cache = llm_cache.cache_allowed(cache_control)
+
+    # Questions already in the bank are served as-is; only the shortfall is generated
+    stock = await question_bank.take(request.title, request.difficulty, request.questionCount) if use_cache else []
+    if len(stock) >= request.questionCount:
+        return QuestionResponse(questions=stock)
+
+    system_prompt = QUIZ_SYSTEM_PROMPT
+    user_prompt = _build_user_prompt(request, request.questionCount - len(stock), stock)
+
+    result = None
+    record = None
     try:
-        response = ollama.generate(
-            model="gemma:2b",
+        result = await llm_gateway.generate(
+            model=QUIZ_MODEL,
             prompt=user_prompt,
             system=system_prompt,
-            options={
-                "temperature": 0.7, 
-                "num_ctx": 5000,
-                "num_predict": 3500  # Add this - allows up to 2000 output tokens
-            },
-            format="json",
+            options=QUIZ_OPTIONS,
+            format=QUIZ_FORMAT,
+            # A cached shortfall would repeat questions that are already in stock
+            cache=use_cache and not stock,
         )
         
-        raw_output = response["response"].strip()
+        raw_output = result.text.strip()
         print("RAW RESPONSE:", raw_output)
+        record = parse_stats.start("quiz")
 
         # Parse JSON
-        parsed = json.loads(raw_output)
+        parsed = parse_json(raw_output, record)
         
         # Fix malformed questions before Pydantic validation
         for i, q in enumerate(parsed.get("questions", [])):
-            # Ensure unique IDs
-            if not q.get("id") or q.get("id") in ["unique-uuid-here", "q1", "q2", "q3", "q4", "q5"]:
-                q["id"] = f"q_{i+1}_{uuid.uuid4().hex[:8]}"
-            
-            # Fix options - ensure exactly 4 options
-            options = q.get("options", [])
-            if len(options) < 4:
-                print(f"Warning: Question {i+1} has only {len(options)} options, padding to 4")
-                # Pad with generic options
-                while len(options) < 4:
-                    options.append(f"Option {chr(65 + len(options))}")
-                q["options"] = options
-            elif len(options) > 4:
-                print(f"Warning: Question {i+1} has {len(options)} options, trimming to 4")
-                q["options"] = options[:4]
-            
-            # Fix correctAnswer if it's out of range
-            correct_idx = q.get("correctAnswer", 0)
-            if correct_idx >= len(q["options"]) or correct_idx < 0:
-                print(f"Warning: Question {i+1} correctAnswer {correct_idx} is out of range, setting to 0")
-                q["correctAnswer"] = 0
+            _fix_question(q, i, record)
 
         # Validate against Pydantic model
-        validated = QuestionResponse.model_validate(parsed)
+        validated = validate(QuestionResponse, parsed)
 
-        return validated
+        generated = [q.model_dump() for q in validated.questions[:request.questionCount - len(stock)]]
+        added = await question_bank.add(request.title, request.difficulty, generated)
+        if not stock:
+            return validated
+        # Topped-up stock: drop generated repeats of stocked questions
+        return QuestionResponse(questions=stock + added)
 
     except json.JSONDecodeError as e:
+        await llm_gateway.invalidate(result)
         raise HTTPException(
             status_code=500,
             detail=f"AI response was not valid JSON: {str(e)}"
         )
     except ValidationError as e:
+        if record:
+            record.failed("validation_failures")
+        await llm_gateway.invalidate(result)
         raise HTTPException(
             status_code=500,
             detail=f"AI response did not match expected structure: {e.errors()}"
         )
+    except OverloadedError:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/questions/generate/stream")
+async def generate_response_stream(request: QuestionRequest, cache_control: Optional[str] = Header(default=None)):
+    """
+    Stream questions as NDJSON, one {"type": "question"} line per validated question.
+
+    Questions in stock in the question bank are emitted first; only the
+    shortfall is generated. Each generated question is fixed and validated as
+    soon as its object closes, so a malformed or truncated question only costs
+    that item; a {"type": "done"} line reports how many were emitted, how many
+    came from the bank, and how many were skipped.
+    """
+    started = time.perf_counter()
+    stock = []
+    if llm_cache.cache_allowed(cache_control):
+        stock = await question_bank.take(request.title, request.difficulty, request.questionCount)
+    shortfall = request.questionCount - len(stock)
+
+    chunks, first_chunk = None, ""
+    if shortfall > 0:
+        chunks = llm_gateway.stream(
+            model=QUIZ_MODEL,
+            prompt=_build_user_prompt(request, shortfall, stock),
+            system=QUIZ_SYSTEM_PROMPT,
+            options=QUIZ_OPTIONS,
+            format=QUIZ_FORMAT,
+        )
+
+        # Wait for the first chunk so admission and connection errors are still HTTP errors
+        try:
+            first_chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            pass
+        except OverloadedError:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        parser = JsonArrayStreamParser(keys=["questions"])
+        record = parse_stats.start("quiz_stream") if chunks else None
+        emitted, skipped = 0, 0
+        first_question_ms = None
+
+        for question in stock:
+            emitted += 1
+            if first_question_ms is None:
+                first_question_ms = round((time.perf_counter() - started) * 1000, 2)
+            yield json.dumps({"type": "question", "data": question}) + "\n"
+
+        async def all_chunks():
+            if chunks is None:
+                return
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+
+        try:
+            async for chunk in all_chunks():
+                for _, item in parser.feed(chunk):
+                    if emitted >= request.questionCount:
+                        continue
+                    try:
+                        question = validate(QuestionItem, _fix_question(item, emitted, record))
+                    except (ValidationError, TypeError, AttributeError) as e:
+                        skipped += 1
+                        record.failed("validation_failures")
+                        print(f"Warning: Skipping invalid streamed question: {e}")
+                        continue
+                    # Stored as it arrives; after stocked questions, a repeat of one is dropped
+                    added = await question_bank.add(request.title, request.difficulty, [question.model_dump()])
+                    if stock and not added:
+                        skipped += 1
+                        continue
+                    emitted += 1
+                    if first_question_ms is None:
+                        first_question_ms = round((time.perf_counter() - started) * 1000, 2)
+                    yield json.dumps({"type": "question", "data": question.model_dump()}) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+        if parser.skipped:
+            record.failed("parse_failures")
+
+        yield json.dumps({
+            "type": "done",
+            "questions": emitted,
+            "from_bank": len(stock),
+            "skipped": skipped + parser.skipped,
+            "first_question_ms": first_question_ms,
+            "total_ms": round((time.perf_counter() - started) * 1000, 2)
+        }) + "\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-AI-Model": QUIZ_MODEL}
+    )
@@ -1,9 +1,16 @@
+import hashlib
 import json
 import re
+from collections import deque
 from typing import Dict, List, Any, Optional, Literal
 from pydantic import BaseModel
-from fastapi import APIRouter, HTTPException
-import ollama
+from fastapi import APIRouter, Header, HTTPException
+from utils import llm_cache, llm_gateway
+from utils.admission import OverloadedError
+from utils.health import health_registry
+from utils.output_schema import ParseRecord, parse_json, parse_stats, wrapped_list_schema
+from utils.pregeneration import PregenerationTask, content_store, pipeline
+from utils.question_bank import question_bank
 
 router = APIRouter()
 
@@ -65,30 +72,39 @@ class InterviewQuestionRequest(BaseModel):
     title: str
     nodes: List[RoadmapNode]
 
+class PregenerateRequest(BaseModel):
+    roadmapId: Optional[str] = None
+    title: Optional[str] = None
+    difficulty: Literal['easy', 'medium', 'hard'] = 'medium'
+    nodes: List[Dict[str, Any]]
+    edges: List[Dict[str, Any]] = []
+
+CONTENT_MODEL = "qwen3:1.7b"
+CONTENT_NODE_TYPES = ('project', 'quiz', 'course', 'concept')
+
+# Decoding is constrained to {"items": [...]} of the node type's item model
+CONTENT_ITEM_MODELS = {
+    'project': ProjectTask,
+    'quiz': QuizQuestion,
+    'course': CourseModule,
+    'concept': ConceptPoint
+}
+
+# Questions served per quiz node when it is assembled from the question bank
+QUIZ_NODE_QUESTIONS = 6
+
 @router.post("/api/generate", response_model=AIGenerationResponse)
-async def generate_content(data: AIGenerationRequest):
+async def generate_content(data: AIGenerationRequest, cache_control: Optional[str] = Header(default=None)):
+    use_cache = llm_cache.cache_allowed(cache_control)
     try:
-        system_prompt = (
-            "You are an expert educational content creator. Generate structured learning content "
-            "that is engaging, practical, and pedagogically sound. Always return valid JSON array format."
-        )
-        
-        prompt = _build_detailed_prompt(data)
-        
-        response = ollama.generate(
-            model="qwen3:1.7b",
-            prompt=prompt,
-            system=system_prompt,
-            options={
-                "temperature": 0.6,
-                "top_p": 0.9,
-                "max_tokens": 2000
-            },
-            format="json"
-        )
-        print("RAW Response from OLLAMA: " + response['response'])
-        
-        content = _parse_ollama_response(response['response'], data.nodeType)
+        # Quiz nodes are drawn from the question bank per request rather than stored whole
+        if use_cache and not (data.nodeType == 'quiz' and question_bank.enabled):
+            # Content pre-generated in the background is served immediately
+            stored = await content_store.get(_content_key(data))
+            if stored is not None:
+                return AIGenerationResponse(success=True, content=stored["content"], nodeType=data.nodeType)
+
+        content = await _generate_node_content(data, use_cache)
         
         return AIGenerationResponse(
             success=True,
@@ -96,6 +112,8 @@ async def generate_content(data: AIGenerationRequest):
             nodeType=data.nodeType
         )
         
+    except OverloadedError:
+        raise
     except Exception as e:
         print(f"Error generating content: {e}")
         fallback_content = _generate_fallback_content(data)
@@ -106,7 +124,155 @@ async def generate_content(data: AIGenerationRequest):
             error=str(e)
         )
 
-def _build_detailed_prompt(data: AIGenerationRequest) -> str:
+@router.post("/api/pregenerate")
+async def pregenerate_content(request: PregenerateRequest):
+    """Queue low-priority background generation of content for a roadmap's nodes"""
+    job_id = schedule_pregeneration(
+        request.nodes, request.edges, request.difficulty, request.title, request.roadmapId
+    )
+    return pipeline.progress(job_id)
+
+@router.get("/api/pregenerate/{roadmap_id}")
+async def get_pregeneration_progress(roadmap_id: str):
+    """Per-node pre-generation status, so the UI can show which nodes are ready"""
+    progress = pipeline.progress(roadmap_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail=f"No pre-generation job for roadmap '{roadmap_id}'")
+    return progress
+
+def schedule_pregeneration(
+    nodes: List[Dict[str, Any]],
+    edges: List[Dict[str, Any]],
+    difficulty: str = "medium",
+    learning_path: Optional[str] = None,
+    roadmap_id: Optional[str] = None
+) -> str:
+    """Queue content generation for every content node, in graph order; returns the job id"""
+    tasks = []
+    for node in _graph_order(nodes, edges):
+        if node.get("type") not in CONTENT_NODE_TYPES:
+            continue
+        # Quiz nodes are assembled from the question bank per request; stored content would never be served
+        if node.get("type") == 'quiz' and question_bank.enabled:
+            continue
+        node_data = node.get("data") or {}
+        request = AIGenerationRequest(
+            nodeType=node["type"],
+            nodeLabel=node_data.get("label", ""),
+            nodeDescription=node_data.get("description", ""),
+            difficulty=difficulty,
+            learningPath=learning_path
+        )
+        tasks.append(PregenerationTask(
+            str(node.get("id")), request.nodeType, request.nodeLabel,
+            lambda request=request: _pregenerate_node(request)
+        ))
+    return pipeline.submit(tasks, roadmap_id)
+
+async def _pregenerate_node(data: AIGenerationRequest):
+    key = _content_key(data)
+    if await content_store.get(key) is not None:
+        return
+    content = await _generate_node_content(data, use_cache=llm_cache.CACHE_ENABLED, strict=True, background=True)
+    await content_store.set(key, {"content": content})
+
+async def _generate_node_content(
+    data: AIGenerationRequest, use_cache: bool, strict: bool = False, background: bool = False
+) -> List[Dict[str, Any]]:
+    stock = []
+    if data.nodeType == 'quiz' and use_cache:
+        # Stocked questions are served as-is; only the shortfall is generated
+        stock = await question_bank.take(data.nodeLabel, data.difficulty, QUIZ_NODE_QUESTIONS)
+        if len(stock) >= QUIZ_NODE_QUESTIONS:
+            return _number_questions(stock)
+
+    system_prompt = (
+        "You are an expert educational content creator. Generate structured learning content "
+        "that is engaging, practical, and pedagogically sound. Always return valid JSON array format."
+    )
+    
+    if stock:
+        prompt = _build_detailed_prompt(data, QUIZ_NODE_QUESTIONS - len(stock), stock)
+    else:
+        prompt = _build_detailed_prompt(data)
+    
+    result = await llm_gateway.generate(
+        model=CONTENT_MODEL,
+        prompt=prompt,
+        system=system_prompt,
+        options={
+            "temperature": 0.6,
+            "top_p": 0.9,
+            "max_tokens": 2000
+        },
+        format=wrapped_list_schema(CONTENT_ITEM_MODELS[data.nodeType]),
+        # A cached shortfall would repeat questions that are already in stock
+        cache=use_cache and not stock,
+        background=background
+    )
+    print("RAW Response from OLLAMA: " + result.text)
+    
+    record = parse_stats.start(f"content_{data.nodeType}")
+    content = _parse_ollama_response(result.text, data.nodeType, strict, record)
+    if data.nodeType != 'quiz':
+        return content
+
+    added = await question_bank.add(data.nodeLabel, data.difficulty, content)
+    if not stock:
+        return content
+    # Topped-up stock: drop generated repeats of stocked questions
+    return _number_questions(stock + added)
+
+def _number_questions(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Quiz node questions use sequential ids, whatever their ids in the question bank"""
+    return [{**question, "id": str(i + 1)} for i, question in enumerate(questions)]
+
+def _content_key(data: AIGenerationRequest) -> str:
+    """Key for stored node content; the learning path is context only and not part of it"""
+    payload = json.dumps([
+        data.nodeType,
+        data.nodeLabel.strip().lower(),
+        data.nodeDescription.strip(),
+        data.difficulty
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _graph_order(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Nodes in learning order: topological from the roots, then anything left in list order"""
+    by_id = {str(n.get("id")): n for n in nodes}
+    outgoing = {node_id: [] for node_id in by_id}
+    incoming = {node_id: 0 for node_id in by_id}
+    for edge in edges:
+        source, target = str(edge.get("source")), str(edge.get("target"))
+        if source in by_id and target in by_id:
+            outgoing[source].append(target)
+            incoming[target] += 1
+
+    queue = deque(node_id for node_id in by_id if incoming[node_id] == 0)
+    ordered, seen = [], set()
+    while queue:
+        node_id = queue.popleft()
+        if node_id in seen:
+            continue
+        seen.add(node_id)
+        ordered.append(by_id[node_id])
+        for target in outgoing[node_id]:
+            incoming[target] -= 1
+            if incoming[target] == 0:
+                queue.append(target)
+
+    # Nodes on cycles never reach in-degree zero
+    ordered.extend(by_id[node_id] for node_id in by_id if node_id not in seen)
+    return ordered
+
+def _build_detailed_prompt(
+    data: AIGenerationRequest, question_count: Optional[int] = None, avoid: Optional[List[Dict[str, Any]]] = None
+) -> str:
+    """`question_count` and `avoid` (questions the quiz already has) only apply to quiz nodes"""
+    avoid_info = ""
+    if avoid:
+        avoid_info = "\nDo not repeat any of these questions:\n" + "".join(f"- {q['question']}\n" for q in avoid)
+
     base_info = f"""
 Content Details:
 - Label: {data.nodeLabel}
@@ -134,7 +300,7 @@ Focus on practical, real-world application appropriate for {data.difficulty} lev
 
 Create a knowledge quiz for "{data.nodeLabel}".
 
-Generate 5-8 multiple choice questions that test understanding at {data.difficulty} level. Each question should have:
+Generate {question_count or '5-8'} multiple choice questions that test understanding at {data.difficulty} level. Each question should have:
 - Clear, specific question text
 - 4 plausible answer options
 - Correct answer index (0-3)
@@ -143,7 +309,7 @@ Generate 5-8 multiple choice questions that test understanding at {data.difficul
 Return ONLY a JSON array with objects containing exactly these fields:
 {{"id": "1", "question": "Question text?", "options": ["Option A", "Option B", "Option C", "Option D"], "correctAnswer": 0, "explanation": "Explanation text"}}
 
-Mix conceptual understanding and practical application questions.""",
+Mix conceptual understanding and practical application questions.{avoid_info}""",
 
         'course': f"""{base_info}
 
@@ -177,18 +343,13 @@ Focus on building deep understanding progressively."""
     
     return prompts.get(data.nodeType, f"Generate {data.nodeType} content for {data.nodeLabel}")
 
-def _parse_ollama_response(response: str, node_type: str) -> List[Dict[str, Any]]:
-    """Parse and validate Ollama response"""
+def _parse_ollama_response(
+    response: str, node_type: str, strict: bool = False, record: Optional[ParseRecord] = None
+) -> List[Dict[str, Any]]:
+    """Parse and validate Ollama response (with `strict`, raise instead of returning placeholder content)"""
     try:
-        cleaned = response.strip()
-        if cleaned.startswith("```json"):
-            cleaned = cleaned[7:]
-        if cleaned.endswith("```"):
-            cleaned = cleaned[:-3]
-        cleaned = cleaned.strip()
-        
-        # Try parsing as JSON
-        parsed = json.loads(cleaned)
+        # Parse as JSON (fences stripped and repaired only if needed)
+        parsed = parse_json(response, record)
         
         # If response is a dict with a single key containing an array, extract the array
         if isinstance(parsed, dict) and len(parsed) == 1:
@@ -199,17 +360,26 @@ def _parse_ollama_response(response: str, node_type: str) -> List[Dict[str, Any]
             raise ValueError("Response is neither a list nor an object containing an array")
         
         # Validate structure
-        return _validate_content_structure(parsed, node_type)
+        return _validate_content_structure(parsed, node_type, record)
         
     except (json.JSONDecodeError, ValueError, AttributeError) as e:
+        if record and not isinstance(e, json.JSONDecodeError):
+            record.failed("invalid_format")
         print(f"Failed to parse Ollama response: {e}")
         print(f"Raw response: {response}")
+        if strict:
+            raise
         return [{"id": "1", "title": "Generated Content", "description": "Content generation failed", "completed": False}]
 
-def _validate_content_structure(content: List[Dict[str, Any]], node_type: str) -> List[Dict[str, Any]]:
+def _validate_content_structure(
+    content: List[Dict[str, Any]], node_type: str, record: Optional[ParseRecord] = None
+) -> List[Dict[str, Any]]:
     """Validate and fix content structure"""
     if not isinstance(content, list):
+        if record:
+            record.failed("invalid_format")
         return [{"id": "1", "error": "Invalid content format"}]
+    fixes = 0
     
     required_fields = {
         'project': ['id', 'title', 'description', 'completed'],
@@ -224,6 +394,7 @@ def _validate_content_structure(content: List[Dict[str, Any]], node_type: str) -
     for i, item in enumerate(content):
         if not isinstance(item, dict):
             content[i] = {"id": str(i + 1), "title": "Invalid Item", "description": "Invalid content format", "completed": False}
+            fixes += 1
             continue
             
         # Ensure ID exists
@@ -233,6 +404,8 @@ def _validate_content_structure(content: List[Dict[str, Any]], node_type: str) -
         # Add missing fields with defaults
         for field in expected:
             if field not in item:
+                # `completed` is optional in the schema; defaulting it is not a repair
+                fixes += field != 'completed'
                 if field == 'completed':
                     item[field] = False
                 elif field == 'correctAnswer':
@@ -242,6 +415,8 @@ def _validate_content_structure(content: List[Dict[str, Any]], node_type: str) -
                 else:
                     item[field] = f"Generated {field}"
     
+    if record:
+        record.repaired("field_fixes", fixes)
     return content
 
 def _generate_fallback_content(data: AIGenerationRequest) -> List[Dict[str, Any]]:
@@ -341,7 +516,7 @@ async def generate_questions(request: InterviewQuestionRequest):
             "Each question should be clear, relevant, and suitable for an interview. "
             "Return ONLY the questions in plain text, separated by newlines."
         )
-        response = ollama.generate(
+        result = await llm_gateway.generate(
             model="gemma3:270m",
             prompt=prompt,
             system=system_prompt,
@@ -352,33 +527,44 @@ async def generate_questions(request: InterviewQuestionRequest):
             },
             think=False
         )
-        questions_text = response['response'].strip()
+        questions_text = result.text.strip()
         print("Ollama Response Questions: " + questions_text)
         # Optionally, split into list if you want to process further
         # questions_list = [q.strip() for q in questions_text.split('\n') if q.strip()]
         # You can add the questions to the request object if needed
         return questions_text
+    except OverloadedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate interview questions: {str(e)}")
 
 
 @router.get("/api/ollama/health")
 async def check_ollama_health():
-    try:
-        models = ollama.list()
-        return {
-            "status": "healthy",
-            "available_models": [model['name'] for model in models['models']]
-        }
-    except Exception as e:
-        raise HTTPException(status_code=503, detail=f"Ollama unavailable: {str(e)}")
+    """Cached Ollama health (models are listed by a background probe, not per call)"""
+    check = health_registry.get("ollama")
+    if check.current_status == "unhealthy":
+        raise HTTPException(status_code=503, detail=f"Ollama unavailable: {check.error}")
+    return {
+        "status": check.current_status,
+        "available_models": check.details.get("available_models", []),
+        "checked_at": check.checked_at,
+        "age_seconds": check.age_seconds
+    }
 
 @router.get("/api/ollama/models")
 async def list_ollama_models():
     try:
-        models = ollama.list()
+        models = await llm_gateway.list_models()
         return {
             "models": models['models']
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to list models: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to list models: {str(e)}")
+
+
+async def _probe_ollama() -> Dict[str, Any]:
+    models = await llm_gateway.list_models()
+    return {"available_models": [model.get('name') or model.get('model') for model in models['models']]}
+
+health_registry.register("ollama", _probe_ollama, interval=30)
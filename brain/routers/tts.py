@@ -1,15 +1,19 @@
-import uuid
-import os
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from pydantic import BaseModel
 import asyncio
 import edge_tts
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
 import logging
-from typing import Optional
-import tempfile
+from functools import partial
 from pathlib import Path
-import threading
+from typing import Optional, Union
+from utils.audio_cache import AUDIO_CACHE_ENABLED, CLIENT_CACHE_CONTROL, audio_cache, audio_key, etag_matches
+from utils.cache_control import cache_policy
+from utils.health import PROBE_TIMEOUT, health_registry
+from utils.piper_engine import FALLBACK as PIPER_FALLBACK, piper_engine
+from utils.tts_engine import (
+    DEFAULT_ENGINE, PIPELINE_MIN_CHARS, TTSError, TTSTimeoutError, prepare_text, synthesize, synthesize_segments, tts_stats
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -32,9 +36,6 @@ VOICES = {
     }
 }
 
-# Global lock to prevent concurrent audio generation
-audio_lock = threading.Lock()
-
 class SpeechRequest(BaseModel):
     text: str
     lang: str = "en"
@@ -42,6 +43,9 @@ class SpeechRequest(BaseModel):
     rate: Optional[str] = None
     volume: Optional[str] = None
     pitch: Optional[str] = None
+    pipeline: Optional[bool] = None  # synthesize sentence by sentence; default: for long texts
+    engine: Optional[str] = None  # "edge" or "piper" (local); default: TTS_ENGINE
+    audio_format: str = "wav"  # Piper only: "wav" or raw "pcm"
 
 class VoiceListResponse(BaseModel):
     voices: dict
@@ -52,7 +56,12 @@ async def get_voices():
     return VoiceListResponse(voices=VOICES)
 
 @router.post("/speak")
-async def speak(data: SpeechRequest, background_tasks: BackgroundTasks):
+async def speak(
+    data: SpeechRequest,
+    request: Request,
+    cache_control: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None)
+):
     """Convert text to speech using high-quality Andrew Neural voice"""
     
     # Input validation
@@ -62,195 +71,274 @@ async def speak(data: SpeechRequest, background_tasks: BackgroundTasks):
     if len(data.text) > 10000:  # Increased limit for longer conversations
         raise HTTPException(status_code=400, detail="Text too long (max 10000 characters)")
     
-    # Prevent concurrent audio generation
-    with audio_lock:
-        # Get high-quality male voice configuration
-        lang_voices = VOICES.get(data.lang, VOICES["en"])
-        voice = lang_voices.get(data.voice_type, lang_voices["default"])
-        
-        # Create temporary file
-        temp_dir = tempfile.gettempdir()
-        output_file = os.path.join(temp_dir, f"speech_{uuid.uuid4()}.mp3")
-        
+    engine = (data.engine or DEFAULT_ENGINE).lower()
+    if engine not in ("edge", "piper"):
+        raise HTTPException(status_code=400, detail="Unknown engine (use 'edge' or 'piper')")
+    if data.audio_format not in ("wav", "pcm"):
+        raise HTTPException(status_code=400, detail="Unknown audio format (use 'wav' or 'pcm')")
+
+    # Clean and preprocess text
+    clean_text = prepare_text(data.text)
+    settings = {"rate": data.rate, "volume": data.volume, "pitch": data.pitch}
+
+    # Local synthesis with Piper
+    if engine == "piper":
+        if not piper_engine.available():
+            raise HTTPException(status_code=503, detail="Piper backend is not available")
+        return await _piper_response(clean_text, settings, data.audio_format)
+
+    # Get high-quality male voice configuration
+    lang_voices = VOICES.get(data.lang, VOICES["en"])
+    voice = lang_voices.get(data.voice_type, lang_voices["default"])
+
+    logger.info(f"Generating speech with Andrew Neural voice: {voice}")
+    logger.info(f"Text: '{data.text[:100]}...'")
+
+    # Audio already synthesized with these exact settings is served from the cache
+    allowed = cache_policy(cache_control, AUDIO_CACHE_ENABLED)
+    key = audio_key(clean_text, voice, **settings)
+    if allowed["read"]:
+        cached = await audio_cache.lookup(key)
+        if cached is not None:
+            logger.info(f"Serving cached speech {key[:12]}")
+            return _audio_response(request, key, cached, if_none_match, voice)
+
+    # Wait for the first audio chunk so synthesis errors are still HTTP errors
+    # (and a voice problem can still fall back to another voice)
+    # Long texts are synthesized in sentence segments so audio starts after the first one
+    pipelined = data.pipeline if data.pipeline is not None else len(clean_text) > PIPELINE_MIN_CHARS
+    quality = "high"
+    try:
+        chunks, first_chunk = await _start_speech(clean_text, voice, settings, allowed["write"], pipelined)
+    except TTSTimeoutError:
+        logger.error("TTS generation timed out")
+        if _offline_fallback_allowed(data):
+            return await _piper_response(clean_text, settings, data.audio_format, quality="offline-fallback")
+        raise HTTPException(
+            status_code=408,
+            detail="Text-to-speech generation timed out. Text might be too long."
+        )
+    except Exception as e:
+        logger.error(f"TTS generation failed: {e}")
+
+        # Try with fallback voice if the error might be voice-related
         try:
-            logger.info(f"Generating speech with Andrew Neural voice: {voice}")
-            logger.info(f"Text: '{data.text[:100]}...'")
-            
-            # Clean and preprocess text
-            clean_text = data.text.strip()
-            
-            # Add natural pauses and punctuation for better speech
-            if not clean_text.endswith(('.', '!', '?')):
-                clean_text += '.'
-            
-            # Replace common abbreviations for better pronunciation
-            clean_text = clean_text.replace("JS", "JavaScript")
-            clean_text = clean_text.replace("API", "A P I")
-            clean_text = clean_text.replace("HTML", "H T M L")
-            clean_text = clean_text.replace("CSS", "C S S")
-            clean_text = clean_text.replace("DOM", "D O M")
-            
-            # Use Edge TTS with Andrew Neural voice
-            communicate = edge_tts.Communicate(clean_text, voice)
-            
-            # Generate speech with extended timeout for longer text
-            await asyncio.wait_for(communicate.save(output_file), timeout=60.0)
-            
-            # Verify file was created and has content
-            if not os.path.exists(output_file):
-                raise Exception("Failed to generate audio file")
-            
-            file_size = os.path.getsize(output_file)
-            if file_size == 0:
-                raise Exception("Generated audio file is empty")
-            
-            logger.info(f"Successfully generated audio: {file_size} bytes")
-            
-            # Read file content into memory for streaming
-            with open(output_file, "rb") as f:
-                audio_content = f.read()
-            
-            # Cleanup function
-            def cleanup():
-                try:
-                    if os.path.exists(output_file):
-                        os.remove(output_file)
-                        logger.info(f"Cleaned up: {output_file}")
-                except Exception as e:
-                    logger.error(f"Cleanup error: {e}")
-            
-            # Schedule cleanup
-            background_tasks.add_task(cleanup)
-            
-            # Return streaming response
-            from io import BytesIO
-            return StreamingResponse(
-                BytesIO(audio_content),
-                media_type="audio/mpeg",
-                headers={
-                    "Content-Disposition": "inline; filename=speech.mp3",
-                    "Content-Length": str(len(audio_content)),
-                    "Cache-Control": "no-cache",
-                    "X-Voice-Used": voice,
-                    "X-Audio-Quality": "high"
-                }
-            )
-            
-        except asyncio.TimeoutError:
-            logger.error("TTS generation timed out")
-            if os.path.exists(output_file):
-                try:
-                    os.remove(output_file)
-                except:
-                    pass
-            raise HTTPException(
-                status_code=408,
-                detail="Text-to-speech generation timed out. Text might be too long."
+            if not ("voice" in str(e).lower() or "neural" in str(e).lower()):
+                raise e
+            logger.info("Trying with fallback Davis voice...")
+            voice, quality = "en-US-DavisNeural", "fallback"
+            chunks, first_chunk = await _start_speech(
+                clean_text, voice, settings, allowed["write"], pipelined, timeout=45.0
             )
-            
+        except Exception as fallback_error:
+            if fallback_error is not e:
+                logger.error(f"Fallback voice also failed: {fallback_error}")
+            # edge-tts is unreachable or failing: speak locally instead
+            if _offline_fallback_allowed(data):
+                return await _piper_response(clean_text, settings, data.audio_format, quality="offline-fallback")
+            raise HTTPException(status_code=500, detail=f"Text-to-speech generation failed: {str(e)}")
+
+    async def audio_stream():
+        yield first_chunk
+        try:
+            async for chunk in chunks:
+                yield chunk
         except Exception as e:
-            logger.error(f"TTS generation failed: {e}")
-            
-            # Cleanup on error
-            if os.path.exists(output_file):
-                try:
-                    os.remove(output_file)
-                except:
-                    pass
-            
-            # Try with fallback voice if the error might be voice-related
-            if "voice" in str(e).lower() or "neural" in str(e).lower():
-                try:
-                    logger.info("Trying with fallback Davis voice...")
-                    fallback_voice = "en-US-DavisNeural"
-                    communicate = edge_tts.Communicate(clean_text, fallback_voice)
-                    await asyncio.wait_for(communicate.save(output_file), timeout=45.0)
-                    
-                    if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
-                        with open(output_file, "rb") as f:
-                            audio_content = f.read()
-                        
-                        background_tasks.add_task(lambda: os.remove(output_file) if os.path.exists(output_file) else None)
-                        
-                        from io import BytesIO
-                        return StreamingResponse(
-                            BytesIO(audio_content),
-                            media_type="audio/mpeg",
-                            headers={
-                                "Content-Disposition": "inline; filename=speech.mp3",
-                                "Content-Length": str(len(audio_content)),
-                                "Cache-Control": "no-cache",
-                                "X-Voice-Used": fallback_voice,
-                                "X-Audio-Quality": "fallback"
-                            }
-                        )
-                except Exception as fallback_error:
-                    logger.error(f"Fallback voice also failed: {fallback_error}")
-            
-            raise HTTPException(
-                status_code=500,
-                detail=f"Text-to-speech generation failed: {str(e)}"
-            )
+            # Headers are sent; the client gets the audio synthesized so far
+            logger.error(f"TTS stream with {voice} failed mid-way: {e}")
+        finally:
+            # Leaves the shared synthesis; one whose audio is not stored is then
+            # cancelled (freeing its voice slot) if no other request follows it
+            await chunks.aclose()
 
-@router.get("/health")
-async def health_check():
-    """Health check with Andrew Neural voice testing"""
+    # Audio is forwarded as edge-tts produces it, so the length is not known up front
+    return StreamingResponse(
+        audio_stream(),
+        media_type="audio/mpeg",
+        headers={
+            "Content-Disposition": "inline; filename=speech.mp3",
+            "Cache-Control": "no-cache",
+            # The same tag a cache hit carries, so the client can revalidate this audio
+            "ETag": f'"{audio_key(clean_text, voice, **settings)}"',
+            "X-Voice-Used": voice,
+            "X-Audio-Quality": quality,
+            "X-Audio-Cache": "miss",
+            "X-TTS-Engine": "edge",
+            "X-TTS-Mode": "pipelined" if pipelined else "single"
+        }
+    )
+
+@router.get("/audio/{key}", name="cached_audio")
+async def cached_audio(key: str, request: Request, if_none_match: Optional[str] = Header(default=None)):
+    """Previously synthesized speech by its key (the ETag of /speak responses); cacheable by clients"""
+    cached = await audio_cache.lookup(key) if len(key) == 64 and key.isalnum() else None
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Audio not in cache; request it from /tts/speak")
+    return _audio_response(request, key, cached, if_none_match)
+
+@router.get("/metrics")
+async def tts_metrics():
+    """Synthesis counters, time to first audio and per-voice concurrency"""
+    return {**tts_stats.get_stats(), "audio_cache": audio_cache.get_stats(), "piper": piper_engine.get_stats()}
+
+async def _start_speech(
+    text: str, voice: str, settings: dict, store: bool, pipelined: bool, timeout: Optional[float] = None
+):
+    if pipelined:
+        # Segments have their own deadline, so long texts do not run into `timeout`
+        start = partial(synthesize_segments, text, voice, **settings)
+    else:
+        start = partial(synthesize, text, voice, timeout, **settings)
+    # Requests for the same audio share one synthesis
+    chunks = audio_cache.stream(audio_key(text, voice, **settings), start, store=store)
     try:
-        test_text = "Health check test with Andrew Neural voice."
-        temp_file = os.path.join(tempfile.gettempdir(), f"health_test_{uuid.uuid4()}.mp3")
-        
-        # Test Andrew Neural voice
-        andrew_voice_working = False
+        return chunks, await chunks.__anext__()
+    except StopAsyncIteration:
+        raise TTSError(f"Speech synthesis with '{voice}' returned no audio")
+
+def _offline_fallback_allowed(data: SpeechRequest) -> bool:
+    # The Piper voice is English; a client that asked for edge-tts explicitly gets its error
+    return PIPER_FALLBACK and data.engine is None and data.lang == "en" and piper_engine.available()
+
+async def _piper_response(text: str, settings: dict, audio_format: str, quality: str = "offline") -> StreamingResponse:
+    """Stream Piper audio segment by segment (not cached: the audio cache holds edge-tts MP3)"""
+    chunks = piper_engine.synthesize(text, settings["rate"], settings["volume"], wav=audio_format == "wav")
+    try:
+        first_chunk = await chunks.__anext__()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Piper synthesis failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Text-to-speech generation failed: {str(e)}")
+
+    async def audio_stream():
+        yield first_chunk
         try:
-            communicate = edge_tts.Communicate(test_text, VOICES["en"]["andrew"])
-            await asyncio.wait_for(communicate.save(temp_file), timeout=15.0)
-            
-            if os.path.exists(temp_file) and os.path.getsize(temp_file) > 0:
-                andrew_voice_working = True
-                os.remove(temp_file)
-                logger.info("Andrew Neural voice working perfectly")
+            async for chunk in chunks:
+                yield chunk
         except Exception as e:
-            logger.warning(f"Andrew Neural voice health check failed: {e}")
-        
-        # Test fallback voice if Andrew fails
-        fallback_working = False
-        if not andrew_voice_working:
-            try:
-                communicate = edge_tts.Communicate(test_text, VOICES["en"]["davis"])
-                await asyncio.wait_for(communicate.save(temp_file), timeout=15.0)
-                
-                if os.path.exists(temp_file) and os.path.getsize(temp_file) > 0:
-                    fallback_working = True
-                    os.remove(temp_file)
-            except Exception as e:
-                logger.warning(f"Fallback voice health check failed: {e}")
-        
-        # Cleanup any remaining test files
-        for file in Path(tempfile.gettempdir()).glob("health_test_*.mp3"):
-            try:
-                file.unlink()
-            except:
-                pass
-        
-        status = "healthy" if (andrew_voice_working or fallback_working) else "unhealthy"
-        
-        return {
-            "status": status,
-            "service": "TTS Service",
-            "version": "2.0.0",
-            "primary_voice": {
-                "name": "en-US-AndrewNeural",
-                "status": "working" if andrew_voice_working else "failed"
-            },
-            "fallback_voice": {
-                "name": "en-US-DavisNeural", 
-                "status": "working" if fallback_working else "failed"
-            },
-            "available_languages": list(VOICES.keys()),
-            "available_voices": VOICES,
-            "temp_dir": tempfile.gettempdir()
-        }
-        
+            logger.error(f"Piper stream failed mid-way: {e}")
+        finally:
+            # Stops synthesizing ahead when the client disconnects
+            await chunks.aclose()
+
+    headers = {
+        "Content-Disposition": f"inline; filename=speech.{audio_format}",
+        "Cache-Control": "no-cache",
+        "X-Voice-Used": piper_engine.voice_name,
+        "X-Audio-Quality": quality,
+        "X-TTS-Engine": "piper"
+    }
+    if audio_format == "pcm":
+        # Raw little-endian 16-bit mono samples
+        headers["X-Sample-Rate"] = str(piper_engine.sample_rate)
+        headers["X-Sample-Format"] = "s16le"
+        headers["X-Channels"] = "1"
+    return StreamingResponse(
+        audio_stream(),
+        media_type="audio/wav" if audio_format == "wav" else "audio/pcm",
+        headers=headers
+    )
+
+def _audio_response(
+    request: Request,
+    key: str,
+    audio: Union[bytes, Path],
+    if_none_match: Optional[str],
+    voice: Optional[str] = None
+) -> Response:
+    headers = {
+        "ETag": f'"{key}"',
+        "Cache-Control": CLIENT_CACHE_CONTROL,
+        "Content-Location": request.url_for("cached_audio", key=key).path,
+        "X-Audio-Cache": "hit"
+    }
+    if voice:
+        headers["X-Voice-Used"] = voice
+    if etag_matches(if_none_match, key):
+        return Response(status_code=304, headers=headers)
+    if isinstance(audio, Path):
+        return FileResponse(
+            audio,
+            media_type="audio/mpeg",
+            filename="speech.mp3",
+            content_disposition_type="inline",
+            headers=headers
+        )
+    headers["Content-Disposition"] = "inline; filename=speech.mp3"
+    return Response(content=audio, media_type="audio/mpeg", headers=headers)
+
+@router.get("/health")
+async def health_check():
+    """Cached TTS health (edge-tts voices are probed in the background, not per call)"""
+    edge = health_registry.get("edge_tts")
+    voices = edge.details.get("voices", {})
+    return {
+        "status": edge.current_status,
+        "service": "TTS Service",
+        "version": "2.0.0",
+        "primary_voice": {
+            "name": "en-US-AndrewNeural",
+            "status": voices.get("en-US-AndrewNeural", "unknown")
+        },
+        "fallback_voice": {
+            "name": "en-US-DavisNeural",
+            "status": voices.get("en-US-DavisNeural", "unknown")
+        },
+        "error": edge.error,
+        "checked_at": edge.checked_at,
+        "age_seconds": edge.age_seconds,
+        "piper": health_registry.get("piper").snapshot() if "piper" in health_registry.checks else None,
+        "available_languages": list(VOICES.keys()),
+        "available_voices": VOICES,
+        "synthesis": tts_stats.get_stats()
+    }
+
+async def _probe_edge_tts() -> dict:
+    """Andrew Neural voice, and the Davis fallback only when Andrew fails"""
+    test_text = "Health check test with Andrew Neural voice."
+    voices = {VOICES["en"]["andrew"]: "failed", VOICES["en"]["davis"]: "untested"}
+    if await _voice_works(test_text, VOICES["en"]["andrew"]):
+        voices[VOICES["en"]["andrew"]] = "working"
+        return {"voices": voices}
+    if await _voice_works(test_text, VOICES["en"]["davis"]):
+        voices[VOICES["en"]["davis"]] = "working"
+        return {"status": "degraded", "voices": voices}
+    raise TTSError("Neither the Andrew nor the Davis voice produced audio")
+
+async def _probe_piper() -> dict:
+    ready = await piper_engine.ping()
+    if ready is None:
+        # Workers start with the first request (PIPER_PRELOAD=false, or after a crash)
+        return {"voice": piper_engine.voice_name, "workers": "not started"}
+    return {"voice": piper_engine.voice_name, "workers_ready": ready}
+
+async def _voice_works(text: str, voice: str) -> bool:
+    """
+    True once the voice has produced its first audio chunk. Talks to edge-tts
+    directly: a probe takes no voice slot and stays out of the TTS stats.
+    """
+    messages = edge_tts.Communicate(text, voice).stream()
+
+    async def first_audio() -> bool:
+        async for message in messages:
+            if message["type"] == "audio":
+                return True
+        return False
+
+    try:
+        # Andrew and then Davis must both fit in one probe's timeout
+        if await asyncio.wait_for(first_audio(), timeout=PROBE_TIMEOUT / 2):
+            return True
+        logger.warning(f"{voice} health check returned no audio")
+        return False
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
\ No newline at end of file
+        logger.warning(f"{voice} health check failed: {str(e) or type(e).__name__}")
+        return False
+    finally:
+        await messages.aclose()
+
+# Each probe synthesizes audio, so the voices are checked every few minutes at most
+health_registry.register("edge_tts", _probe_edge_tts, interval=300)
+if piper_engine.available():
+    health_registry.register("piper", _probe_piper, interval=60)
@@ -1,52 +1,98 @@
-from fastapi import APIRouter
-from duckduckgo_search import DDGS
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import json
+import time
+from typing import Optional
+from fastapi import APIRouter, Header, Response
+from fastapi.responses import StreamingResponse
+from utils.cache_control import cache_policy
+from utils.page_fetcher import SEARCH_DEADLINE, fetch_pages, fetch_pages_as_completed, fetch_stats
+from utils.web_cache import WEB_CACHE_ENABLED, web_cache
+from utils.web_search import search_results
 
 router = APIRouter()
 
-# Scraper function to extract full content from a URL
-def fetch_full_content(url):
-    try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        res = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(res.text, 'html.parser')
-
-        # Extract meta title
-        title = soup.title.string.strip() if soup.title else "No title"
-
-        # Extract first 10 paragraphs (skip empty ones)
-        paragraphs = [p.get_text(strip=True) for p in soup.find_all('p')]
-        paragraphs = [p for p in paragraphs if p]  # remove empty
-        content = "\n".join(paragraphs[:10]) if paragraphs else "No readable content."
-
-        return {
-            "scraped_title": title,
-            "content": content
-        }
-    except Exception as e:
-        return {
-            "scraped_title": "Error fetching content",
-            "content": str(e)
-        }
-
 # Final API endpoint with search + scraping
 @router.get("/api/search")
-async def getResult(query: str, max_results: int = 5):
-    final_results = []
-    with DDGS() as ddgs:
-        results = ddgs.text(query)
-
-        for r in list(results)[:max_results]:
-            if not r.get("href"): continue
-
-            scraped = fetch_full_content(r["href"])
-            final_results.append({
-                "title": r.get("title", "No title"),
-                "snippet": r.get("body", "No snippet"),
-                "link": r.get("href", "No link"),
-                "scraped_title": scraped["scraped_title"],
-                "full_content": scraped["content"]
-            })
+async def getResult(
+    query: str, response: Response, max_results: int = 5, cache_control: Optional[str] = Header(default=None)
+):
+    """
+    Search and scrape the result pages concurrently. Pages not fetched within
+    WEB_SEARCH_DEADLINE_SECONDS of the request come back with "partial": true
+    and empty content; X-Partial-Results counts them.
+
+    Searches and pages are cached; `Cache-Control: no-cache` searches again
+    and revalidates cached pages, `no-store` bypasses the cache.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SEARCH_DEADLINE
+    cache = cache_policy(cache_control, WEB_CACHE_ENABLED)
+
+    # DDGS is synchronous; keep it off the event loop
+    results = await asyncio.to_thread(search_results, query, max_results, cache["read"], cache["write"])
+    pages = await fetch_pages([r["href"] for r in results], deadline, cache["read"], cache["write"])
 
+    final_results = [{**_result_fields(r), **_content_fields(scraped)} for r, scraped in zip(results, pages)]
+    response.headers["X-Partial-Results"] = str(sum(r["partial"] for r in final_results))
     return final_results
+
+@router.get("/api/search/stream")
+async def getResultStream(query: str, max_results: int = 5, cache_control: Optional[str] = Header(default=None)):
+    """
+    Stream search results as NDJSON. A {"type": "result"} line with the title,
+    snippet and link of every result is sent as soon as the search returns,
+    then one {"type": "content"} line per result, in the order its page
+    finishes scraping, and a final {"type": "done"} summary. Lines carry the
+    result's position in "index". Deadline and caching work as in /api/search.
+    """
+    started = time.perf_counter()
+    deadline = asyncio.get_running_loop().time() + SEARCH_DEADLINE
+    cache = cache_policy(cache_control, WEB_CACHE_ENABLED)
+
+    # Search before streaming so search failures are still HTTP errors
+    results = await asyncio.to_thread(search_results, query, max_results, cache["read"], cache["write"])
+
+    async def event_stream():
+        for index, r in enumerate(results):
+            yield json.dumps({"type": "result", "index": index, "data": _result_fields(r)}) + "\n"
+
+        partial = 0
+        first_content_ms = None
+        pages = fetch_pages_as_completed([r["href"] for r in results], deadline, cache["read"], cache["write"])
+        async for index, scraped in pages:
+            content = _content_fields(scraped)
+            partial += content["partial"]
+            if first_content_ms is None:
+                first_content_ms = round((time.perf_counter() - started) * 1000, 2)
+            yield json.dumps({"type": "content", "index": index, "data": content}) + "\n"
+
+        yield json.dumps({
+            "type": "done",
+            "results": len(results),
+            "partial": partial,
+            "first_content_ms": first_content_ms,
+            "total_ms": round((time.perf_counter() - started) * 1000, 2)
+        }) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+@router.get("/api/metrics")
+async def get_search_metrics():
+    """Page fetch counters (ok, errors, pages that missed the deadline) and cache hit ratios"""
+    return {"fetch": fetch_stats.get_stats(), "cache": web_cache.get_stats()}
+
+def _result_fields(r: dict) -> dict:
+    return {
+        "title": r.get("title", "No title"),
+        "snippet": r.get("body", "No snippet"),
+        "link": r.get("href", "No link")
+    }
+
+def _content_fields(scraped: dict) -> dict:
+    return {
+        "scraped_title": scraped["scraped_title"],
+        "full_content": scraped["content"],
+        "partial": scraped["status"] == "partial",
+        "cache": scraped["cache"],
+        "fetch_ms": scraped["fetch_ms"]
+    }
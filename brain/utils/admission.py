@@ -0,0 +1,97 @@
+# utils/admission.py
+"""
+Admission control for LLM generations.
+
+Every generation needs a slot for its model and a slot on the backend (the
+local Ollama server). Both are handed out by the model residency scheduler in
+`utils.model_scheduler`, which queues callers per model and prefers models
+already in memory. Each model's queue is bounded; once it is full, or the wait
+exceeds its deadline, the request is rejected immediately so clients can back
+off instead of hanging.
+
+Configuration (environment):
+    LLM_BACKEND_SLOTS        concurrent generations on the Ollama server (default 4)
+    LLM_MODEL_SLOTS          default concurrent generations per model (default 1)
+    LLM_MODEL_SLOTS_OVERRIDE per-model slots, e.g. "gemma:2b=2,qwen3:1.7b=2"
+    LLM_QUEUE_LIMIT          waiting requests allowed per model (default 16)
+    LLM_QUEUE_TIMEOUT_SECONDS maximum time spent waiting for a slot (default 30)
+    PREGENERATION_RESERVED_SLOTS backend slots background work leaves free (default 1)
+"""
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from utils.model_scheduler import ModelScheduler
+
+logger = logging.getLogger(__name__)
+
+BACKEND_SLOTS = int(os.getenv("LLM_BACKEND_SLOTS", "4"))
+MODEL_SLOTS = int(os.getenv("LLM_MODEL_SLOTS", "1"))
+QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "16"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+BACKGROUND_RESERVED_SLOTS = int(os.getenv("PREGENERATION_RESERVED_SLOTS", "1"))
+
+
+def _parse_overrides(value: str) -> Dict[str, int]:
+    overrides = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, slots = item.rsplit("=", 1)
+        try:
+            overrides[name.strip()] = int(slots)
+        except ValueError:
+            logger.warning(f"Ignoring invalid LLM_MODEL_SLOTS_OVERRIDE entry: {item!r}")
+    return overrides
+
+
+MODEL_SLOTS_OVERRIDE = _parse_overrides(os.getenv("LLM_MODEL_SLOTS_OVERRIDE", ""))
+
+
+class OverloadedError(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint."""
+
+    def __init__(self, message: str, retry_after: int, status_code: int = 503):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class AdmissionController:
+    """Admission to the backend's model scheduler, which also enforces the model slots."""
+
+    def __init__(self, backend: str = "ollama"):
+        self.backend = ModelScheduler(
+            f"{backend} backend",
+            BACKEND_SLOTS,
+            QUEUE_LIMIT,
+            QUEUE_TIMEOUT_SECONDS,
+            model_slots=MODEL_SLOTS,
+            model_slots_override=MODEL_SLOTS_OVERRIDE,
+            background_reserved=BACKGROUND_RESERVED_SLOTS,
+        )
+
+    @asynccontextmanager
+    async def slot(self, model: str, background: bool = False):
+        """
+        Hold a model slot and a backend slot for the duration of the block.
+        `background` work is admitted at low priority (see `ModelScheduler.acquire`).
+        """
+        await self.backend.acquire(model, background)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.backend.release(model, time.perf_counter() - started)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.get_stats(),
+            "models": self.backend.model_stats(),
+        }
+
+
+# Global admission controller for the local Ollama server
+admission = AdmissionController()
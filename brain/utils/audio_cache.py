@@ -0,0 +1,287 @@
+# utils/audio_cache.py
+"""
+Content-addressed cache of synthesized speech.
+
+Interview questions, canned prompts and section intros are spoken again and
+again with the same settings, so audio is keyed on a hash of everything that
+determines it: the text after `prepare_text` (whitespace-normalized), the
+voice and the rate / volume / pitch. The key doubles as the ETag, and cached
+audio never changes under its key, so clients and proxies may keep it.
+
+Audio lives in a byte-bounded in-process LRU in front of a directory of MP3
+files (also byte-bounded, least recently used evicted first). Concurrent
+requests for a key that is being synthesized join that synthesis instead of
+starting their own: `stream` runs one synthesis per key, every request reads
+the same chunks as they arrive, and the complete audio is stored at the end.
+The synthesis finishes (and is cached) even if the requests that started it
+go away, except when its audio is not to be stored (`no-store`): then it is
+cancelled as soon as the last request following it leaves.
+
+Configuration (environment):
+    TTS_AUDIO_CACHE_ENABLED        cache synthesized audio (default true)
+    TTS_AUDIO_CACHE_MEMORY_BYTES   audio kept in memory (default 64 MiB)
+    TTS_AUDIO_CACHE_DISK_BYTES     audio kept on disk (default 1 GiB)
+    TTS_AUDIO_CACHE_DIR            directory of the files (default <BRAIN_CACHE_DIR>/tts_audio)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from functools import partial
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+
+from utils.llm_cache import CACHE_DIR
+from utils.tts_engine import prosody
+
+logger = logging.getLogger(__name__)
+
+AUDIO_CACHE_ENABLED = os.getenv("TTS_AUDIO_CACHE_ENABLED", "true").lower() == "true"
+MEMORY_MAX_BYTES = int(os.getenv("TTS_AUDIO_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+DISK_MAX_BYTES = int(os.getenv("TTS_AUDIO_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
+AUDIO_DIR = Path(os.getenv("TTS_AUDIO_CACHE_DIR", CACHE_DIR / "tts_audio"))
+
+# Audio under a key never changes, so clients may keep it for good
+CLIENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def audio_key(
+    text: str,
+    voice: str,
+    rate: Optional[str] = None,
+    volume: Optional[str] = None,
+    pitch: Optional[str] = None,
+) -> str:
+    """Stable hash of the prepared text and every voice setting."""
+    payload = json.dumps(
+        [" ".join(text.split()), voice, prosody(rate, volume, pitch)],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], key: str) -> bool:
+    tags = {tag.strip().removeprefix("W/") for tag in (if_none_match or "").split(",")}
+    return f'"{key}"' in tags or "*" in tags
+
+
+class _Synthesis:
+    """One in-flight synthesis whose chunks any number of readers follow."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+        # Called when the last reader leaves before the synthesis is done
+        self.on_abandoned: Optional[Callable[[], Any]] = None
+        self._changed = asyncio.Condition()
+
+    async def run(self, chunks: AsyncIterator[bytes]):
+        try:
+            async for chunk in chunks:
+                self.chunks.append(chunk)
+                await self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            await self._notify()
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[bytes]:
+        position = 0
+        self.followers += 1
+        try:
+            while True:
+                if position < len(self.chunks):
+                    position += 1
+                    yield self.chunks[position - 1]
+                elif self.error is not None:
+                    raise self.error
+                elif self.done:
+                    return
+                else:
+                    async with self._changed:
+                        await self._changed.wait_for(lambda: position < len(self.chunks) or self.done)
+        finally:
+            self.followers -= 1
+            if not self.followers and not self.done and self.on_abandoned is not None:
+                self.on_abandoned()
+
+
+class AudioCache:
+    def __init__(self, directory: Path = AUDIO_DIR, memory_max_bytes: int = MEMORY_MAX_BYTES,
+                 disk_max_bytes: int = DISK_MAX_BYTES):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: Optional["OrderedDict[str, int]"] = None  # key -> size, least recent first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Synthesis] = {}
+        self._tasks: set = set()
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "joined": 0,
+            "abandoned": 0,
+            "stored": 0,
+            "evicted": 0,
+            "errors": 0,
+        }
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.mp3"
+
+    def _load_disk(self):
+        """Index the files already on disk, oldest access first (caller holds the lock)."""
+        if self._disk is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.directory.glob("*.mp3"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path.stem, stat.st_size))
+        self._disk = OrderedDict((key, size) for _, key, size in sorted(files))
+        self._disk_bytes = sum(self._disk.values())
+
+    # -------- Lookups (blocking; called through asyncio.to_thread) --------
+
+    def get(self, key: str) -> Union[bytes, Path, None]:
+        """The cached audio: bytes from memory, a file path from disk, or None."""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return audio
+            self._load_disk()
+            if key not in self._disk:
+                self.counters["misses"] += 1
+                return None
+            path = self._path(key)
+            try:
+                os.utime(path)  # the file's mtime is its last access across restarts
+            except OSError:
+                self._disk_bytes -= self._disk.pop(key)
+                self.counters["misses"] += 1
+                return None
+            self._disk.move_to_end(key)
+            self.counters["disk_hits"] += 1
+            return path
+
+    def put(self, key: str, audio: bytes):
+        with self._lock:
+            self._remember(key, audio)
+            self._load_disk()
+            if key in self._disk or len(audio) > self.disk_max_bytes:
+                return
+        path = self._path(key)
+        partial = path.with_name(f".{key}.{uuid.uuid4().hex}.tmp")
+        partial.write_bytes(audio)
+        os.replace(partial, path)
+        with self._lock:
+            if key in self._disk:
+                return
+            self._disk[key] = len(audio)
+            self._disk_bytes += len(audio)
+            self.counters["stored"] += 1
+            while self._disk_bytes > self.disk_max_bytes:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self.counters["evicted"] += 1
+                try:
+                    self._path(old_key).unlink()
+                except OSError:
+                    pass
+
+    def _remember(self, key: str, audio: bytes):
+        if key in self._memory or len(audio) > self.memory_max_bytes // 4:
+            return
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+
+    async def lookup(self, key: str) -> Union[bytes, Path, None]:
+        if not AUDIO_CACHE_ENABLED:
+            return None
+        try:
+            return await asyncio.to_thread(self.get, key)
+        except OSError as e:
+            logger.warning(f"Audio cache lookup failed: {e}")
+            return None
+
+    # -------- Synthesis --------
+
+    def stream(self, key: str, synthesize: Callable[[], AsyncIterator[bytes]], store: bool = True) -> AsyncIterator[bytes]:
+        """
+        Audio chunks for `key` as they are synthesized. Joins the synthesis
+        already running for the key, or starts `synthesize()` in the
+        background; the complete audio is cached unless `store` is off, in
+        which case the synthesis is cancelled once nobody follows it.
+        """
+        job = self._inflight.get(key)
+        if job is None:
+            job = _Synthesis()
+            self._inflight[key] = job
+            task = asyncio.create_task(self._run(key, job, synthesize(), store))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            if not store:
+                job.on_abandoned = partial(self._abandon, task)
+        else:
+            self.counters["joined"] += 1
+        return job.follow()
+
+    def _abandon(self, task: asyncio.Task):
+        # Cancelling closes the synthesis generator, which frees its voice slot
+        # and stops any segments synthesized ahead
+        self.counters["abandoned"] += 1
+        task.cancel()
+
+    async def _run(self, key: str, job: _Synthesis, chunks: AsyncIterator[bytes], store: bool):
+        try:
+            await job.run(chunks)
+        finally:
+            del self._inflight[key]
+        if job.error is None and job.chunks and store and AUDIO_CACHE_ENABLED:
+            try:
+                await asyncio.to_thread(self.put, key, b"".join(job.chunks))
+            except OSError as e:
+                self.counters["errors"] += 1
+                logger.warning(f"Storing synthesized audio failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        c = self.counters
+        lookups = c["memory_hits"] + c["disk_hits"] + c["misses"]
+        return {
+            "enabled": AUDIO_CACHE_ENABLED,
+            **c,
+            "hit_ratio": round((c["memory_hits"] + c["disk_hits"]) / lookups, 3) if lookups else 0.0,
+            "in_flight": len(self._inflight),
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk) if self._disk is not None else None,
+            "disk_bytes": self._disk_bytes if self._disk is not None else None,
+        }
+
+
+# Global audio cache
+audio_cache = AudioCache()
@@ -0,0 +1,22 @@
+# utils/cache_control.py
+"""
+Per-request cache policy from the Cache-Control header.
+
+Shared by the LLM response, semantic, web and audio caches: `no-cache` makes a
+request skip cached results (its own result is still stored), `no-store`
+keeps the cache out of the request altogether.
+"""
+from typing import Dict, Optional
+
+
+def cache_policy(cache_control: Optional[str], enabled: bool = True) -> Dict[str, bool]:
+    """
+    How a request may use a cache: "read" (serve cached results) is off with
+    `no-cache` or `no-store`, "write" (store what is produced) is off with
+    `no-store`. Both are off when the cache is not `enabled`.
+    """
+    directives = {d.strip().lower() for d in (cache_control or "").split(",")}
+    return {
+        "read": enabled and not ({"no-cache", "no-store"} & directives),
+        "write": enabled and "no-store" not in directives,
+    }
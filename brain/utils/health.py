@@ -0,0 +1,186 @@
+# utils/health.py
+"""
+Health registry: dependency probes run in the background, endpoints read the
+cached results.
+
+Each dependency (Ollama, Gemini, edge-tts, ...) registers an async probe with
+an interval. Once `start` is called, every probe runs on its own schedule in
+a background task, under a timeout, and its latest result is kept with the
+time it was taken. Health endpoints return those results (and their age)
+instantly, so load balancer and admin panel polling costs no synthesis,
+quota or model listing.
+
+A probe returns a dict of details (optionally with "status": "degraded") or
+raises when the dependency is down. While a check is failing it is probed
+every HEALTH_RETRY_SECONDS instead of its interval, so recovery shows up
+quickly. A result older than three intervals counts as unknown.
+
+Two views are derived from the results:
+- liveness: the process and its event loop are responsive (no dependencies);
+- readiness: every critical check has been probed and is up. Other checks
+  only make the aggregated status "degraded".
+
+Configuration (environment):
+    HEALTH_<NAME>_INTERVAL_SECONDS  probe interval of check <NAME> (defaults per check)
+    HEALTH_RETRY_SECONDS            probe interval while a check fails (default 30)
+    HEALTH_PROBE_TIMEOUT_SECONDS    timeout of a single probe (default 20)
+    HEALTH_CRITICAL_CHECKS          comma separated checks required for readiness (default "ollama")
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = float(os.getenv("HEALTH_RETRY_SECONDS", "30"))
+PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT_SECONDS", "20"))
+CRITICAL_CHECKS = [c.strip() for c in os.getenv("HEALTH_CRITICAL_CHECKS", "ollama").split(",") if c.strip()]
+
+HEARTBEAT_SECONDS = 1.0
+# Heartbeat older than this: the event loop is blocked
+LIVENESS_MAX_LAG_SECONDS = 10.0
+
+
+class Check:
+    def __init__(self, name: str, probe: Callable[[], Awaitable[Dict[str, Any]]], interval: float):
+        self.name = name
+        self.probe = probe
+        self.interval = float(os.getenv(f"HEALTH_{name.upper()}_INTERVAL_SECONDS", str(interval)))
+        self.critical = name in CRITICAL_CHECKS
+        self.status = "unknown"
+        self.details: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.last_healthy_at: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+        self.consecutive_failures = 0
+        self.probes = 0
+
+    async def run(self):
+        started = time.perf_counter()
+        self.probes += 1
+        try:
+            details = await asyncio.wait_for(self.probe(), timeout=PROBE_TIMEOUT)
+            self.details = details or {}
+            self.status = self.details.pop("status", "healthy")
+            self.error = None
+            if self.consecutive_failures:
+                logger.info(f"Health: {self.name} recovered after {self.consecutive_failures} failed probes")
+            self.consecutive_failures = 0
+            self.last_healthy_at = time.time()
+        except Exception as e:
+            if self.consecutive_failures == 0:
+                logger.warning(f"Health: {self.name} is down: {str(e) or type(e).__name__}")
+            self.status = "unhealthy"
+            self.error = str(e) or type(e).__name__
+            self.consecutive_failures += 1
+        self.checked_at = time.time()
+        self.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    @property
+    def age_seconds(self) -> Optional[float]:
+        return round(time.time() - self.checked_at, 1) if self.checked_at is not None else None
+
+    @property
+    def current_status(self) -> str:
+        """The status, or "unknown" before the first probe and once the result is stale."""
+        if self.checked_at is None or time.time() - self.checked_at > 3 * max(self.interval, RETRY_SECONDS):
+            return "unknown"
+        return self.status
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "status": self.current_status,
+            "critical": self.critical,
+            "details": self.details,
+            "error": self.error,
+            "checked_at": self.checked_at,
+            "age_seconds": self.age_seconds,
+            "last_healthy_at": self.last_healthy_at,
+            "probe_ms": self.duration_ms,
+            "interval_seconds": self.interval,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class HealthRegistry:
+    def __init__(self):
+        self.checks: Dict[str, Check] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._started_at = time.time()
+        self._heartbeat_at: Optional[float] = None
+        self._loop_lag_ms = 0.0
+
+    def register(self, name: str, probe: Callable[[], Awaitable[Dict[str, Any]]], interval: float):
+        """Probe `name` with `probe` every `interval` seconds once started."""
+        self.checks[name] = Check(name, probe, interval)
+
+    def get(self, name: str) -> Check:
+        return self.checks[name]
+
+    async def _probe_loop(self, check: Check):
+        while True:
+            await check.run()
+            await asyncio.sleep(min(check.interval, RETRY_SECONDS) if check.status == "unhealthy" else check.interval)
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + HEARTBEAT_SECONDS
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            self._loop_lag_ms = round(max(0.0, loop.time() - expected) * 1000, 2)
+            self._heartbeat_at = time.time()
+
+    async def start(self):
+        """Start the heartbeat and a probe loop per check (called on startup)."""
+        self._started_at = time.time()
+        self._heartbeat_at = time.time()
+        self._tasks = [asyncio.create_task(self._heartbeat())]
+        self._tasks += [asyncio.create_task(self._probe_loop(check)) for check in self.checks.values()]
+        logger.info(f"Health: probing {', '.join(self.checks)} (critical: {', '.join(CRITICAL_CHECKS) or 'none'})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def liveness(self) -> Dict[str, Any]:
+        heartbeat_age = time.time() - self._heartbeat_at if self._heartbeat_at is not None else None
+        alive = heartbeat_age is None or heartbeat_age < LIVENESS_MAX_LAG_SECONDS
+        return {
+            "status": "alive" if alive else "stalled",
+            "uptime_seconds": round(time.time() - self._started_at, 1),
+            "event_loop_lag_ms": self._loop_lag_ms,
+        }
+
+    def readiness(self) -> Dict[str, Any]:
+        blocking = {
+            name: check.current_status
+            for name, check in self.checks.items()
+            if check.critical and check.current_status not in ("healthy", "degraded")
+        }
+        return {"status": "ready" if not blocking else "not_ready", "blocking": blocking}
+
+    def overall(self) -> Dict[str, Any]:
+        """Aggregated status: unhealthy when not ready, degraded when any check is not healthy."""
+        checks = {name: check.snapshot() for name, check in self.checks.items()}
+        ready = self.readiness()
+        if ready["status"] != "ready":
+            status = "unhealthy"
+        elif any(c["status"] != "healthy" for c in checks.values()):
+            status = "degraded"
+        else:
+            status = "healthy"
+        return {
+            "status": status,
+            "ready": ready["status"] == "ready",
+            "live": self.liveness(),
+            "checks": checks,
+        }
+
+
+# Global health registry
+health_registry = HealthRegistry()
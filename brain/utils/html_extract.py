@@ -0,0 +1,199 @@
+# utils/html_extract.py
+"""
+Bounded, incremental extraction of a page's title and first paragraphs.
+
+The web search routes only need the <title> and the first MAX_PARAGRAPHS
+non-empty <p> elements of a page, so building a full BeautifulSoup tree of a
+multi-megabyte documentation page is wasted download and CPU. `HtmlExtractor`
+is fed the document in chunks as it arrives, keeps no tree, and reports when
+it has everything; the caller stops reading the body there (or at a byte cap).
+
+Two parser backends drive the same collector: the standard library's
+`html.parser` and, when it is installed, lxml (libxml2), which is several
+times faster on large pages. Text follows BeautifulSoup's
+`get_text(strip=True)`: each text node is stripped and the pieces are joined
+without a separator; script and style contents are skipped.
+
+Configuration (environment):
+    WEB_HTML_PARSER   "auto" (lxml when installed), "lxml" or "html.parser" (default auto)
+"""
+import logging
+import os
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+try:
+    from lxml import etree
+except ImportError:  # lxml is optional; html.parser is always available
+    etree = None
+
+logger = logging.getLogger(__name__)
+
+HTML_PARSER = os.getenv("WEB_HTML_PARSER", "auto").lower()
+MAX_PARAGRAPHS = 10
+
+# Opening one of these ends an open <p> (HTML's implied end tag)
+_CLOSES_P = frozenset({
+    "address", "article", "aside", "blockquote", "details", "div", "dl", "fieldset", "figcaption",
+    "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "main", "menu",
+    "nav", "ol", "p", "pre", "section", "table", "ul",
+})
+_SKIPPED = frozenset({"script", "style", "noscript", "template"})
+
+
+class ParagraphCollector:
+    """Parser target collecting the title and the first non-empty paragraphs."""
+
+    def __init__(self, max_paragraphs: int = MAX_PARAGRAPHS):
+        self.max_paragraphs = max_paragraphs
+        self.title: Optional[str] = None
+        self.paragraphs: List[str] = []
+        self._title_parts: Optional[List[str]] = None
+        self._paragraph_parts: Optional[List[str]] = None
+        self._title_done = False
+        self._skip_depth = 0
+        self._text: List[str] = []  # consecutive data of one text node
+
+    @property
+    def done(self) -> bool:
+        return self._title_done and len(self.paragraphs) >= self.max_paragraphs
+
+    def start(self, tag: str, attrs=None):
+        self._flush_text()
+        tag = tag.lower()
+        if tag in _SKIPPED:
+            self._skip_depth += 1
+        elif tag == "title" and not self._title_done:
+            self._title_parts = []
+        elif tag == "body":
+            # No title by the body: the page has none
+            self._finish_title()
+        if tag in _CLOSES_P:
+            self._finish_paragraph()
+        if tag == "p":
+            self._paragraph_parts = []
+
+    def end(self, tag: str):
+        self._flush_text()
+        tag = tag.lower()
+        if tag in _SKIPPED:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "title":
+            self._finish_title()
+        elif tag in ("p", "body", "html") or tag in _CLOSES_P:
+            self._finish_paragraph()
+
+    def data(self, text: str):
+        # Parsers may split one text node into several calls
+        if not self._skip_depth and (self._title_parts is not None or self._paragraph_parts is not None):
+            self._text.append(text)
+
+    def _flush_text(self):
+        if not self._text:
+            return
+        text = "".join(self._text)
+        self._text = []
+        if self._title_parts is not None:
+            self._title_parts.append(text)
+        if self._paragraph_parts is not None and text.strip():
+            self._paragraph_parts.append(text.strip())
+
+    def close(self):
+        self._flush_text()
+        self._finish_title()
+        self._finish_paragraph()
+
+    def _finish_title(self):
+        if self._title_parts is not None:
+            title = "".join(self._title_parts).strip()
+            self.title = title or None
+            self._title_parts = None
+        self._title_done = True
+
+    def _finish_paragraph(self):
+        if self._paragraph_parts is None:
+            return
+        text = "".join(self._paragraph_parts)
+        self._paragraph_parts = None
+        if text and len(self.paragraphs) < self.max_paragraphs:
+            self.paragraphs.append(text)
+
+    def result(self) -> Dict[str, str]:
+        return {
+            "scraped_title": self.title or "No title",
+            "content": "\n".join(self.paragraphs) if self.paragraphs else "No readable content.",
+        }
+
+
+class _StdlibParser(HTMLParser):
+    def __init__(self, target: ParagraphCollector):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.target.start(tag)
+        self.target.end(tag)
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+
+def parser_backend(name: Optional[str] = None) -> str:
+    """The backend that will be used for `name` (or WEB_HTML_PARSER)."""
+    name = (name or HTML_PARSER).lower()
+    if name in ("auto", "lxml"):
+        if etree is not None:
+            return "lxml"
+        if name == "lxml":
+            logger.warning("WEB_HTML_PARSER=lxml but lxml is not installed; using html.parser")
+    return "html.parser"
+
+
+class HtmlExtractor:
+    """
+    Incremental extractor: `feed` chunks of decoded HTML until it returns
+    True (title and enough paragraphs seen), then call `close` for the result.
+    """
+
+    def __init__(self, backend: Optional[str] = None, max_paragraphs: int = MAX_PARAGRAPHS):
+        self.backend = parser_backend(backend)
+        self.collector = ParagraphCollector(max_paragraphs)
+        if self.backend == "lxml":
+            self._parser = etree.HTMLParser(target=self.collector, recover=True, no_network=True)
+        else:
+            self._parser = _StdlibParser(self.collector)
+        self.chars = 0
+
+    @property
+    def done(self) -> bool:
+        return self.collector.done
+
+    def feed(self, text: str) -> bool:
+        if text and not self.collector.done:
+            self.chars += len(text)
+            self._parser.feed(text)
+        return self.collector.done
+
+    def close(self) -> Dict[str, str]:
+        if not self.collector.done:
+            try:
+                self._parser.close()
+            except Exception:
+                pass  # lxml raises on documents it could not recover anything from
+        self.collector.close()
+        return self.collector.result()
+
+
+def extract_content(html: str, backend: Optional[str] = None, chunk_size: int = 65536) -> Dict[str, str]:
+    """Title and first paragraphs of a complete document, reading only as far as needed."""
+    extractor = HtmlExtractor(backend)
+    for start in range(0, len(html), chunk_size):
+        if extractor.feed(html[start:start + chunk_size]):
+            break
+    return extractor.close()
@@ -0,0 +1,110 @@
+# utils/json_stream.py
+"""
+Incremental extraction of objects from JSON arrays while the text is still
+being generated.
+
+The model's output arrives token by token, e.g.
+    {"nodes": [{...}, {...}, ...], "edges": [{...}, ...]}
+`JsonArrayStreamParser` scans each chunk once and returns every object inside
+a top-level array as soon as its closing brace arrives, tagged with the key of
+the array it belongs to. Anything before the first '{' (code fences, chatter)
+is ignored, and a truncated tail only loses the unfinished object.
+"""
+import json
+import logging
+from typing import Any, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class JsonArrayStreamParser:
+    def __init__(self, keys: Optional[Iterable[str]] = None):
+        # Only arrays under these top-level keys are extracted (all when None)
+        self.keys = set(keys) if keys is not None else None
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._array_key: Optional[str] = None
+        self._buffer = ""
+        self._element_start: Optional[int] = None
+        self.started = False
+        self.skipped = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk of text and return the `(key, object)` pairs it completed."""
+        completed = []
+        offset = len(self._buffer)
+        self._buffer += chunk
+
+        for i in range(offset, len(self._buffer)):
+            char = self._buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        # Strings at the top level are candidate keys
+                        self._last_string = self._buffer[self._string_start + 1:i]
+                continue
+
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self._stack.append("{")
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                if char == "[" and len(self._stack) == 1:
+                    self._array_key = self._last_string
+                elif char == "{" and len(self._stack) == 2 and self._tracking():
+                    self._element_start = i
+                self._stack.append(char)
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if char == "}" and len(self._stack) == 2 and self._element_start is not None:
+                    item = self._decode(self._buffer[self._element_start:i + 1])
+                    if item is not None:
+                        completed.append((self._array_key, item))
+                    self._element_start = None
+                elif char == "]" and len(self._stack) == 1:
+                    self._array_key = None
+
+        self._compact()
+        return completed
+
+    def _tracking(self) -> bool:
+        return self._array_key is not None and (self.keys is None or self._array_key in self.keys)
+
+    def _decode(self, text: str) -> Optional[Any]:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            self.skipped += 1
+            logger.warning(f"Skipping malformed streamed object: {e}")
+            return None
+
+    def _compact(self):
+        """Drop text that can no longer be part of an unfinished object."""
+        if self._element_start is not None:
+            keep_from = self._element_start
+        elif self._in_string:
+            keep_from = self._string_start
+        else:
+            keep_from = len(self._buffer)
+        if keep_from:
+            self._buffer = self._buffer[keep_from:]
+            if self._element_start is not None:
+                self._element_start -= keep_from
+            if self._in_string:
+                self._string_start -= keep_from
@@ -0,0 +1,251 @@
+# utils/llm_cache.py
+"""
+Two-tier response cache for LLM generations.
+
+Tier 1 is an in-process LRU with a TTL and an entry limit; tier 2 is a SQLite
+file that survives restarts. Entries are keyed on everything that determines
+the output: model, system prompt, user prompt, options and format.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from utils.cache_control import cache_policy
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("BRAIN_CACHE_DIR", Path(__file__).resolve().parent.parent / ".cache"))
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+MEMORY_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+MEMORY_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 3600)))
+DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "20000"))
+DISK_TTL_SECONDS = float(os.getenv("LLM_CACHE_DISK_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Once over the limit, evict this share of it at once so writes rarely pay for eviction
+DISK_EVICT_FRACTION = 0.05
+
+
+def make_key(
+    model: str,
+    system: Optional[str],
+    prompt: str,
+    options: Optional[Dict[str, Any]] = None,
+    format: Union[str, Dict[str, Any], None] = None,
+) -> str:
+    """Stable hash of every input that influences a generation."""
+    payload = json.dumps(
+        [model, system or "", prompt, options or {}, format or ""],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_allowed(cache_control: Optional[str]) -> bool:
+    """
+    Whether a request may be served from the LLM response cache.
+
+    Clients opt out per request with `Cache-Control: no-cache` (or `no-store`).
+    """
+    return cache_policy(cache_control, CACHE_ENABLED)["read"]
+
+
+class MemoryTier:
+    """Thread-safe LRU dictionary with per-entry expiry."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskTier:
+    """SQLite-backed store; all methods are blocking and run off the event loop."""
+
+    def __init__(self, path: Path, max_entries: int, ttl_seconds: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._rows = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed_at ON llm_cache (accessed_at)")
+            self._rows = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return self._conn
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if row[1] + self.ttl_seconds < now:
+                self._rows -= conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,)).rowcount
+                conn.commit()
+                return None
+            conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return json.loads(row[0])
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            exists = conn.execute("SELECT 1 FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            if not exists:
+                self._rows += 1
+            if self._rows > self.max_entries:
+                # Evict the least recently used rows (indexed), leaving some headroom
+                excess = self._rows - self.max_entries + int(self.max_entries * DISK_EVICT_FRACTION)
+                self._rows -= conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                ).rowcount
+            conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            conn = self._connect()
+            self._rows -= conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,)).rowcount
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+            self._rows = 0
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+class LLMResponseCache:
+    """Memory LRU in front of the disk store, with hit/miss counters."""
+
+    def __init__(self, memory: MemoryTier, disk: DiskTier):
+        self.memory = memory
+        self.disk = disk
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+
+        try:
+            value = await asyncio.to_thread(self.disk.get, key)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM disk cache read failed: {e}")
+            value = None
+
+        if value is not None:
+            self.disk_hits += 1
+            self.memory.set(key, value)
+            return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: dict):
+        self.memory.set(key, value)
+        self.writes += 1
+        try:
+            await asyncio.to_thread(self.disk.set, key, value)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM disk cache write failed: {e}")
+
+    async def delete(self, key: str):
+        self.memory.delete(key)
+        try:
+            await asyncio.to_thread(self.disk.delete, key)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM disk cache delete failed: {e}")
+
+    async def clear(self):
+        self.memory.clear()
+        await asyncio.to_thread(self.disk.clear)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "enabled": CACHE_ENABLED,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_max_entries": self.memory.max_entries,
+        }
+
+
+# Global cache instance
+cache = LLMResponseCache(
+    MemoryTier(MEMORY_MAX_ENTRIES, MEMORY_TTL_SECONDS),
+    DiskTier(CACHE_DIR / "llm_cache.sqlite3", DISK_MAX_ENTRIES, DISK_TTL_SECONDS),
+)
@@ -0,0 +1,363 @@
+# utils/llm_gateway.py
+"""
+Shared, non-blocking gateway for every Ollama generation in the service.
+
+All routers go through `generate()` instead of calling the synchronous
+`ollama.generate`, so a long roadmap generation no longer freezes the event loop.
+A single `ollama.AsyncClient` is reused for the lifetime of the process, which
+keeps the underlying HTTP connections pooled.
+
+Callers that pass `cache=True` are served from the two-tier response cache in
+`utils.llm_cache` when an identical generation has already been produced, and
+their identical generations that are in flight at the same time are coalesced
+into one.
+Every call to Ollama is admitted through `utils.admission`, which bounds the
+number of concurrent generations per model and on the server as a whole, and
+gets a `keep_alive` chosen by the model residency scheduler unless the caller
+sets one. Generations with a system prompt are reported to `utils.prefix_cache`,
+which tracks how much prompt evaluation the reused prefix saved.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+import httpx
+import ollama
+from pydantic import BaseModel
+
+from utils import llm_cache
+from utils.admission import admission
+from utils.prefix_cache import prefix_cache
+from utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
+DEFAULT_TIMEOUT = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+
+
+class LLMError(Exception):
+    """Raised when a generation fails or the Ollama server is unreachable."""
+
+
+class LLMTimeoutError(LLMError):
+    """Raised when a generation exceeds its per-call timeout."""
+
+
+class LLMResult(BaseModel):
+    """Uniform result of a single generation, independent of the client version."""
+    model: str
+    text: str
+    prompt_eval_count: int = 0
+    eval_count: int = 0
+    total_duration_ms: float = 0.0
+    load_duration_ms: float = 0.0
+    prompt_eval_duration_ms: float = 0.0
+    eval_duration_ms: float = 0.0
+    wall_time_ms: float = 0.0
+    done_reason: Optional[str] = None
+    cached: bool = False
+    cache_key: Optional[str] = None
+
+    @property
+    def tokens_per_second(self) -> float:
+        if not self.eval_duration_ms:
+            return 0.0
+        return round(self.eval_count / (self.eval_duration_ms / 1000), 2)
+
+
+_client: Optional[ollama.AsyncClient] = None
+_inflight = SingleFlight("llm")
+
+
+def get_client() -> ollama.AsyncClient:
+    """Return the process-wide async client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = ollama.AsyncClient(
+            host=OLLAMA_HOST,
+            timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    """Close the pooled HTTP connections (called on application shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _ns_to_ms(value: Optional[int]) -> float:
+    return round((value or 0) / 1_000_000, 2)
+
+
+def to_result(model: str, response: Any, wall_time_ms: float = 0.0) -> LLMResult:
+    """Convert an Ollama `GenerateResponse` into an `LLMResult`."""
+    return LLMResult(
+        model=model,
+        text=response["response"] or "",
+        prompt_eval_count=response.get("prompt_eval_count") or 0,
+        eval_count=response.get("eval_count") or 0,
+        total_duration_ms=_ns_to_ms(response.get("total_duration")),
+        load_duration_ms=_ns_to_ms(response.get("load_duration")),
+        prompt_eval_duration_ms=_ns_to_ms(response.get("prompt_eval_duration")),
+        eval_duration_ms=_ns_to_ms(response.get("eval_duration")),
+        wall_time_ms=round(wall_time_ms, 2),
+        done_reason=response.get("done_reason"),
+    )
+
+
+async def _call_ollama(
+    model: str,
+    prompt: str,
+    system: Optional[str],
+    options: Optional[Dict[str, Any]],
+    format: Union[str, Dict[str, Any], None],
+    think: Optional[bool],
+    keep_alive: Union[float, str, None],
+    timeout: Optional[float],
+    background: bool = False,
+) -> LLMResult:
+    async with admission.slot(model, background):
+        started = time.perf_counter()
+        if keep_alive is None:
+            keep_alive = admission.backend.keep_alive_for(model)
+        try:
+            response = await asyncio.wait_for(
+                get_client().generate(
+                    model=model,
+                    prompt=prompt,
+                    system=system,
+                    options=options,
+                    format=format,
+                    think=think,
+                    keep_alive=keep_alive,
+                ),
+                timeout=timeout or DEFAULT_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"Generation with '{model}' timed out after {timeout or DEFAULT_TIMEOUT}s")
+        except (ollama.ResponseError, httpx.HTTPError) as e:
+            raise LLMError(f"Generation with '{model}' failed: {e}") from e
+
+        # Record residency before the slot is released and the next request dispatched
+        result = to_result(model, response, (time.perf_counter() - started) * 1000)
+        admission.backend.record_load(model, result.load_duration_ms)
+
+    logger.info(
+        f"LLM {model}: {result.prompt_eval_count} prompt + {result.eval_count} eval tokens "
+        f"in {result.wall_time_ms}ms (load {result.load_duration_ms}ms)"
+    )
+    return result
+
+
+async def generate(
+    model: str,
+    prompt: str,
+    system: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+    format: Union[str, Dict[str, Any], None] = None,
+    think: Optional[bool] = None,
+    keep_alive: Union[float, str, None] = None,
+    timeout: Optional[float] = None,
+    cache: bool = False,
+    coalesce: Optional[bool] = None,
+    background: bool = False,
+) -> LLMResult:
+    """
+    Run a single non-streaming generation and return an `LLMResult`.
+
+    `timeout` bounds the whole call (queueing inside Ollama included); it
+    defaults to LLM_TIMEOUT_SECONDS. With `cache=True` the result is looked up
+    in, and stored to, the response cache; truncated generations are never stored.
+    With `coalesce=True` concurrent callers with the same cache key share one
+    generation. It defaults to `cache`: a caller that opted out of cached
+    results (no-cache, or sampling for varied output) gets its own generation.
+    `background` work (pre-generation) is admitted at low priority and never
+    coalesced, so no interactive caller ends up waiting on its queue.
+    """
+    key = llm_cache.make_key(model, system, prompt, options, format)
+
+    if cache:
+        hit = await llm_cache.cache.get(key)
+        if hit is not None:
+            return LLMResult(**{**hit, "cached": True, "cache_key": key})
+
+    async def produce() -> LLMResult:
+        result = await _call_ollama(model, prompt, system, options, format, think, keep_alive, timeout, background)
+        prefix_cache.observe(model, system, prompt, result)
+        if cache and result.done_reason != "length":
+            await llm_cache.cache.set(key, result.model_dump(exclude={"cached", "cache_key"}))
+        return result
+
+    if coalesce is None:
+        coalesce = cache
+    if coalesce and not background:
+        result = await _inflight.do(key, produce)
+    else:
+        result = await produce()
+
+    # Waiters share one result object, so hand each caller its own copy
+    return result.model_copy(update={"cache_key": key})
+
+
+async def stream(
+    model: str,
+    prompt: str,
+    system: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+    format: Union[str, Dict[str, Any], None] = None,
+    think: Optional[bool] = None,
+    keep_alive: Union[float, str, None] = None,
+    timeout: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """
+    Stream a generation as text chunks.
+
+    Holds an admission slot for the whole stream; `timeout` is a deadline for
+    the complete generation, not for each chunk. Streams bypass the response
+    cache and single-flight coalescing.
+    """
+    deadline = time.perf_counter() + (timeout or DEFAULT_TIMEOUT)
+    async with admission.slot(model):
+        started = time.perf_counter()
+        if keep_alive is None:
+            keep_alive = admission.backend.keep_alive_for(model)
+        try:
+            parts = await get_client().generate(
+                model=model,
+                prompt=prompt,
+                system=system,
+                options=options,
+                format=format,
+                think=think,
+                keep_alive=keep_alive,
+                stream=True,
+            )
+            iterator = parts.__aiter__()
+            while True:
+                try:
+                    part = await asyncio.wait_for(iterator.__anext__(), timeout=deadline - time.perf_counter())
+                except StopAsyncIteration:
+                    break
+                if part["response"]:
+                    yield part["response"]
+                if part.get("done"):
+                    result = to_result(model, part, (time.perf_counter() - started) * 1000)
+                    admission.backend.record_load(model, result.load_duration_ms)
+                    prefix_cache.observe(model, system, prompt, result)
+                    logger.info(
+                        f"LLM {model} (stream): {result.prompt_eval_count} prompt + {result.eval_count} eval tokens "
+                        f"in {result.wall_time_ms}ms (load {result.load_duration_ms}ms)"
+                    )
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"Streaming generation with '{model}' timed out after {timeout or DEFAULT_TIMEOUT}s")
+        except (ollama.ResponseError, httpx.HTTPError) as e:
+            raise LLMError(f"Streaming generation with '{model}' failed: {e}") from e
+
+
+async def embed(
+    model: str,
+    texts: List[str],
+    keep_alive: Union[float, str, None] = None,
+    timeout: Optional[float] = None,
+) -> List[List[float]]:
+    """Embed `texts` with an embedding model; admitted like any generation."""
+    async with admission.slot(model):
+        started = time.perf_counter()
+        if keep_alive is None:
+            keep_alive = admission.backend.keep_alive_for(model)
+        try:
+            response = await asyncio.wait_for(
+                get_client().embed(model=model, input=texts, keep_alive=keep_alive),
+                timeout=timeout or DEFAULT_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"Embedding with '{model}' timed out after {timeout or DEFAULT_TIMEOUT}s")
+        except (ollama.ResponseError, httpx.HTTPError) as e:
+            raise LLMError(f"Embedding with '{model}' failed: {e}") from e
+        admission.backend.record_load(model, _ns_to_ms(response.get("load_duration")))
+
+    logger.info(f"LLM {model}: embedded {len(texts)} text(s) in {(time.perf_counter() - started) * 1000:.2f}ms")
+    return [list(vector) for vector in response["embeddings"]]
+
+
+async def lookup(
+    model: str,
+    prompt: str,
+    system: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+    format: Union[str, Dict[str, Any], None] = None,
+) -> Optional[LLMResult]:
+    """Return the cached result for a generation without running it."""
+    key = llm_cache.make_key(model, system, prompt, options, format)
+    hit = await llm_cache.cache.get(key)
+    if hit is None:
+        return None
+    return LLMResult(**{**hit, "cached": True, "cache_key": key})
+
+
+async def remember(
+    model: str,
+    prompt: str,
+    text: str,
+    system: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+    format: Union[str, Dict[str, Any], None] = None,
+):
+    """
+    Store `text` as the cached output of a generation that was produced some
+    other way (e.g. split out of a batch generation).
+    """
+    key = llm_cache.make_key(model, system, prompt, options, format)
+    await llm_cache.cache.set(key, LLMResult(model=model, text=text).model_dump(exclude={"cached", "cache_key"}))
+
+
+async def invalidate(result: Optional[LLMResult]):
+    """Drop a cached result whose text turned out to be unusable."""
+    if result is not None and result.cache_key:
+        await llm_cache.cache.delete(result.cache_key)
+
+
+async def prime_prefixes(models: Optional[List[str]] = None):
+    """
+    Evaluate the registered static system prompts (optionally only those for
+    `models`) so the first real request finds them in the KV cache.
+    """
+    for entry in prefix_cache.registered(models):
+        try:
+            result = await _call_ollama(
+                entry.model, ".", entry.system, {**(entry.options or {}), "num_predict": 1}, None, None, None, None,
+                background=True,
+            )
+            prefix_cache.record_prime(entry.model, entry.system, result.prompt_eval_count, result.load_duration_ms)
+            logger.info(f"Primed prefix '{entry.name}' on {entry.model} ({result.prompt_eval_count} tokens)")
+        except Exception as e:
+            logger.warning(f"Failed to prime prefix '{entry.name}' on {entry.model}: {e}")
+
+
+def get_stats() -> Dict[str, Any]:
+    """Gateway metrics for the performance endpoints."""
+    return {
+        "cache": llm_cache.cache.get_stats(),
+        "single_flight": _inflight.get_stats(),
+        "admission": admission.get_stats(),
+        "prefix_cache": prefix_cache.get_stats(),
+    }
+
+
+async def list_models() -> Dict[str, Any]:
+    """List locally available models through the pooled client."""
+    try:
+        return await get_client().list()
+    except (ollama.ResponseError, httpx.HTTPError) as e:
+        raise LLMError(f"Failed to list models: {e}") from e
@@ -0,0 +1,81 @@
+# utils/micro_batcher.py
+"""
+Transparent micro-batching of concurrent single-item calls.
+
+Items submitted within `window_ms` of the first one (up to `max_batch`) are
+handed to `run_batch` together, and each caller gets back the result at its
+own position. If the batch call fails, every caller in it gets the exception.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        window_ms: float = 50,
+        max_batch: int = 16,
+    ):
+        self.name = name
+        self.run_batch = run_batch
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Running batches; the loop only keeps weak references to tasks
+        self._tasks: set = set()
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            task = asyncio.create_task(self._run(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending: List[Tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(pending)
+        self.max_batch_seen = max(self.max_batch_seen, len(pending))
+        if len(pending) > 1:
+            logger.info(f"{self.name}: running micro-batch of {len(pending)} items")
+        try:
+            results = await self.run_batch([item for item, _ in pending])
+        except Exception as e:
+            # Futures of callers that gave up are already cancelled (done) and skipped
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_ms,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_seen": self.max_batch_seen,
+        }
@@ -0,0 +1,413 @@
+# utils/model_scheduler.py
+"""
+Model residency scheduler for the local Ollama server.
+
+Ollama keeps a limited number of models in memory; on RAM-limited nodes mixed
+traffic across our five models makes it unload and reload them constantly.
+The scheduler owns the backend slots and the per-model slots used by
+`utils.admission`. Every generation is queued under its model, so requests
+for a busy model pile up where they can be batched, and the scheduler decides
+which queued generation runs next:
+
+- a model runs at most its model slots at once, and at most
+  LLM_MAX_LOADED_MODELS distinct models run at the same time; a model that is
+  not resident only starts next to others while psutil shows room for it
+  (its last known size, or no memory pressure), otherwise it waits for the
+  running models to drain;
+- work for the model that just finished, then for models that are running or
+  resident in memory, is preferred, so queued requests are batched by model
+  instead of alternating;
+- background work (roadmap pre-generation) only starts while no interactive
+  request is queued and some backend slots stay free, and interactive
+  requests queued after it go first;
+- a request that has waited longer than SCHEDULER_MAX_SKEW_SECONDS is served
+  next regardless, so nothing starves; if its model has no room to load, no
+  other model is started until it has;
+- `keep_alive` is chosen per model: pinned models stay loaded longer, the rest
+  are released quickly when system memory runs low;
+- under memory pressure idle, unpinned models are unloaded (LRU first) using
+  the same psutil readings as the performance monitor.
+
+Configuration (environment):
+    LLM_PINNED_MODELS             comma separated models to warm at startup and keep loaded
+    LLM_PINNED_KEEP_ALIVE         keep_alive for pinned models (default "30m")
+    LLM_DEFAULT_KEEP_ALIVE        keep_alive for other models (default "5m")
+    LLM_LOW_MEMORY_KEEP_ALIVE     keep_alive for other models under memory pressure (default "30s")
+    LLM_MEMORY_PRESSURE_PERCENT   memory usage that counts as pressure (default 85)
+    LLM_MAX_LOADED_MODELS         distinct models generating at the same time (default 2)
+    SCHEDULER_MAX_SKEW_SECONDS    maximum extra wait caused by preferring resident models (default 10)
+    SCHEDULER_REFRESH_SECONDS     how often `ollama ps` is polled (default 15)
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from utils.prefix_cache import prefix_cache
+from utils.system_metrics import get_memory_metrics
+
+logger = logging.getLogger(__name__)
+
+PINNED_MODELS = [m.strip() for m in os.getenv("LLM_PINNED_MODELS", "qwen3:1.7b,gemma:2b").split(",") if m.strip()]
+PINNED_KEEP_ALIVE = os.getenv("LLM_PINNED_KEEP_ALIVE", "30m")
+DEFAULT_KEEP_ALIVE = os.getenv("LLM_DEFAULT_KEEP_ALIVE", "5m")
+LOW_MEMORY_KEEP_ALIVE = os.getenv("LLM_LOW_MEMORY_KEEP_ALIVE", "30s")
+MEMORY_PRESSURE_PERCENT = float(os.getenv("LLM_MEMORY_PRESSURE_PERCENT", "85"))
+MAX_LOADED_MODELS = int(os.getenv("LLM_MAX_LOADED_MODELS", "2"))
+MAX_SKEW_SECONDS = float(os.getenv("SCHEDULER_MAX_SKEW_SECONDS", "10"))
+REFRESH_SECONDS = float(os.getenv("SCHEDULER_REFRESH_SECONDS", "15"))
+
+
+class _Waiter:
+    __slots__ = ("model", "future", "enqueued_at", "background")
+
+    def __init__(self, model: str, future: asyncio.Future, background: bool = False):
+        self.model = model
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.background = background
+
+
+class ModelScheduler:
+    """Backend slot dispatcher with per-model queues that prefers models already in memory."""
+
+    def __init__(
+        self,
+        name: str,
+        slots: int,
+        queue_limit: int,
+        queue_timeout: float,
+        model_slots: int = 1,
+        model_slots_override: Optional[Dict[str, int]] = None,
+        background_reserved: int = 1,
+    ):
+        self.name = name
+        self.slots = slots
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self.model_slots = model_slots
+        self.model_slots_override = model_slots_override or {}
+        self.background_reserved = background_reserved
+        self.active = 0
+        self._running: Dict[str, int] = {}
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._resident: Dict[str, Dict[str, Any]] = {}
+        self._sizes_mb: Dict[str, float] = {}
+        self._last_used: Dict[str, float] = {}
+        self._get_client: Optional[Callable[[], Any]] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._wait_times: Deque[float] = deque(maxlen=100)
+        self._hold_times: Deque[float] = deque(maxlen=100)
+        self._admitted_by_model: Dict[str, int] = {}
+        self.admitted = 0
+        self.background_admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.resident_dispatches = 0
+        self.cold_dispatches = 0
+        self.skew_overrides = 0
+        self.load_holds = 0
+        self.evictions = 0
+        self.load_ms: Dict[str, float] = {}
+
+    # -------- Queueing --------
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def slots_for(self, model: str) -> int:
+        return self.model_slots_override.get(model, self.model_slots)
+
+    def retry_after(self, model: Optional[str] = None) -> int:
+        """Rough estimate of how long until a queued request (for `model`) would be served."""
+        avg_hold = sum(self._hold_times) / len(self._hold_times) if self._hold_times else 5.0
+        if model is None:
+            return max(1, round(avg_hold * (self.waiting + 1) / self.slots))
+        return max(1, round(avg_hold * (len(self._queues.get(model, ())) + 1) / self.slots_for(model)))
+
+    @property
+    def waiting_interactive(self) -> int:
+        return sum(1 for q in self._queues.values() for w in q if not w.background)
+
+    async def acquire(self, model: str, background: bool = False):
+        """
+        Wait for a slot for `model`. Background work waits without a deadline,
+        starts only while no interactive request is queued and leaves
+        `background_reserved` backend slots free; interactive requests queued
+        later still go ahead of it.
+        """
+        # Import here: admission imports this module for its backend scheduler
+        from utils.admission import OverloadedError
+
+        queued = len(self._queues.get(model, ()))
+        if queued >= self.queue_limit:
+            self.rejected += 1
+            raise OverloadedError(
+                f"model '{model}' is saturated ({self._running.get(model, 0)} running, {queued} queued)",
+                retry_after=self.retry_after(model),
+                status_code=429,
+            )
+
+        # Every request is queued by model and dispatched by the same rules, so
+        # work for a model piles up behind its cap where the scheduler can batch it
+        waiter = _Waiter(model, asyncio.get_running_loop().create_future(), background)
+        queue = self._queues.setdefault(model, deque())
+        if background:
+            queue.append(waiter)
+        else:
+            # Ahead of the model's background work
+            position = next((i for i, w in enumerate(queue) if w.background), len(queue))
+            queue.insert(position, waiter)
+        self._dispatch()
+        if waiter.future.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=None if background else self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted at the same moment we gave up: hand the slot on
+                self.release(model, 0.0)
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.timed_out += 1
+            raise OverloadedError(
+                f"Timed out after {self.queue_timeout}s waiting for {self.name} (model '{model}')",
+                retry_after=self.retry_after(model),
+            )
+
+    def release(self, model: str, held_seconds: float):
+        self.active -= 1
+        self._running[model] -= 1
+        if not self._running[model]:
+            del self._running[model]
+        self._last_used[model] = time.time()
+        self._hold_times.append(held_seconds)
+        self._dispatch(prefer=model)
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.model)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.model]
+
+    def _grant(self, model: str, waited: float, background: bool = False):
+        self.active += 1
+        self.admitted += 1
+        self.background_admitted += background
+        self._admitted_by_model[model] = self._admitted_by_model.get(model, 0) + 1
+        self._running[model] = self._running.get(model, 0) + 1
+        self._wait_times.append(waited)
+        if self._running[model] > 1 or model in self._resident:
+            self.resident_dispatches += 1
+        else:
+            self.cold_dispatches += 1
+
+    def _can_load(self, model: str) -> bool:
+        """Whether `model` may run alongside the models running now (all of which stay loaded)."""
+        if not self._running:
+            return True
+        if len(self._running) >= MAX_LOADED_MODELS:
+            return False
+        if model in self._resident:
+            return True
+        # A cold model must fit in the memory available now (its size as last seen in `ollama ps`)
+        memory = get_memory_metrics()
+        size_mb = self._sizes_mb.get(model)
+        if size_mb is None:
+            return memory["percent"] < MEMORY_PRESSURE_PERCENT
+        return memory["available_gb"] * 1024 >= size_mb
+
+    def _can_start(self, model: str) -> bool:
+        running = self._running.get(model, 0)
+        if running:
+            return running < self.slots_for(model)
+        return self._can_load(model)
+
+    def _enqueued_at(self, model: str) -> float:
+        return self._queues[model][0].enqueued_at
+
+    def _pick_model(self, prefer: Optional[str] = None) -> Optional[str]:
+        """Choose which model's queue to serve next; None leaves the free slots idle."""
+        # Interactive waiters are queued ahead of background ones, so a queue
+        # headed by background work holds nothing else
+        interactive = [m for m in self._queues if not self._queues[m][0].background]
+        if not interactive:
+            if self.active >= self.slots - self.background_reserved:
+                return None
+            ready = [m for m in self._queues if self._can_start(m)]
+            return min(ready, key=self._enqueued_at) if ready else None
+
+        oldest = min(interactive, key=self._enqueued_at)
+        ready = [m for m in interactive if self._can_start(m)]
+        if time.perf_counter() - self._enqueued_at(oldest) > MAX_SKEW_SECONDS:
+            if oldest in ready:
+                self.skew_overrides += 1
+                return oldest
+            if oldest not in self._running:
+                # Waiting for room to load: start nothing new so the running models drain
+                return None
+        if not ready:
+            return None
+        if prefer in ready:
+            return prefer
+        for preferred in (self._running, self._resident):
+            candidates = [m for m in ready if m in preferred]
+            if candidates:
+                return min(candidates, key=self._enqueued_at)
+        return min(ready, key=self._enqueued_at)
+
+    def _dispatch(self, prefer: Optional[str] = None):
+        while self.active < self.slots:
+            model = self._pick_model(prefer)
+            if model is None:
+                if self.waiting_interactive and not any(m in self._running for m in self._queues):
+                    self.load_holds += 1
+                return
+            queue = self._queues[model]
+            waiter = queue.popleft()
+            if not queue:
+                del self._queues[model]
+            if waiter.future.done():
+                continue
+            waiter.future.set_result(True)
+            self._grant(model, time.perf_counter() - waiter.enqueued_at, waiter.background)
+
+    # -------- Residency and keep_alive --------
+
+    def memory_pressure(self) -> bool:
+        return get_memory_metrics()["percent"] >= MEMORY_PRESSURE_PERCENT
+
+    def keep_alive_for(self, model: str) -> str:
+        if model in PINNED_MODELS:
+            return PINNED_KEEP_ALIVE
+        if self.memory_pressure():
+            return LOW_MEMORY_KEEP_ALIVE
+        return DEFAULT_KEEP_ALIVE
+
+    def record_load(self, model: str, load_duration_ms: float):
+        """Remember that `model` is now resident and how long loading it took."""
+        self._resident.setdefault(model, {})
+        self._last_used[model] = time.time()
+        if load_duration_ms > 0:
+            self.load_ms[model] = round(load_duration_ms, 2)
+
+    async def refresh(self):
+        """Update the resident set from `ollama ps`."""
+        if self._get_client is None:
+            return
+        response = await self._get_client().ps()
+        self._resident = {
+            m["model"]: {
+                "size_mb": round((m.get("size") or 0) / (1024**2), 1),
+                "expires_at": str(m.get("expires_at")),
+            }
+            for m in response["models"]
+        }
+        for model, info in self._resident.items():
+            if info["size_mb"]:
+                self._sizes_mb[model] = info["size_mb"]
+
+    async def evict_idle(self) -> List[str]:
+        """Unload idle, unpinned models (least recently used first) while memory is under pressure."""
+        evicted = []
+        if self._get_client is None:
+            return evicted
+        candidates = sorted(
+            (m for m in self._resident
+             if m not in PINNED_MODELS and m not in self._running and m not in self._queues),
+            key=lambda m: self._last_used.get(m, 0),
+        )
+        for model in candidates:
+            if not self.memory_pressure():
+                break
+            try:
+                await self._get_client().generate(model=model, keep_alive=0)
+                self._resident.pop(model, None)
+                prefix_cache.model_unloaded(model)
+                self.evictions += 1
+                evicted.append(model)
+                logger.info(f"Scheduler: unloaded idle model '{model}' under memory pressure")
+            except Exception as e:
+                logger.warning(f"Scheduler: failed to unload '{model}': {e}")
+        return evicted
+
+    async def warm(self, models: List[str]):
+        """Load the given models ahead of the first request."""
+        for model in models:
+            try:
+                started = time.perf_counter()
+                await self._get_client().generate(model=model, keep_alive=self.keep_alive_for(model))
+                self.record_load(model, (time.perf_counter() - started) * 1000)
+                logger.info(f"Scheduler: warmed '{model}' in {self.load_ms.get(model)}ms")
+            except Exception as e:
+                logger.warning(f"Scheduler: failed to warm '{model}': {e}")
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+                if self.memory_pressure():
+                    await self.evict_idle()
+                # Residency and free memory decide which queued models may load
+                self._dispatch()
+            except Exception as e:
+                logger.warning(f"Scheduler: residency refresh failed: {e}")
+            await asyncio.sleep(REFRESH_SECONDS)
+
+    async def start(self, get_client: Callable[[], Any]):
+        """Warm pinned models and start polling residency (called on startup)."""
+        self._get_client = get_client
+        await self.warm(PINNED_MODELS)
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        waits = list(self._wait_times)
+        return {
+            "slots": self.slots,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "queue_limit": self.queue_limit,
+            "queued_by_model": {m: len(q) for m, q in self._queues.items()},
+            "running_by_model": dict(self._running),
+            "admitted": self.admitted,
+            "background_admitted": self.background_admitted,
+            "background_queued": self.waiting - self.waiting_interactive,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+            "max_wait_ms": round(max(waits) * 1000, 2) if waits else 0.0,
+            "resident_models": self._resident,
+            "pinned_models": PINNED_MODELS,
+            "resident_dispatches": self.resident_dispatches,
+            "cold_dispatches": self.cold_dispatches,
+            "skew_overrides": self.skew_overrides,
+            "load_holds": self.load_holds,
+            "max_loaded_models": MAX_LOADED_MODELS,
+            "evictions": self.evictions,
+            "last_load_ms": self.load_ms,
+            "memory_pressure": self.memory_pressure(),
+        }
+
+    def model_stats(self) -> Dict[str, Dict[str, Any]]:
+        models = set(self._admitted_by_model) | set(self._queues)
+        return {
+            model: {
+                "slots": self.slots_for(model),
+                "active": self._running.get(model, 0),
+                "queue_depth": len(self._queues.get(model, ())),
+                "admitted": self._admitted_by_model.get(model, 0),
+            }
+            for model in sorted(models)
+        }
@@ -0,0 +1,196 @@
+# utils/output_schema.py
+"""
+Structured output for LLM endpoints.
+
+`json_schema(Model)` compiles a router's Pydantic output model into a JSON
+schema once; passed as `format=` to Ollama it constrains decoding to that
+shape, so the parsing fallbacks in the routers (regex extraction, json_repair,
+field padding) become the exception rather than the rule. `wrapped_list_schema`
+covers endpoints whose prompts ask for a bare array: the grammar needs an
+object at the top level, and the parsers already unwrap single-key objects.
+
+`parse_json` is the one parsing path for model output, in tiers:
+    direct     the text is valid JSON as-is (the norm with constrained decoding)
+    extracted  valid JSON once code fences / <think> blocks / chatter are stripped
+    lenient    valid apart from raw control characters (newlines) inside strings
+    repaired   only parseable after json_repair
+Parsing uses orjson when it is installed. `validate` checks the result against
+a cached `TypeAdapter`, so validators are built once per model, not per call.
+
+`parse_stats` counts, per endpoint, how many responses parsed cleanly, needed
+repairs (and which), or failed, and which parsing tier succeeded, so the effect
+of constrained decoding on the repair and retry rate is visible under
+/llm/metrics.
+"""
+import json
+import logging
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple, Type, TypeVar
+
+from json_repair import repair_json
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=None)
+def type_adapter(model: Any) -> TypeAdapter:
+    """Validator for a Pydantic model (or any type TypeAdapter accepts); built once per model."""
+    return TypeAdapter(model)
+
+
+@lru_cache(maxsize=None)
+def json_schema(model: Any) -> Dict[str, Any]:
+    """JSON schema for a Pydantic model (or any type TypeAdapter accepts); compiled once."""
+    return type_adapter(model).json_schema()
+
+
+def validate(model: Type[T], data: Any) -> T:
+    """Validate parsed output against `model`; raises pydantic.ValidationError."""
+    return type_adapter(model).validate_python(data)
+
+
+@lru_cache(maxsize=None)
+def wrapped_list_schema(item_model: Any, key: str = "items") -> Dict[str, Any]:
+    """Schema for {"<key>": [<item_model>, ...]}."""
+    item_schema = dict(json_schema(item_model))
+    defs = item_schema.pop("$defs", None)
+    schema = {
+        "type": "object",
+        "properties": {key: {"type": "array", "items": item_schema}},
+        "required": [key],
+    }
+    if defs:
+        schema["$defs"] = defs
+    return schema
+
+
+class ParseRecord:
+    """Outcome of parsing one response; created by `ParseStats.start`."""
+
+    def __init__(self, stats: "ParseStats", endpoint: str):
+        self._stats = stats
+        self.endpoint = endpoint
+        self.was_repaired = False
+        self.was_failed = False
+
+    def repaired(self, kind: str, count: int = 1):
+        if count <= 0:
+            return
+        self._stats._add(self.endpoint, kind, count)
+        if not self.was_repaired:
+            self.was_repaired = True
+            self._stats._add(self.endpoint, "repaired_responses")
+
+    def tier(self, tier: str):
+        """Record which parsing tier succeeded; anything but 'direct' counts as a repair."""
+        self._stats._add(self.endpoint, f"tier_{tier}")
+        if tier != "direct":
+            self.repaired(f"json_{tier}")
+
+    def failed(self, kind: str):
+        self._stats._add(self.endpoint, kind)
+        if not self.was_failed:
+            self.was_failed = True
+            self._stats._add(self.endpoint, "failed_responses")
+
+
+class ParseStats:
+    def __init__(self):
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def start(self, endpoint: str) -> ParseRecord:
+        self._add(endpoint, "responses")
+        return ParseRecord(self, endpoint)
+
+    def _add(self, endpoint: str, kind: str, count: int = 1):
+        self._counters[endpoint][kind] += count
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {}
+        for endpoint, counters in self._counters.items():
+            responses = counters.get("responses", 0)
+            stats[endpoint] = {
+                **counters,
+                "repair_rate": round(counters.get("repaired_responses", 0) / responses, 3) if responses else 0.0,
+                "failure_rate": round(counters.get("failed_responses", 0) / responses, 3) if responses else 0.0,
+            }
+        return stats
+
+
+# Global per-endpoint parse statistics
+parse_stats = ParseStats()
+
+
+# -------- Parsing --------
+
+def _loads(text: str) -> Any:
+    if orjson is not None:
+        return orjson.loads(text)  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    return json.loads(text)
+
+
+def extract_json_text(text: str) -> str:
+    """
+    The span from the first '{' or '[' to the last matching closer, which
+    drops code fences and any text the model put around the JSON. A leading
+    <think> block (reasoning models) is skipped first.
+    """
+    think_end = text.find("</think>") if "<think>" in text else -1
+    if think_end != -1:
+        text = text[think_end + len("</think>"):]
+    for start, char in enumerate(text):
+        if char == "{" or char == "[":
+            break
+    else:
+        return text
+    end = text.rfind("}" if char == "{" else "]")
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def parse_json_tiered(text: str, repair: bool = True) -> Tuple[Any, str]:
+    """Parse model output, returning the value and the tier that succeeded."""
+    try:
+        return _loads(text), "direct"
+    except json.JSONDecodeError:
+        pass
+    extracted = extract_json_text(text)
+    if extracted != text:
+        try:
+            return _loads(extracted), "extracted"
+        except json.JSONDecodeError:
+            pass
+    try:
+        return json.loads(extracted, strict=False), "lenient"
+    except json.JSONDecodeError:
+        if not repair:
+            raise
+
+    repaired = repair_json(extracted)
+    if repaired in ("", '""'):
+        raise json.JSONDecodeError("Unrecoverable JSON output", extracted, 0)
+    return json.loads(repaired), "repaired"
+
+
+def parse_json(text: str, record: Optional[ParseRecord] = None, repair: bool = True) -> Any:
+    """
+    Parse model output through the direct / extracted / repaired tiers and
+    record the tier on `record`; raises json.JSONDecodeError when every tier fails.
+    """
+    try:
+        value, tier = parse_json_tiered(text, repair)
+    except json.JSONDecodeError:
+        if record:
+            record.failed("parse_failures")
+        raise
+    if record:
+        record.tier(tier)
+    return value
@@ -0,0 +1,291 @@
+# utils/page_fetcher.py
+"""
+Concurrent, non-blocking page fetching for the web search routes.
+
+Pages are fetched with one process-wide `httpx.AsyncClient`, so connections
+(and TLS sessions) are pooled across requests, and at most
+WEB_FETCH_PER_HOST requests go to the same host at a time. `fetch_pages`
+(or `fetch_pages_as_completed`, in completion order) fetches a batch
+concurrently under a single deadline: pages that are not in by then are
+cancelled and returned marked as partial instead of failing (or stalling)
+the whole response. Bodies are streamed into `utils.html_extract`,
+and reading stops once the title and first paragraphs are in or
+WEB_FETCH_MAX_BYTES have been read. Extracted content is cached and
+revalidated through `utils.web_cache`.
+
+Configuration (environment):
+    WEB_FETCH_TIMEOUT_SECONDS    timeout for a single page (default 10)
+    WEB_SEARCH_DEADLINE_SECONDS  deadline for a whole search request (default 8)
+    WEB_FETCH_MAX_CONNECTIONS    pooled connections in total (default 50)
+    WEB_FETCH_PER_HOST           concurrent requests per host (default 4)
+    WEB_FETCH_MAX_BYTES          bytes of a page body read at most (default 2 MiB)
+"""
+import asyncio
+import codecs
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from utils.html_extract import HtmlExtractor
+from utils.web_cache import web_cache
+
+logger = logging.getLogger(__name__)
+
+FETCH_TIMEOUT = float(os.getenv("WEB_FETCH_TIMEOUT_SECONDS", "10"))
+SEARCH_DEADLINE = float(os.getenv("WEB_SEARCH_DEADLINE_SECONDS", "8"))
+MAX_CONNECTIONS = int(os.getenv("WEB_FETCH_MAX_CONNECTIONS", "50"))
+PER_HOST = int(os.getenv("WEB_FETCH_PER_HOST", "4"))
+
+MAX_BYTES = int(os.getenv("WEB_FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+
+USER_AGENT = "Mozilla/5.0"
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide HTTP client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=httpx.Timeout(FETCH_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            follow_redirects=True,
+        )
+    return _client
+
+
+async def close_client():
+    """Close the pooled connections (called on application shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class HostLimiter:
+    """Per-host semaphores, dropped again once a host has no requests in flight."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._hosts: Dict[str, List[Any]] = {}  # host -> [semaphore, users]
+
+    async def acquire(self, host: str):
+        entry = self._hosts.setdefault(host, [asyncio.Semaphore(self.limit), 0])
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._release_user(host)
+            raise
+
+    def release(self, host: str):
+        self._hosts[host][0].release()
+        self._release_user(host)
+
+    def _release_user(self, host: str):
+        entry = self._hosts[host]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._hosts[host]
+
+    def __len__(self) -> int:
+        return len(self._hosts)
+
+
+host_limiter = HostLimiter(PER_HOST)
+
+
+class FetchStats:
+    def __init__(self):
+        self.pages = 0
+        self.ok = 0
+        self.errors = 0
+        self.partial = 0
+        self.total_ms = 0.0
+        self.bytes_read = 0
+        self.early_exits = 0
+        self.truncated = 0
+        self.skipped_non_html = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "pages": self.pages,
+            "ok": self.ok,
+            "errors": self.errors,
+            "partial": self.partial,
+            "avg_fetch_ms": round(self.total_ms / self.ok, 2) if self.ok else 0.0,
+            "bytes_read": self.bytes_read,
+            "early_exits": self.early_exits,
+            "truncated": self.truncated,
+            "skipped_non_html": self.skipped_non_html,
+            "active_hosts": len(host_limiter),
+        }
+
+
+fetch_stats = FetchStats()
+
+
+async def fetch_page(url: str, use_cache: bool = True, store: bool = True) -> Dict[str, Any]:
+    """
+    Fetch and extract one page; failures are reported in the result, not raised.
+
+    A fresh cached copy is served without a request (unless `use_cache` is
+    off); a stale one is revalidated with If-None-Match / If-Modified-Since
+    and kept on a 304. With `store` off the cache is not used at all.
+    """
+    started = time.perf_counter()
+    host = urlsplit(url).hostname or url
+    cached = await _cache_call(web_cache.get_page, url) if store else None
+    if cached is not None and use_cache and web_cache.is_fresh(cached):
+        web_cache.count("page_hits")
+        return _page_result(cached, "ok", started, cache="hit")
+
+    await host_limiter.acquire(host)
+    try:
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        async with get_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and cached is not None:
+                web_cache.count("page_revalidated")
+                web_cache.count("bytes_not_downloaded", cached.get("size", 0))
+                await _cache_call(web_cache.set_page, url, cached)
+                fetch_stats.ok += 1
+                return _page_result(cached, "ok", started, cache="revalidated")
+            scraped, size = await _read_page(response)
+
+        fetch_stats.ok += 1
+        status = "ok"
+        cache_status = None
+        if store:
+            cache_status = "changed" if cached is not None else "miss"
+            web_cache.count(f"page_{'changed' if cached is not None else 'misses'}")
+            if response.is_success and "no-store" not in response.headers.get("cache-control", ""):
+                await _cache_call(web_cache.set_page, url, {
+                    **scraped,
+                    "etag": response.headers.get("etag"),
+                    "last_modified": response.headers.get("last-modified"),
+                    "size": size,
+                })
+    except Exception as e:
+        fetch_stats.errors += 1
+        scraped = {"scraped_title": "Error fetching content", "content": str(e)}
+        status = "error"
+        cache_status = None
+    finally:
+        host_limiter.release(host)
+    return _page_result(scraped, status, started, cache=cache_status)
+
+
+async def _read_page(response: httpx.Response) -> Tuple[Dict[str, str], int]:
+    """Extract from the body as it streams in; returns the result and the bytes read."""
+    content_type = response.headers.get("content-type", "text/html").lower()
+    if not any(kind in content_type for kind in ("html", "xml", "text/plain")):
+        fetch_stats.skipped_non_html += 1
+        return {"scraped_title": "No title", "content": "No readable content."}, 0
+
+    extractor = HtmlExtractor()
+    decoder = codecs.getincrementaldecoder(_codec(response.encoding))(errors="replace")
+    size = 0
+    async for chunk in response.aiter_bytes():
+        size += len(chunk)
+        if extractor.feed(decoder.decode(chunk)):
+            fetch_stats.early_exits += 1
+            break
+        if size >= MAX_BYTES:
+            fetch_stats.truncated += 1
+            break
+    fetch_stats.bytes_read += size
+    return extractor.close(), size
+
+
+def _codec(encoding: Optional[str]) -> str:
+    try:
+        return codecs.lookup(encoding or "utf-8").name
+    except LookupError:
+        return "utf-8"
+
+
+async def _cache_call(method, *args):
+    """Run a blocking web cache call off the event loop; a broken cache only costs the caching."""
+    try:
+        return await asyncio.to_thread(method, *args)
+    except sqlite3.Error as e:
+        logger.warning(f"Web cache access failed: {e}")
+        return None
+
+
+def _page_result(page: Dict[str, Any], status: str, started: float, cache: Optional[str] = None) -> Dict[str, Any]:
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if status == "ok" and cache != "hit":
+        fetch_stats.total_ms += elapsed_ms
+    return {
+        "scraped_title": page["scraped_title"],
+        "content": page["content"],
+        "status": status,
+        "cache": cache,
+        "fetch_ms": round(elapsed_ms, 2),
+    }
+
+
+async def fetch_pages(
+    urls: List[str], deadline: float, use_cache: bool = True, store: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Fetch `urls` concurrently and return their results in order. `deadline`
+    is an event-loop time (`loop.time()`); fetches still running then are
+    cancelled and returned with status "partial".
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(urls)
+    async for index, result in fetch_pages_as_completed(urls, deadline, use_cache, store):
+        results[index] = result
+    return results
+
+
+async def fetch_pages_as_completed(
+    urls: List[str], deadline: float, use_cache: bool = True, store: bool = True
+) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Fetch `urls` concurrently, yielding (index, result) as each fetch
+    completes. At `deadline` the remaining fetches are cancelled and yielded
+    with status "partial"; closing the iterator early cancels them as well.
+    """
+    fetch_stats.pages += len(urls)
+    tasks = {asyncio.create_task(fetch_page(url, use_cache, store)): i for i, url in enumerate(urls)}
+    pending = set(tasks)
+    loop = asyncio.get_running_loop()
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for task in done:
+                yield tasks[task], task.result()
+    finally:
+        # Also reached when the request itself is cancelled or the consumer stops
+        for task in pending:
+            task.cancel()
+
+    if pending:
+        fetch_stats.partial += len(pending)
+        await asyncio.gather(*pending, return_exceptions=True)
+        logger.info(f"Web fetch: {len(pending)} of {len(tasks)} pages missed the deadline")
+    for index in sorted(tasks[task] for task in pending):
+        yield index, {
+            "scraped_title": "Content not fetched in time",
+            "content": "",
+            "status": "partial",
+            "cache": None,
+            "fetch_ms": None,
+        }
@@ -0,0 +1,288 @@
+# utils/piper_engine.py
+"""
+Local Piper TTS backend: network-free synthesis on our own CPUs.
+
+Synthesis runs in a process pool whose workers each load the ONNX voice once
+(in the worker initializer) and keep it, so requests neither reload the model
+nor hold the GIL of the API process. A text is split into sentence segments
+(`tts_engine.split_segments`); up to one segment per worker is synthesized
+ahead and each is streamed, in order, as soon as it is done: a WAV header
+first (with an open-ended length, as for live streams) and then raw 16-bit
+PCM, or only the PCM. No files are written.
+
+Every request records its real-time factor (synthesis seconds per second of
+audio; below 1 is faster than real time) for `get_stats`.
+
+piper-tts is optional: without it, or without the model file, the backend
+reports itself unavailable and the routes keep using edge-tts. If a worker
+dies (an ONNX crash, the OOM killer) the pool is broken for good, so it is
+dropped and the next request starts a new one.
+
+Configuration (environment):
+    PIPER_MODEL_PATH   ONNX voice (default ./models/en_US-lessac-medium.onnx, with its .onnx.json)
+    PIPER_WORKERS      worker processes, each with the voice loaded (default 2)
+    PIPER_PRELOAD      start the workers and load the voice at startup (default true)
+    PIPER_FALLBACK     speak with Piper when edge-tts fails (default true)
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import struct
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+from utils.tts_engine import split_segments
+
+try:
+    from piper import PiperVoice, SynthesisConfig
+except ImportError:  # piper-tts is optional; edge-tts remains the default backend
+    PiperVoice = None
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = Path(os.getenv("PIPER_MODEL_PATH", "./models/en_US-lessac-medium.onnx"))
+WORKERS = int(os.getenv("PIPER_WORKERS", "2"))
+PRELOAD = os.getenv("PIPER_PRELOAD", "true").lower() == "true"
+FALLBACK = os.getenv("PIPER_FALLBACK", "true").lower() == "true"
+
+SAMPLE_WIDTH = 2  # Piper produces 16-bit mono PCM
+CHANNELS = 1
+
+# -------- Worker process --------
+
+_voice = None
+
+
+def _load_voice(model_path: str):
+    global _voice
+    _voice = PiperVoice.load(model_path)
+
+
+def _synthesize_segment(text: str, length_scale: float, volume: float) -> Tuple[bytes, float]:
+    """PCM for one segment and the seconds it took (runs in a worker)."""
+    started = time.perf_counter()
+    config = SynthesisConfig(
+        volume=volume,
+        length_scale=length_scale,
+        noise_scale=1.0,
+        noise_w_scale=1.0,
+        normalize_audio=True
+    )
+    audio = b"".join(chunk.audio_int16_bytes for chunk in _voice.synthesize(text, syn_config=config))
+    return audio, time.perf_counter() - started
+
+
+def _ready() -> bool:
+    return _voice is not None
+
+
+# -------- API process --------
+
+
+def wav_header(sample_rate: int) -> bytes:
+    """WAV header for a stream of unknown length (sizes set to the maximum)."""
+    byte_rate = sample_rate * CHANNELS * SAMPLE_WIDTH
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, CHANNELS, sample_rate, byte_rate, CHANNELS * SAMPLE_WIDTH, 16)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF)
+    )
+
+
+def _percent(value: Optional[str]) -> float:
+    """edge-tts style "+10%" / "-20%" as a factor (1.1 / 0.8)."""
+    if not value:
+        return 1.0
+    try:
+        return max(0.1, 1 + float(value.strip().rstrip("%")) / 100)
+    except ValueError:
+        raise ValueError(f"Invalid value '{value}'; expected a percentage such as +10%")
+
+
+class PiperStats:
+    def __init__(self):
+        self.requests = 0
+        self.completed = 0
+        self.failed = 0
+        self.segments = 0
+        self.audio_seconds = 0.0
+        self.synthesis_seconds = 0.0
+        self.recent: Deque[Dict[str, float]] = deque(maxlen=20)
+
+    def record(self, audio_seconds: float, synthesis_seconds: float, first_audio_ms: float):
+        self.completed += 1
+        self.audio_seconds += audio_seconds
+        self.synthesis_seconds += synthesis_seconds
+        self.recent.append({
+            "audio_seconds": round(audio_seconds, 2),
+            "rtf": round(synthesis_seconds / audio_seconds, 3) if audio_seconds else 0.0,
+            "first_audio_ms": round(first_audio_ms, 1),
+        })
+
+
+class PiperEngine:
+    def __init__(self, model_path: Path = MODEL_PATH, workers: int = WORKERS):
+        self.model_path = model_path
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._sample_rate: Optional[int] = None
+        self.stats = PiperStats()
+
+    def available(self) -> bool:
+        return PiperVoice is not None and self.model_path.exists()
+
+    @property
+    def voice_name(self) -> str:
+        return self.model_path.name.removesuffix(".onnx")
+
+    @property
+    def sample_rate(self) -> int:
+        if self._sample_rate is None:
+            config = json.loads(Path(f"{self.model_path}.json").read_text(encoding="utf-8"))
+            self._sample_rate = int(config["audio"]["sample_rate"])
+        return self._sample_rate
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned rather than forked: the API process has threads (and their locks) running
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_load_voice,
+                initargs=(str(self.model_path),),
+            )
+        return self._pool
+
+    async def start(self):
+        """Start every worker and load the voice in each, ahead of the first request."""
+        if not self.available():
+            logger.info(f"Piper backend unavailable (piper-tts installed: {PiperVoice is not None}, "
+                        f"model: {self.model_path})")
+            return
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        # The pool starts a process per pending task, up to `workers`
+        await asyncio.gather(*(loop.run_in_executor(pool, _ready) for _ in range(self.workers)))
+        logger.info(f"Piper voice {self.voice_name} loaded in {self.workers} workers "
+                    f"in {time.perf_counter() - started:.1f}s")
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """Drop a broken pool so the next call starts fresh workers."""
+        if self._pool is pool:
+            logger.warning("Piper worker process died; the pool will be restarted on the next request")
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def ping(self) -> Optional[int]:
+        """
+        Round trip through the pool; returns how many answering workers have
+        the voice loaded, or None while the pool is not started (a probe does
+        not start it).
+        """
+        if self._pool is None:
+            return None
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            ready = await asyncio.gather(*(loop.run_in_executor(pool, _ready) for _ in range(self.workers)))
+        except BrokenProcessPool as e:
+            self._discard_pool(pool)
+            raise RuntimeError("Piper worker process died") from e
+        if not any(ready):
+            raise RuntimeError("Piper workers have no voice loaded")
+        return sum(ready)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def synthesize(
+        self,
+        text: str,
+        rate: Optional[str] = None,
+        volume: Optional[str] = None,
+        wav: bool = True,
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream audio for `text` (already prepared): each segment's PCM in
+        order as soon as it is synthesized, the first one behind a WAV header
+        unless `wav` is off.
+        """
+        length_scale = 1 / _percent(rate)
+        gain = _percent(volume)
+        segments = split_segments(text)
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        futures: Deque[asyncio.Future] = deque()
+        launched = 0
+        started = time.perf_counter()
+        first_audio_ms = None
+        audio_bytes = 0
+        synthesis_seconds = 0.0
+        self.stats.requests += 1
+        self.stats.segments += len(segments)
+
+        def launch():
+            nonlocal launched
+            while launched < len(segments) and len(futures) < self.workers:
+                futures.append(loop.run_in_executor(pool, _synthesize_segment, segments[launched], length_scale, gain))
+                launched += 1
+
+        try:
+            launch()
+            while futures:
+                audio, seconds = await futures.popleft()
+                launch()
+                synthesis_seconds += seconds
+                audio_bytes += len(audio)
+                if first_audio_ms is None:
+                    first_audio_ms = (time.perf_counter() - started) * 1000
+                    # The header goes out with the first audio, so failures surface before anything is sent
+                    if wav:
+                        audio = wav_header(self.sample_rate) + audio
+                yield audio
+        except BrokenProcessPool as e:
+            self.stats.failed += 1
+            self._discard_pool(pool)
+            raise RuntimeError("Piper worker process died during synthesis") from e
+        except Exception:
+            self.stats.failed += 1
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+        audio_seconds = audio_bytes / (self.sample_rate * SAMPLE_WIDTH * CHANNELS)
+        self.stats.record(audio_seconds, synthesis_seconds, first_audio_ms or 0.0)
+        logger.info(f"Piper: {audio_seconds:.1f}s of audio in {len(segments)} segments, "
+                    f"RTF {synthesis_seconds / audio_seconds if audio_seconds else 0:.3f}, "
+                    f"first audio after {first_audio_ms or 0:.0f}ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        s = self.stats
+        return {
+            "available": self.available(),
+            "voice": self.voice_name,
+            "workers": self.workers,
+            "started": self._pool is not None,
+            "requests": s.requests,
+            "completed": s.completed,
+            "failed": s.failed,
+            "segments": s.segments,
+            "audio_seconds": round(s.audio_seconds, 2),
+            "synthesis_seconds": round(s.synthesis_seconds, 2),
+            "avg_rtf": round(s.synthesis_seconds / s.audio_seconds, 3) if s.audio_seconds else 0.0,
+            "recent": list(s.recent),
+        }
+
+
+# Global Piper backend
+piper_engine = PiperEngine()
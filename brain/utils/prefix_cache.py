@@ -0,0 +1,206 @@
+# utils/prefix_cache.py
+"""
+Reuse of the evaluated system-prompt prefix across generations.
+
+The llama.cpp runner behind Ollama keeps the KV cache of each parallel slot
+and, for a new request, only evaluates the tokens after the longest prefix it
+already holds. Our large system prompts are identical on every call and are
+rendered before the user prompt, so as long as the model stays loaded the
+prefix is evaluated once instead of per request. This module makes that
+reuse deliberate and measurable:
+
+- static prompts are registered per model under a name (`register`); changing
+  the text or the model of a registered prompt invalidates its entry;
+- a reload of the model (seen as a non-trivial `load_duration`) or an eviction
+  by the scheduler marks the model's prefixes cold, and
+  `llm_gateway.prime_prefixes` evaluates registered prefixes ahead of the
+  first request;
+- every generation with a system prompt is observed, and the number of prompt
+  tokens that were not evaluated (and the time that saved) is estimated from
+  Ollama's `prompt_eval_count` against the expected prefix + prompt length.
+
+Reuse only holds per runner slot: with several static prompts on one model,
+OLLAMA_NUM_PARALLEL should be at least the number of prompts served by it.
+Options that change the runner (e.g. `num_ctx`) reload the model, so prompts
+are registered with the options they are used with and primed with them.
+
+Configuration (environment):
+    PREFIX_CACHE_MAX_ENTRIES   prefixes tracked, registered ones included (default 64)
+    PREFIX_COLD_LOAD_MS        load_duration above which a model counts as reloaded (default 100)
+"""
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = int(os.getenv("PREFIX_CACHE_MAX_ENTRIES", "64"))
+COLD_LOAD_MS = float(os.getenv("PREFIX_COLD_LOAD_MS", "100"))
+
+# Rough prompt length estimate, used until a prefix has been measured
+CHARS_PER_TOKEN = 4.0
+
+
+def prefix_hash(system: str) -> str:
+    return hashlib.sha256(system.encode("utf-8")).hexdigest()[:16]
+
+
+class PrefixEntry:
+    def __init__(self, model: str, system: str, name: Optional[str] = None,
+                 options: Optional[Dict[str, Any]] = None):
+        self.model = model
+        self.system = system
+        self.options = options
+        self.hash = prefix_hash(system)
+        self.name = name
+        self.prefix_tokens: Optional[int] = None
+        self.warm = False
+        self.calls = 0
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.ms_saved = 0.0
+        self.primed_at: Optional[float] = None
+
+    def expected_prefix_tokens(self) -> float:
+        if self.prefix_tokens is not None:
+            return self.prefix_tokens
+        return len(self.system) / CHARS_PER_TOKEN
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "hash": self.hash,
+            "prefix_tokens": self.prefix_tokens,
+            "warm": self.warm,
+            "calls": self.calls,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / self.calls, 3) if self.calls else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "prompt_eval_ms_saved": round(self.ms_saved, 2),
+            "primed_at": self.primed_at,
+        }
+
+
+class PrefixCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], PrefixEntry]" = OrderedDict()
+        self._registered: Dict[str, Tuple[str, str]] = {}
+        self.invalidations = 0
+        self.cold_loads = 0
+
+    def register(self, name: str, model: str, system: str, options: Optional[Dict[str, Any]] = None) -> PrefixEntry:
+        """Declare `system` as the static prompt `name` used with `model` (and `options`)."""
+        key = (model, prefix_hash(system))
+        previous = self._registered.get(name)
+        if previous is not None and previous != key:
+            # Prompt text or model changed: the old prefix will not be reused again
+            self._entries.pop(previous, None)
+            self.invalidations += 1
+            logger.info(f"Prefix cache: invalidated '{name}' ({previous[0]}, {previous[1]})")
+        self._registered[name] = key
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = PrefixEntry(model, system, name, options)
+            self._entries[key] = entry
+        entry.name = name
+        entry.options = options
+        self._evict()
+        return entry
+
+    def registered(self, models: Optional[List[str]] = None) -> List[PrefixEntry]:
+        """Registered prefixes, optionally only those for the given models."""
+        entries = [self._entries[key] for key in self._registered.values() if key in self._entries]
+        if models is not None:
+            entries = [e for e in entries if e.model in models]
+        return entries
+
+    def model_unloaded(self, model: str):
+        """The runner for `model` is gone, and with it every cached prefix."""
+        for entry in self._entries.values():
+            if entry.model == model:
+                entry.warm = False
+
+    def record_prime(self, model: str, system: str, prompt_eval_count: int, load_duration_ms: float):
+        """Measure the prefix length from a priming call (system prompt + a one-character prompt)."""
+        entry = self._entry(model, system)
+        if load_duration_ms > COLD_LOAD_MS:
+            self._reloaded(model)
+        if prompt_eval_count > 1:
+            entry.prefix_tokens = prompt_eval_count - 1
+        entry.warm = True
+        entry.primed_at = time.time()
+
+    def observe(self, model: str, system: Optional[str], prompt: str, result: Any):
+        """Account one generation (an `LLMResult`) that used `system` as its prefix."""
+        if not system:
+            return
+        if result.load_duration_ms > COLD_LOAD_MS:
+            self._reloaded(model)
+        entry = self._entry(model, system)
+        entry.calls += 1
+
+        expected_prefix = entry.expected_prefix_tokens()
+        expected_total = expected_prefix + len(prompt) / CHARS_PER_TOKEN
+        reused = expected_total - result.prompt_eval_count
+        if result.prompt_eval_count and reused >= expected_prefix / 2:
+            entry.hits += 1
+            saved = int(min(reused, expected_prefix))
+            entry.tokens_saved += saved
+            entry.ms_saved += saved * result.prompt_eval_duration_ms / result.prompt_eval_count
+        else:
+            entry.misses += 1
+            if not entry.warm and entry.prefix_tokens is None and result.prompt_eval_count:
+                # A cold, full evaluation: the prompt's share is the best estimate we have
+                entry.prefix_tokens = max(1, round(result.prompt_eval_count - len(prompt) / CHARS_PER_TOKEN))
+        entry.warm = True
+
+    def _entry(self, model: str, system: str) -> PrefixEntry:
+        key = (model, prefix_hash(system))
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = PrefixEntry(model, system)
+            self._entries[key] = entry
+            self._evict()
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _reloaded(self, model: str):
+        self.cold_loads += 1
+        self.model_unloaded(model)
+
+    def _evict(self):
+        registered = set(self._registered.values())
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                break
+            if key not in registered:
+                del self._entries[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        entries = list(self._entries.values())
+        calls = sum(e.calls for e in entries)
+        hits = sum(e.hits for e in entries)
+        return {
+            "entries": len(entries),
+            "registered": len(self._registered),
+            "calls": calls,
+            "hits": hits,
+            "hit_ratio": round(hits / calls, 3) if calls else 0.0,
+            "tokens_saved": sum(e.tokens_saved for e in entries),
+            "prompt_eval_ms_saved": round(sum(e.ms_saved for e in entries), 2),
+            "invalidations": self.invalidations,
+            "cold_loads": self.cold_loads,
+            "prefixes": [e.get_stats() for e in entries],
+        }
+
+
+# Global prefix cache for the local Ollama server
+prefix_cache = PrefixCache()
@@ -0,0 +1,130 @@
+# utils/pregeneration.py
+"""
+Low-priority background pre-generation of roadmap node content.
+
+After a roadmap is created its nodes can be queued here; a single worker
+generates their content one node at a time in graph order. Its generations
+are admitted as background work (`admission.slot(..., background=True)`): they
+start only while no interactive request is queued for any model and some
+backend slots are free, and interactive requests overtake them in the queue.
+Finished content is kept in `content_store` (memory LRU + SQLite, the same
+tiers as the LLM response cache) where the content route serves it directly.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils.admission import OverloadedError
+from utils.llm_cache import CACHE_DIR, DiskTier, LLMResponseCache, MemoryTier
+
+logger = logging.getLogger(__name__)
+
+IDLE_POLL_SECONDS = float(os.getenv("PREGENERATION_POLL_SECONDS", "0.5"))
+MAX_TRACKED_JOBS = int(os.getenv("PREGENERATION_MAX_JOBS", "200"))
+CONTENT_TTL_SECONDS = float(os.getenv("PREGENERATION_TTL_SECONDS", str(7 * 24 * 3600)))
+
+content_store = LLMResponseCache(
+    MemoryTier(512, CONTENT_TTL_SECONDS),
+    DiskTier(CACHE_DIR / "pregenerated.sqlite3", 20000, CONTENT_TTL_SECONDS),
+)
+
+
+class PregenerationTask:
+    def __init__(self, node_id: str, node_type: str, label: str, run: Callable[[], Awaitable[Any]]):
+        self.node_id = node_id
+        self.node_type = node_type
+        self.label = label
+        self.run = run
+        self.status = "pending"
+        self.error: Optional[str] = None
+
+
+class PregenerationJob:
+    def __init__(self, job_id: str, tasks: List[PregenerationTask]):
+        self.job_id = job_id
+        self.tasks = tasks
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def progress(self) -> Dict[str, Any]:
+        counts = {"pending": 0, "running": 0, "ready": 0, "failed": 0}
+        for task in self.tasks:
+            counts[task.status] += 1
+        done = counts["ready"] + counts["failed"]
+        return {
+            "roadmapId": self.job_id,
+            "status": "completed" if done == len(self.tasks) else "running" if done or counts["running"] else "queued",
+            "total": len(self.tasks),
+            **counts,
+            "nodes": {
+                task.node_id: {"type": task.node_type, "label": task.label, "status": task.status, "error": task.error}
+                for task in self.tasks
+            },
+        }
+
+
+class PregenerationPipeline:
+    def __init__(self):
+        self._jobs: "OrderedDict[str, PregenerationJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def submit(self, tasks: List[PregenerationTask], job_id: Optional[str] = None) -> str:
+        """Queue a roadmap's node tasks (already in graph order) and return the job id."""
+        job_id = job_id or uuid.uuid4().hex
+        job = PregenerationJob(job_id, tasks)
+        self._jobs[job_id] = job
+        self._jobs.move_to_end(job_id)
+        while len(self._jobs) > MAX_TRACKED_JOBS:
+            self._jobs.popitem(last=False)
+
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        for task in tasks:
+            self._queue.put_nowait(task)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        logger.info(f"Pre-generation queued {len(tasks)} nodes for roadmap {job_id}")
+        return job_id
+
+    def progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return job.progress() if job else None
+
+    async def _run(self):
+        while not self._queue.empty():
+            task = await self._queue.get()
+            task.status = "running"
+            try:
+                await task.run()
+                task.status = "ready"
+            except OverloadedError:
+                # Interactive traffic took the capacity: try this node again later
+                task.status = "pending"
+                self._queue.put_nowait(task)
+                await asyncio.sleep(IDLE_POLL_SECONDS)
+            except Exception as e:
+                task.status = "failed"
+                task.error = str(e)
+                logger.warning(f"Pre-generation failed for node {task.node_id}: {e}")
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "jobs": len(self._jobs),
+            "queued_nodes": self._queue.qsize() if self._queue else 0,
+            "worker_running": self._worker is not None and not self._worker.done(),
+            "store": content_store.get_stats(),
+        }
+
+
+# Global pipeline instance
+pipeline = PregenerationPipeline()
@@ -0,0 +1,234 @@
+# utils/question_bank.py
+"""
+Persistent bank of generated quiz questions.
+
+Every multiple-choice question the quiz routes generate is stored in SQLite,
+indexed by normalized topic title and difficulty. A request for N questions
+is answered from stock (a fresh random selection per request, so users do not
+all get the same set) and only the shortfall is generated and added back. For
+well-quizzed topics this turns model time into a database read.
+
+Questions that repeat one already in stock for the topic, exactly or nearly
+(word-set Jaccard similarity of at least QUESTION_BANK_DUPLICATE_THRESHOLD),
+are not stored, so a topic's stock holds distinct questions.
+
+Configuration (environment):
+    QUESTION_BANK_ENABLED              serve from / add to the bank (default true)
+    QUESTION_BANK_PATH                 SQLite file (default <BRAIN_CACHE_DIR>/question_bank.sqlite3)
+    QUESTION_BANK_DUPLICATE_THRESHOLD  similarity at which questions count as duplicates (default 0.8)
+    QUESTION_BANK_MAX_PER_TOPIC        questions kept per topic and difficulty (default 500)
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from utils.llm_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+BANK_ENABLED = os.getenv("QUESTION_BANK_ENABLED", "true").lower() == "true"
+BANK_PATH = Path(os.getenv("QUESTION_BANK_PATH", CACHE_DIR / "question_bank.sqlite3"))
+DUPLICATE_THRESHOLD = float(os.getenv("QUESTION_BANK_DUPLICATE_THRESHOLD", "0.8"))
+MAX_PER_TOPIC = int(os.getenv("QUESTION_BANK_MAX_PER_TOPIC", "500"))
+
+# The quiz route and roadmap quiz nodes use different difficulty scales
+DIFFICULTY_LEVELS = {"easy": "beginner", "medium": "intermediate", "hard": "advanced"}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_topic(title: str) -> str:
+    return " ".join(_WORD.findall(title.lower()))
+
+
+def normalize_difficulty(difficulty: str) -> str:
+    difficulty = difficulty.strip().lower()
+    return DIFFICULTY_LEVELS.get(difficulty, difficulty)
+
+
+def question_terms(question: str) -> FrozenSet[str]:
+    """Words that identify a question; used for near-duplicate detection."""
+    return frozenset(word for word in _WORD.findall(question.lower()) if len(word) > 2)
+
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    return len(a & b) / len(a | b)
+
+
+def is_storable(question: Any) -> bool:
+    """Only complete questions (text, 4 options, an answer in range, explanation) go into stock."""
+    if not isinstance(question, dict):
+        return False
+    options = question.get("options")
+    answer = question.get("correctAnswer")
+    return (
+        isinstance(question.get("question"), str) and question["question"].strip() != ""
+        and isinstance(question.get("explanation"), str)
+        and isinstance(options, list) and len(options) == 4 and all(isinstance(o, str) for o in options)
+        and isinstance(answer, int) and not isinstance(answer, bool) and 0 <= answer < 4
+    )
+
+
+class QuestionBank:
+    """SQLite question store; public methods are async and run the queries off the event loop."""
+
+    def __init__(self, path: Path = BANK_PATH, enabled: bool = BANK_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.requests = 0
+        self.full_hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.served = 0
+        self.added = 0
+        self.duplicates = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                "id TEXT PRIMARY KEY, topic TEXT NOT NULL, difficulty TEXT NOT NULL, "
+                "question TEXT NOT NULL, options TEXT NOT NULL, correct_answer INTEGER NOT NULL, "
+                "explanation TEXT NOT NULL, created_at REAL NOT NULL, served INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS questions_topic ON questions (topic, difficulty)")
+        return self._conn
+
+    # -------- Blocking helpers (run in a worker thread) --------
+
+    def _select(self, topic: str, difficulty: str, count: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT id, question, options, correct_answer, explanation FROM questions "
+                "WHERE topic = ? AND difficulty = ?",
+                (topic, difficulty),
+            ).fetchall()
+            chosen = random.sample(rows, min(count, len(rows)))
+            if chosen:
+                conn.executemany("UPDATE questions SET served = served + 1 WHERE id = ?", [(row[0],) for row in chosen])
+                conn.commit()
+        return [
+            {"id": row[0], "question": row[1], "options": json.loads(row[2]), "correctAnswer": row[3], "explanation": row[4]}
+            for row in chosen
+        ]
+
+    def _insert(self, topic: str, difficulty: str, questions: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        with self._lock:
+            conn = self._connect()
+            existing = [
+                question_terms(row[0])
+                for row in conn.execute(
+                    "SELECT question FROM questions WHERE topic = ? AND difficulty = ?", (topic, difficulty)
+                )
+            ]
+            added, duplicates = [], 0
+            now = time.time()
+            for question in questions:
+                if not is_storable(question):
+                    continue
+                terms = question_terms(question["question"])
+                if any(similarity(terms, other) >= DUPLICATE_THRESHOLD for other in existing):
+                    duplicates += 1
+                    continue
+                existing.append(terms)
+                stored = {
+                    "id": uuid.uuid4().hex,
+                    "question": question["question"],
+                    "options": question["options"],
+                    "correctAnswer": question["correctAnswer"],
+                    "explanation": question["explanation"],
+                }
+                conn.execute(
+                    "INSERT INTO questions (id, topic, difficulty, question, options, correct_answer, explanation, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (stored["id"], topic, difficulty, stored["question"], json.dumps(stored["options"]),
+                     stored["correctAnswer"], stored["explanation"], now),
+                )
+                added.append(stored)
+            # Keep the most served questions when a topic outgrows its limit
+            conn.execute(
+                "DELETE FROM questions WHERE id IN ("
+                "SELECT id FROM questions WHERE topic = ? AND difficulty = ? "
+                "ORDER BY served DESC, created_at DESC LIMIT -1 OFFSET ?)",
+                (topic, difficulty, MAX_PER_TOPIC),
+            )
+            conn.commit()
+        return added, duplicates
+
+    # -------- Public API --------
+
+    async def take(self, title: str, difficulty: str, count: int) -> List[Dict[str, Any]]:
+        """Up to `count` random stocked questions for the topic (fewer when stock runs short)."""
+        if not self.enabled:
+            return []
+        try:
+            stock = await asyncio.to_thread(
+                self._select, normalize_topic(title), normalize_difficulty(difficulty), count
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Question bank read failed: {e}")
+            stock = []
+        self.requests += 1
+        self.served += len(stock)
+        if len(stock) >= count:
+            self.full_hits += 1
+        elif stock:
+            self.partial_hits += 1
+        else:
+            self.misses += 1
+        return stock
+
+    async def add(self, title: str, difficulty: str, questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Store new questions; returns the ones kept (with bank ids), dropping
+        duplicates of stocked questions and incomplete ones. With the bank
+        disabled or unavailable the questions are returned unchanged.
+        """
+        if not self.enabled or not questions:
+            return questions
+        try:
+            added, duplicates = await asyncio.to_thread(
+                self._insert, normalize_topic(title), normalize_difficulty(difficulty), questions
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Question bank write failed: {e}")
+            return questions
+        self.added += len(added)
+        self.duplicates += duplicates
+        if duplicates:
+            logger.info(f"Question bank: skipped {duplicates} duplicate question(s) for '{title}'")
+        return added
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "full_hits": self.full_hits,
+            "partial_hits": self.partial_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.full_hits / self.requests, 3) if self.requests else 0.0,
+            "questions_served": self.served,
+            "questions_added": self.added,
+            "duplicates_skipped": self.duplicates,
+        }
+
+
+# Global question bank
+question_bank = QuestionBank()
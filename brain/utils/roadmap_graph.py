@@ -0,0 +1,369 @@
+# utils/roadmap_graph.py
+"""
+Validation and repair of roadmap graphs (React Flow nodes + edges).
+
+`repair_graph` builds id/adjacency indexes once and fixes, in order:
+
+1. invalid edges - missing source/target, dangling references, self loops,
+   edges into the start node or out of the end node, duplicates;
+2. orphaned nodes - either rebuilt as a linear path (when the model produced
+   too few usable edges) or wired to their neighbours in list order;
+3. start/end connectivity - start gets an outgoing and end an incoming edge;
+4. reachability - every node is reachable from start and can reach end;
+5. cycles - back edges found by a DFS from start are removed.
+
+Every change is recorded in a `RepairReport` instead of being printed.
+
+`CompactRoadmapBuilder` covers the compact generation mode, where the model
+only writes (type, label, description) steps and ids, edges and positions are
+synthesized here.
+Each step is linear in the size of the graph, so large imported roadmaps go
+through the same path as the 12-15 node roadmaps generated by the model.
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+START_TYPE = "start"
+END_TYPE = "end"
+
+
+class RepairAction(BaseModel):
+    kind: str
+    source: Optional[str] = None
+    target: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class RepairReport(BaseModel):
+    nodes: int = 0
+    input_edges: int = 0
+    output_edges: int = 0
+    counts: Dict[str, int] = {}
+    actions: List[RepairAction] = []
+    linear_rebuild: bool = False
+
+    def record(self, kind: str, source: Optional[str] = None, target: Optional[str] = None,
+               detail: Optional[str] = None):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        self.actions.append(RepairAction(kind=kind, source=source, target=target, detail=detail))
+
+    @property
+    def repaired(self) -> bool:
+        return bool(self.actions)
+
+    def summary(self) -> str:
+        fixes = ", ".join(f"{kind}={count}" for kind, count in sorted(self.counts.items())) or "none"
+        return f"{self.nodes} nodes, {self.input_edges} → {self.output_edges} edges; fixes: {fixes}"
+
+
+def _edge(source: str, target: str) -> Dict[str, str]:
+    return {"id": f"e{source}-{target}", "source": source, "target": target}
+
+
+class _Graph:
+    """Edge list with adjacency and in/out-degree indexes kept in sync."""
+
+    def __init__(self, order: List[str]):
+        self.order = order
+        self.index = {node_id: i for i, node_id in enumerate(order)}
+        self.edges: List[Dict[str, Any]] = []
+        self.pairs: Set[Tuple[str, str]] = set()
+        self.out: Dict[str, List[str]] = defaultdict(list)
+        self.incoming: Dict[str, int] = defaultdict(int)
+
+    def add(self, edge: Dict[str, Any]) -> bool:
+        pair = (edge["source"], edge["target"])
+        if pair in self.pairs:
+            return False
+        self.pairs.add(pair)
+        self.edges.append(edge)
+        self.out[pair[0]].append(pair[1])
+        self.incoming[pair[1]] += 1
+        return True
+
+    def connected(self, node_id: str) -> bool:
+        return bool(self.out.get(node_id)) or self.incoming.get(node_id, 0) > 0
+
+    def remove_pairs(self, pairs: Set[Tuple[str, str]]):
+        self.edges = [e for e in self.edges if (e["source"], e["target"]) not in pairs]
+        for source, target in pairs:
+            self.pairs.discard((source, target))
+            self.out[source].remove(target)
+            self.incoming[target] -= 1
+
+
+def repair_graph(nodes: List[Dict[str, Any]], edges: List[Any]) -> Tuple[List[Dict[str, Any]], RepairReport]:
+    """
+    Validate and repair `edges` against `nodes` (which must already have unique ids).
+
+    Returns the repaired edge list and a report of every change made.
+    """
+    order = [node["id"] for node in nodes]
+    types = {node["id"]: node.get("type") for node in nodes}
+    start_id = next((node_id for node_id in order if types[node_id] == START_TYPE), None)
+    end_id = next((node_id for node_id in order if types[node_id] == END_TYPE), None)
+    learning = [node_id for node_id in order if types[node_id] not in (START_TYPE, END_TYPE)]
+
+    report = RepairReport(nodes=len(order), input_edges=len(edges))
+    graph = _Graph(order)
+
+    # Step 1: keep only well-formed edges between existing nodes
+    for i, edge in enumerate(edges):
+        if not isinstance(edge, dict) or "source" not in edge or "target" not in edge:
+            report.record("malformed_edge", detail=f"edge {i}")
+            continue
+        source, target = str(edge["source"]), str(edge["target"])
+        if source not in graph.index or target not in graph.index:
+            report.record("dangling_edge", source, target)
+            continue
+        if source == target:
+            report.record("self_loop", source, target)
+            continue
+        if target == start_id or source == end_id:
+            report.record("edge_against_flow", source, target)
+            continue
+        fixed = {**edge, "source": source, "target": target}
+        if "id" not in fixed:
+            fixed["id"] = f"e{source}-{target}"
+            report.record("edge_id_added", source, target)
+        if not graph.add(fixed):
+            report.record("duplicate_edge", source, target)
+
+    # Step 2: orphaned nodes
+    orphans = [node_id for node_id in order if not graph.connected(node_id)]
+    if orphans:
+        if len(graph.edges) < len(order) - 1:
+            # Too little usable structure: fall back to a complete linear path
+            report.linear_rebuild = True
+            report.record("linear_rebuild", detail=f"{len(graph.edges)} usable edges for {len(order)} nodes")
+            graph = _Graph(order)
+            for source, target in zip(order, order[1:]):
+                graph.add(_edge(source, target))
+        else:
+            for orphan in orphans:
+                for source, target in _orphan_links(orphan, order, graph.index, types, learning):
+                    if (source == end_id or target == start_id) or not graph.add(_edge(source, target)):
+                        continue
+                    report.record("orphan_connected", source, target)
+
+    # Step 3: start needs an outgoing and end an incoming edge
+    if start_id is not None and learning and not graph.out.get(start_id):
+        if graph.add(_edge(start_id, learning[0])):
+            report.record("start_connected", start_id, learning[0])
+    if end_id is not None and learning and not graph.incoming.get(end_id):
+        if graph.add(_edge(learning[-1], end_id)):
+            report.record("end_connected", learning[-1], end_id)
+
+    # Step 4: everything reachable from the root
+    root = start_id if start_id is not None else (order[0] if order else None)
+    if root is not None:
+        reachable: Set[str] = set()
+        _mark_reachable(root, graph.out, reachable)
+        last_reachable = root
+        for node_id in order:
+            if node_id in reachable:
+                last_reachable = node_id
+                continue
+            source = last_reachable if last_reachable != end_id else root
+            if graph.add(_edge(source, node_id)):
+                report.record("unreachable_connected", source, node_id)
+            # The node and everything below it is reachable now
+            _mark_reachable(node_id, graph.out, reachable)
+            last_reachable = node_id
+
+    # Step 5: break cycles, then make sure every node can still reach the end
+    if root is not None:
+        back_edges = _back_edges(root, order, graph.out)
+        if back_edges:
+            graph.remove_pairs(back_edges)
+            for source, target in back_edges:
+                report.record("cycle_broken", source, target)
+    if end_id is not None:
+        for node_id in order:
+            if node_id != end_id and not graph.out.get(node_id):
+                if graph.add(_edge(node_id, end_id)):
+                    report.record("sink_connected_to_end", node_id, end_id)
+
+    report.output_edges = len(graph.edges)
+    return graph.edges, report
+
+
+def _orphan_links(orphan: str, order: List[str], index: Dict[str, int], types: Dict[str, Any],
+                  learning: List[str]) -> List[Tuple[str, str]]:
+    """Edges that attach an orphan to the path, based on its type and list position."""
+    if types[orphan] == START_TYPE:
+        return [(orphan, learning[0])] if learning else []
+    if types[orphan] == END_TYPE:
+        return [(learning[-1], orphan)] if learning else []
+    position = index[orphan]
+    links = []
+    if position > 0:
+        links.append((order[position - 1], orphan))
+    if position < len(order) - 1:
+        links.append((orphan, order[position + 1]))
+    return links
+
+
+def _mark_reachable(root: str, out: Dict[str, List[str]], seen: Set[str]):
+    """Add everything reachable from `root` to `seen`, without revisiting nodes already in it."""
+    if root in seen:
+        return
+    seen.add(root)
+    stack = [root]
+    while stack:
+        for target in out.get(stack.pop(), ()):
+            if target not in seen:
+                seen.add(target)
+                stack.append(target)
+
+
+def _back_edges(root: str, order: List[str], out: Dict[str, List[str]]) -> Set[Tuple[str, str]]:
+    """Edges closing a cycle, found by an iterative DFS from `root` (then any unvisited node)."""
+    WHITE, GREY, BLACK = 0, 1, 2
+    colour = dict.fromkeys(order, WHITE)
+    back = set()
+    for start in [root] + order:
+        if colour[start] != WHITE:
+            continue
+        colour[start] = GREY
+        stack = [(start, iter(out.get(start, ())))]
+        while stack:
+            node_id, children = stack[-1]
+            for target in children:
+                if colour[target] == GREY:
+                    back.add((node_id, target))
+                elif colour[target] == WHITE:
+                    colour[target] = GREY
+                    stack.append((target, iter(out.get(target, ()))))
+                    break
+            else:
+                colour[node_id] = BLACK
+                stack.pop()
+    return back
+
+
+# -------- Compact roadmaps --------
+
+NODE_TYPES = {"start", "course", "milestone", "project", "concept", "topic", "step", "quiz", "end"}
+LAYER_X_GAP = 250
+ROW_Y_GAP = 200
+BASE_X = 100
+BASE_Y = 300
+
+
+class CompactRoadmapBuilder:
+    """
+    Turn compact model output into React Flow nodes and edges.
+
+    In compact mode the model only writes the learning steps, in order:
+        {"steps": [{"type": "topic", "label": "...", "description": "...",
+                    "children": [<step>, ...]}, ...]}
+    Steps follow each other; a step's optional `children` are parallel branches
+    after it that all lead into the next step. The builder synthesizes the
+    start/end nodes, ids (`start`, `1`, `2`, ..., `end`), `e{source}-{target}`
+    edges and positions from a layered layout (x by longest path from start,
+    y centred per layer). Positions of a step's subtree are final once the
+    step is added, so nodes can be streamed as the model produces them.
+    """
+
+    def __init__(self, start_label: str = "Start", end_label: str = "Goal Achieved"):
+        self.nodes: List[Dict[str, Any]] = []
+        self.edges: List[Dict[str, str]] = []
+        self.end_label = end_label
+        self._next_id = 1
+        self._layers: Dict[str, int] = {}
+        self._tails: List[str] = []
+        self._ended = False
+        start = self._node("start", "start", start_label, "Begin your learning journey")
+        self._layers["start"] = 0
+        self._place([start])
+        self._tails = ["start"]
+
+    @property
+    def learning_nodes(self) -> int:
+        return sum(1 for node in self.nodes if node["type"] not in (START_TYPE, END_TYPE))
+
+    def add(self, item: Any) -> List[Dict[str, Any]]:
+        """Add one top-level step (and its branches); returns the new, positioned nodes."""
+        if not isinstance(item, dict) or self._ended:
+            return []
+        if item.get("type") == START_TYPE:
+            # The start node already exists: keep the model's wording only
+            self._relabel(self.nodes[0], item)
+            return []
+        if item.get("type") == END_TYPE:
+            self.end_label = str(item.get("label") or self.end_label)
+            return []
+        added: List[Dict[str, Any]] = []
+        self._tails = self._build(item, self._tails, added)
+        self._place(added)
+        return added
+
+    def finish(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+        """Add the end node and return all nodes and edges."""
+        if not self._ended:
+            end = self._node("end", "end", self.end_label, "Congratulations on completing the roadmap")
+            self._link(self._tails, end)
+            self._place([end])
+            self._ended = True
+        return self.nodes, self.edges
+
+    def _build(self, item: Dict[str, Any], predecessors: List[str], added: List[Dict[str, Any]]) -> List[str]:
+        node_type = str(item.get("type") or "topic").lower()
+        if node_type not in NODE_TYPES or node_type in (START_TYPE, END_TYPE):
+            node_type = "topic"
+        label = str(item.get("label") or item.get("title") or f"Learning Topic {self._next_id}")
+        description = str(item.get("description") or f"Learn about {label}")
+        node = self._node(str(self._next_id), node_type, label, description)
+        self._next_id += 1
+        self._link(predecessors, node)
+        added.append(node)
+
+        children = [child for child in item.get("children") or [] if isinstance(child, dict)]
+        if not children:
+            return [node["id"]]
+        tails: List[str] = []
+        for child in children:
+            tails.extend(self._build(child, [node["id"]], added))
+        return tails
+
+    def _node(self, node_id: str, node_type: str, label: str, description: str) -> Dict[str, Any]:
+        node = {
+            "id": node_id,
+            "type": node_type,
+            "data": {"label": label, "description": description},
+            "position": {"x": 0, "y": 0},
+        }
+        self.nodes.append(node)
+        return node
+
+    def _link(self, predecessors: List[str], node: Dict[str, Any]):
+        self._layers[node["id"]] = max(self._layers[p] for p in predecessors) + 1
+        for source in predecessors:
+            self.edges.append(_edge(source, node["id"]))
+
+    def _place(self, nodes: List[Dict[str, Any]]):
+        rows: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+        for node in nodes:
+            rows[self._layers[node["id"]]].append(node)
+        for layer, layer_nodes in rows.items():
+            offset = (len(layer_nodes) - 1) / 2
+            for row, node in enumerate(layer_nodes):
+                node["position"] = {"x": BASE_X + layer * LAYER_X_GAP, "y": round(BASE_Y + (row - offset) * ROW_Y_GAP)}
+
+    @staticmethod
+    def _relabel(node: Dict[str, Any], item: Dict[str, Any]):
+        if item.get("label"):
+            node["data"]["label"] = str(item["label"])
+        if item.get("description"):
+            node["data"]["description"] = str(item["description"])
+
+
+def build_compact_roadmap(steps: List[Any], **labels) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+    """Nodes and edges for a complete list of compact steps."""
+    builder = CompactRoadmapBuilder(**labels)
+    for step in steps:
+        builder.add(step)
+    return builder.finish()
@@ -0,0 +1,362 @@
+# utils/semantic_cache.py
+"""
+Semantic cache for free-text prompts.
+
+The response cache in `utils.llm_cache` only matches identical prompts, while
+"learn python for data science" and "python data science roadmap" ask for the
+same roadmap. Here prompts are embedded with a local Ollama embedding model
+and compared by cosine similarity against the prompts already answered; when
+the best match reaches SEMANTIC_CACHE_THRESHOLD its stored value is served.
+
+Vectors are kept normalized in one NumPy matrix per namespace (a namespace
+separates values that are not interchangeable, e.g. roadmaps from different
+system prompts), so a lookup is a single matrix-vector product. Entries are
+persisted to SQLite and the index is rebuilt from it on first use after a
+restart; values stay on disk and are only read on a hit. Prompts that match
+an entry verbatim (after normalizing case and whitespace) skip the embedding.
+
+Configuration (environment):
+    SEMANTIC_CACHE_ENABLED        serve and store semantic matches (default true)
+    SEMANTIC_CACHE_MODEL          Ollama embedding model (default nomic-embed-text)
+    SEMANTIC_CACHE_THRESHOLD      cosine similarity needed for a hit (default 0.9)
+    SEMANTIC_CACHE_MAX_ENTRIES    entries per namespace, least recently used evicted (default 5000)
+    SEMANTIC_CACHE_PATH           SQLite file (default <BRAIN_CACHE_DIR>/semantic_cache.sqlite3)
+    SEMANTIC_CACHE_EMBED_TIMEOUT  seconds to wait for an embedding, admission included, before
+                                  treating it as a miss (default 10)
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils import llm_gateway
+from utils.llm_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+EMBED_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "nomic-embed-text")
+THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+CACHE_PATH = Path(os.getenv("SEMANTIC_CACHE_PATH", CACHE_DIR / "semantic_cache.sqlite3"))
+EMBED_TIMEOUT = float(os.getenv("SEMANTIC_CACHE_EMBED_TIMEOUT", "10"))
+
+# Best matches this far below the threshold are counted as near misses, to help tune it
+NEAR_MISS_MARGIN = 0.05
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class SemanticQuery:
+    """A looked-up prompt: its embedding and, on a hit, the stored value."""
+
+    def __init__(self, namespace: str, text: str):
+        self.namespace = namespace
+        self.text = normalize_text(text)
+        self.vector: Optional[np.ndarray] = None
+        self.value: Optional[Any] = None
+        self.similarity: Optional[float] = None
+        self.matched: Optional[str] = None
+
+    @property
+    def hit(self) -> bool:
+        return self.value is not None
+
+
+class VectorIndex:
+    """Normalized vectors of one namespace, in a matrix that grows by doubling."""
+
+    def __init__(self, dims: int):
+        self.dims = dims
+        self.vectors = np.zeros((16, dims), dtype=np.float32)
+        self.ids: List[int] = []
+        self.texts: List[str] = []
+        self.last_used = np.zeros(16, dtype=np.float64)
+        self.by_text: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, entry_id: int, text: str, vector: np.ndarray, last_used: float):
+        row = len(self.ids)
+        if row == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.last_used = np.concatenate([self.last_used, np.zeros_like(self.last_used)])
+        self.vectors[row] = vector
+        self.last_used[row] = last_used
+        self.ids.append(entry_id)
+        self.texts.append(text)
+        self.by_text[text] = row
+
+    def remove(self, row: int) -> int:
+        """Remove a row by moving the last row into its place; returns the removed entry id."""
+        last = len(self.ids) - 1
+        entry_id = self.ids[row]
+        del self.by_text[self.texts[row]]
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.last_used[row] = self.last_used[last]
+            self.ids[row] = self.ids[last]
+            self.texts[row] = self.texts[last]
+            self.by_text[self.texts[row]] = row
+        self.ids.pop()
+        self.texts.pop()
+        return entry_id
+
+    def remove_id(self, entry_id: int) -> bool:
+        """Remove the row of `entry_id` if it is still indexed."""
+        try:
+            row = self.ids.index(entry_id)
+        except ValueError:
+            return False
+        self.remove(row)
+        return True
+
+    def best(self, vector: np.ndarray) -> Tuple[int, float]:
+        """Row and cosine similarity of the closest vector."""
+        similarities = self.vectors[:len(self.ids)] @ vector
+        row = int(np.argmax(similarities))
+        return row, float(similarities[row])
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        path: Path = CACHE_PATH,
+        model: str = EMBED_MODEL,
+        threshold: float = THRESHOLD,
+        max_entries: int = MAX_ENTRIES,
+        enabled: bool = SEMANTIC_CACHE_ENABLED,
+    ):
+        self.path = path
+        self.model = model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._indexes: Dict[str, VectorIndex] = {}
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.exact_hits = 0
+        self.near_misses = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.embed_failures = 0
+        self.embed_ms = 0.0
+        self.embeddings = 0
+
+    # -------- SQLite (run in a worker thread) --------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, namespace TEXT NOT NULL, text TEXT NOT NULL, "
+                "model TEXT NOT NULL, vector BLOB NOT NULL, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+        return self._conn
+
+    def _read_all(self) -> List[Tuple[int, str, str, bytes, float]]:
+        with self._db_lock:
+            return self._connect().execute(
+                "SELECT id, namespace, text, vector, last_used FROM entries WHERE model = ? ORDER BY id",
+                (self.model,),
+            ).fetchall()
+
+    def _read_value(self, entry_id: int, now: float) -> Optional[str]:
+        with self._db_lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value FROM entries WHERE id = ?", (entry_id,)).fetchone()
+            conn.execute("UPDATE entries SET last_used = ? WHERE id = ?", (now, entry_id))
+            conn.commit()
+        return row[0] if row else None
+
+    def _write(self, query: SemanticQuery, value: str, now: float, replaced: List[int]) -> int:
+        with self._db_lock:
+            conn = self._connect()
+            if replaced:
+                conn.executemany("DELETE FROM entries WHERE id = ?", [(i,) for i in replaced])
+            cursor = conn.execute(
+                "INSERT INTO entries (namespace, text, model, vector, value, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (query.namespace, query.text, self.model, query.vector.tobytes(), value, now, now),
+            )
+            conn.commit()
+            return cursor.lastrowid
+
+    # -------- Index --------
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                rows = await asyncio.to_thread(self._read_all)
+            except sqlite3.Error as e:
+                logger.warning(f"Semantic cache load failed: {e}")
+                rows = []
+            for entry_id, namespace, text, blob, last_used in rows:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                index = self._index(namespace, len(vector))
+                if index is None:
+                    continue
+                if text in index.by_text:
+                    index.remove(index.by_text[text])
+                index.add(entry_id, text, vector, last_used)
+            self._loaded = True
+            if rows:
+                logger.info(f"Semantic cache: loaded {len(rows)} entries from {self.path}")
+
+    def _index(self, namespace: str, dims: int) -> Optional[VectorIndex]:
+        index = self._indexes.get(namespace)
+        if index is None:
+            index = self._indexes[namespace] = VectorIndex(dims)
+        elif index.dims != dims:
+            return None
+        return index
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        started = time.perf_counter()
+        try:
+            # The deadline covers the wait for an admission slot too: a lookup
+            # must not hold up the generation it could have saved
+            vectors = await asyncio.wait_for(
+                llm_gateway.embed(self.model, [text], timeout=EMBED_TIMEOUT), timeout=EMBED_TIMEOUT
+            )
+        except Exception as e:
+            self.embed_failures += 1
+            logger.warning(f"Semantic cache: embedding with '{self.model}' failed: {str(e) or type(e).__name__}")
+            return None
+        self.embed_ms += (time.perf_counter() - started) * 1000
+        self.embeddings += 1
+        vector = np.asarray(vectors[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    # -------- Public API --------
+
+    async def query(self, namespace: str, text: str, lookup: bool = True, store: bool = True) -> SemanticQuery:
+        """
+        Embed `text` and, with `lookup`, find the closest stored prompt in
+        `namespace`; the returned query carries the value on a hit and is
+        passed to `store` on a miss. Without `lookup` or `store` nothing is embedded.
+        """
+        query = SemanticQuery(namespace, text)
+        if not self.enabled or not (lookup or store):
+            return query
+        await self._ensure_loaded()
+        index = self._indexes.get(namespace)
+
+        if lookup and index is not None and query.text in index.by_text:
+            if await self._serve(query, index, index.by_text[query.text], 1.0):
+                self.exact_hits += 1
+                return query
+
+        query.vector = await self._embed(query.text)
+        if not lookup or query.vector is None:
+            return query
+
+        self.lookups += 1
+        index = self._indexes.get(namespace)
+        if index is not None and len(index) and index.dims == len(query.vector):
+            row, similarity = index.best(query.vector)
+            query.similarity = round(similarity, 4)
+            if similarity >= self.threshold and await self._serve(query, index, row, similarity):
+                self.hits += 1
+                return query
+            if similarity >= self.threshold - NEAR_MISS_MARGIN:
+                self.near_misses += 1
+        self.misses += 1
+        return query
+
+    async def _serve(self, query: SemanticQuery, index: VectorIndex, row: int, similarity: float) -> bool:
+        now = time.time()
+        try:
+            value = await asyncio.to_thread(self._read_value, index.ids[row], now)
+        except sqlite3.Error as e:
+            logger.warning(f"Semantic cache read failed: {e}")
+            return False
+        if value is None:
+            return False
+        index.last_used[row] = now
+        query.value = json.loads(value)
+        query.similarity = round(similarity, 4)
+        query.matched = index.texts[row]
+        return True
+
+    async def store(self, query: SemanticQuery, value: Any):
+        """Store `value` as the answer to the query's prompt."""
+        if not self.enabled or query.vector is None:
+            return
+        index = self._index(query.namespace, len(query.vector))
+        if index is None:
+            return
+        # Rows to replace: the prompt's previous entry and the least recently used
+        # beyond the limit. They leave the index only once the write has committed.
+        replaced = []
+        if query.text in index.by_text:
+            replaced.append(index.ids[index.by_text[query.text]])
+        excess = len(index) - len(replaced) + 1 - self.max_entries
+        if excess > 0:
+            by_age = np.argsort(index.last_used[:len(index)])
+            replaced += [index.ids[row] for row in by_age if index.ids[row] not in replaced][:excess]
+
+        now = time.time()
+        try:
+            entry_id = await asyncio.to_thread(self._write, query, json.dumps(value), now, replaced)
+        except sqlite3.Error as e:
+            logger.warning(f"Semantic cache write failed: {e}")
+            return
+        for replaced_id in replaced:
+            index.remove_id(replaced_id)
+        if excess > 0:
+            self.evictions += excess
+        if query.text in index.by_text:
+            # Stored concurrently by another request for the same prompt
+            index.remove(index.by_text[query.text])
+        index.add(entry_id, query.text, query.vector, now)
+        self.stores += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        served = self.hits + self.exact_hits
+        requests = self.lookups + self.exact_hits
+        return {
+            "enabled": self.enabled,
+            "model": self.model,
+            "threshold": self.threshold,
+            "lookups": requests,
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "near_misses": self.near_misses,
+            "misses": self.misses,
+            "hit_ratio": round(served / requests, 3) if requests else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "embed_failures": self.embed_failures,
+            "avg_embed_ms": round(self.embed_ms / self.embeddings, 2) if self.embeddings else 0.0,
+            "entries": {namespace: len(index) for namespace, index in self._indexes.items()},
+            "max_entries": self.max_entries,
+        }
+
+
+# Global semantic cache
+semantic_cache = SemanticCache()
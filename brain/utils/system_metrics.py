@@ -0,0 +1,16 @@
+# utils/system_metrics.py
+"""psutil readings shared by the performance monitor and the model scheduler."""
+from typing import Any, Dict
+
+import psutil
+
+
+def get_memory_metrics() -> Dict[str, Any]:
+    """Current system memory usage (non-blocking, unlike cpu_percent(interval=1))."""
+    memory = psutil.virtual_memory()
+    return {
+        "total_gb": round(memory.total / (1024**3), 2),
+        "used_gb": round(memory.used / (1024**3), 2),
+        "available_gb": round(memory.available / (1024**3), 2),
+        "percent": memory.percent
+    }
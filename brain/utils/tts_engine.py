@@ -0,0 +1,295 @@
+# utils/tts_engine.py
+"""
+Concurrent edge-tts synthesis for the TTS routes.
+
+`synthesize` streams MP3 chunks straight from edge-tts as they arrive, with no
+temp file in between, so the route can forward them into its response and the
+first audio reaches the client while the rest is still being synthesized.
+Requests run concurrently; each voice allows at most TTS_PER_VOICE_CONCURRENCY
+syntheses at a time (edge-tts opens one websocket per request, and the
+service throttles bursts per voice), and the others wait for a slot.
+
+Long texts go through `synthesize_segments` instead: the text is split at
+paragraph and sentence boundaries (the first segment is a single sentence),
+up to TTS_SEGMENT_CONCURRENCY segments are synthesized ahead in parallel
+(never more than half the voice's slots, so long texts cannot take them all
+from short requests), and each segment's audio is yielded in order as soon
+as it and all before it are done. Time to first audio is then that of one
+sentence, whatever the length of the text, and a failed segment is retried
+on its own instead of failing (or re-running) the whole synthesis.
+
+Configuration (environment):
+    TTS_ENGINE                   backend when a request names none: "edge" or "piper" (default edge)
+    TTS_PER_VOICE_CONCURRENCY    concurrent syntheses per voice (default 4)
+    TTS_TIMEOUT_SECONDS          deadline for a complete synthesis (default 60)
+    TTS_PIPELINE_MIN_CHARS       texts longer than this are pipelined by default (default 400)
+    TTS_SEGMENT_MAX_CHARS        longest segment (default 300)
+    TTS_SEGMENT_CONCURRENCY      segments synthesized ahead per request, at most half of
+                                 TTS_PER_VOICE_CONCURRENCY (default 2)
+    TTS_SEGMENT_RETRIES          retries of a failed segment (default 2)
+    TTS_SEGMENT_TIMEOUT_SECONDS  deadline for one segment attempt (default 30)
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import deque
+from contextlib import aclosing, asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+import edge_tts
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENGINE = os.getenv("TTS_ENGINE", "edge").lower()
+PER_VOICE_CONCURRENCY = int(os.getenv("TTS_PER_VOICE_CONCURRENCY", "4"))
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT_SECONDS", "60"))
+PIPELINE_MIN_CHARS = int(os.getenv("TTS_PIPELINE_MIN_CHARS", "400"))
+SEGMENT_MAX_CHARS = int(os.getenv("TTS_SEGMENT_MAX_CHARS", "300"))
+SEGMENT_CONCURRENCY = int(os.getenv("TTS_SEGMENT_CONCURRENCY", "2"))
+SEGMENT_RETRIES = int(os.getenv("TTS_SEGMENT_RETRIES", "2"))
+SEGMENT_TIMEOUT = float(os.getenv("TTS_SEGMENT_TIMEOUT_SECONDS", "30"))
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_CLAUSE_END = re.compile(r"(?<=[,;:])\s+")
+
+# Spelled out for better pronunciation
+ABBREVIATIONS = {
+    "JS": "JavaScript",
+    "API": "A P I",
+    "HTML": "H T M L",
+    "CSS": "C S S",
+    "DOM": "D O M",
+}
+
+
+class TTSError(Exception):
+    pass
+
+
+class TTSTimeoutError(TTSError):
+    pass
+
+
+def prepare_text(text: str) -> str:
+    """Clean text for speech: end on punctuation for a natural close, expand abbreviations."""
+    clean_text = text.strip()
+    if not clean_text.endswith(('.', '!', '?')):
+        clean_text += '.'
+    for abbreviation, spoken in ABBREVIATIONS.items():
+        clean_text = clean_text.replace(abbreviation, spoken)
+    return clean_text
+
+
+class VoiceLimiter:
+    """Per-voice concurrency limit with counters for the metrics endpoint."""
+
+    def __init__(self, per_voice: int):
+        self.per_voice = per_voice
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.active: Dict[str, int] = {}
+        self.waiting: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def slot(self, voice: str):
+        semaphore = self._semaphores.setdefault(voice, asyncio.Semaphore(self.per_voice))
+        self.waiting[voice] = self.waiting.get(voice, 0) + 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting[voice] -= 1
+        self.active[voice] = self.active.get(voice, 0) + 1
+        try:
+            yield
+        finally:
+            self.active[voice] -= 1
+            semaphore.release()
+
+
+voice_limiter = VoiceLimiter(PER_VOICE_CONCURRENCY)
+
+
+class TTSStats:
+    def __init__(self):
+        self.requests = 0
+        self.completed = 0
+        self.failed = 0
+        self.bytes = 0
+        self.first_byte_ms = 0.0
+        self.total_ms = 0.0
+        self.pipelined = 0
+        self.segments = 0
+        self.segment_retries = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "completed": self.completed,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "avg_first_byte_ms": round(self.first_byte_ms / self.completed, 2) if self.completed else 0.0,
+            "avg_total_ms": round(self.total_ms / self.completed, 2) if self.completed else 0.0,
+            "pipelined": self.pipelined,
+            "segments": self.segments,
+            "segment_retries": self.segment_retries,
+            "active": {voice: n for voice, n in voice_limiter.active.items() if n},
+            "waiting": {voice: n for voice, n in voice_limiter.waiting.items() if n},
+            "per_voice_concurrency": voice_limiter.per_voice,
+        }
+
+
+tts_stats = TTSStats()
+
+
+def prosody(rate: Optional[str] = None, volume: Optional[str] = None, pitch: Optional[str] = None) -> Dict[str, str]:
+    """edge-tts prosody settings, with the service defaults for unset values."""
+    return {"rate": rate or "+0%", "volume": volume or "+0%", "pitch": pitch or "+0Hz"}
+
+
+async def synthesize(
+    text: str,
+    voice: str,
+    timeout: Optional[float] = None,
+    rate: Optional[str] = None,
+    volume: Optional[str] = None,
+    pitch: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Stream the MP3 audio for `text` (already prepared) as edge-tts delivers it.
+
+    Holds the voice's slot for the whole stream; `timeout` (default
+    TTS_TIMEOUT_SECONDS) is a deadline for the complete synthesis, waiting for
+    the slot included.
+    """
+    started = time.perf_counter()
+    deadline = started + (timeout or TTS_TIMEOUT)
+    tts_stats.requests += 1
+    first_byte_ms = None
+    size = 0
+    try:
+        async with voice_limiter.slot(voice), aclosing(
+            edge_tts.Communicate(text, voice, **prosody(rate, volume, pitch)).stream()
+        ) as messages:
+            while True:
+                try:
+                    message = await asyncio.wait_for(messages.__anext__(), timeout=deadline - time.perf_counter())
+                except StopAsyncIteration:
+                    break
+                if message["type"] != "audio" or not message["data"]:
+                    continue
+                if first_byte_ms is None:
+                    first_byte_ms = (time.perf_counter() - started) * 1000
+                size += len(message["data"])
+                yield message["data"]
+    except asyncio.TimeoutError:
+        tts_stats.failed += 1
+        raise TTSTimeoutError(f"Speech synthesis with '{voice}' timed out after {timeout or TTS_TIMEOUT}s")
+    except Exception:
+        tts_stats.failed += 1
+        raise
+
+    if not size:
+        tts_stats.failed += 1
+        raise TTSError(f"Speech synthesis with '{voice}' returned no audio")
+    tts_stats.completed += 1
+    tts_stats.bytes += size
+    tts_stats.first_byte_ms += first_byte_ms
+    tts_stats.total_ms += (time.perf_counter() - started) * 1000
+    logger.info(f"TTS {voice}: {size} bytes, first audio after {first_byte_ms:.0f}ms")
+
+
+def split_segments(text: str, max_chars: int = SEGMENT_MAX_CHARS) -> List[str]:
+    """
+    Split text at paragraph and sentence boundaries into segments of at most
+    `max_chars` (longer sentences are split at clauses, then words). The
+    first segment is the first sentence alone so audio can start early.
+    """
+    segments: List[str] = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        current = ""
+        for sentence in _SENTENCE_END.split(paragraph.strip()):
+            for piece in _split_long(sentence.strip(), max_chars):
+                if current and len(current) + 1 + len(piece) > max_chars:
+                    segments.append(current)
+                    current = ""
+                current = f"{current} {piece}" if current else piece
+                if not segments:
+                    segments.append(current)
+                    current = ""
+        if current:
+            segments.append(current)
+    return [segment for segment in segments if segment]
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    if len(sentence) <= max_chars:
+        return [sentence]
+    pieces: List[str] = []
+    current = ""
+    for part in _CLAUSE_END.split(sentence):
+        words = [part] if len(part) <= max_chars else part.split()
+        for word in words:
+            if current and len(current) + 1 + len(word) > max_chars:
+                pieces.append(current)
+                current = ""
+            current = f"{current} {word}" if current else word
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+async def synthesize_segments(
+    text: str,
+    voice: str,
+    rate: Optional[str] = None,
+    volume: Optional[str] = None,
+    pitch: Optional[str] = None,
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Stream the MP3 audio for a long `text` (already prepared) segment by
+    segment, in order, synthesizing up to `concurrency` segments ahead.
+    Segments are whole MP3 streams, so their audio concatenates cleanly.
+    """
+    segments = split_segments(text)
+    settings = {"rate": rate, "volume": volume, "pitch": pitch}
+    # At most half the voice's slots: two long requests still leave room for short ones
+    window = max(1, min(concurrency or SEGMENT_CONCURRENCY, voice_limiter.per_voice // 2))
+    tasks: Deque[asyncio.Task] = deque()
+    launched = 0
+    tts_stats.pipelined += 1
+    tts_stats.segments += len(segments)
+
+    def launch():
+        nonlocal launched
+        while launched < len(segments) and len(tasks) < window:
+            tasks.append(asyncio.create_task(_synthesize_segment(segments[launched], voice, launched, settings)))
+            launched += 1
+
+    try:
+        launch()
+        while tasks:
+            audio = await tasks.popleft()
+            launch()
+            yield audio
+    finally:
+        # Also reached when the consumer goes away: stop the synthesis ahead
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _synthesize_segment(text: str, voice: str, index: int, settings: Dict[str, Optional[str]]) -> bytes:
+    for attempt in range(SEGMENT_RETRIES + 1):
+        try:
+            return b"".join([chunk async for chunk in synthesize(text, voice, SEGMENT_TIMEOUT, **settings)])
+        except ValueError:
+            raise  # invalid rate / volume / pitch; retrying will not help
+        except Exception as e:
+            if attempt == SEGMENT_RETRIES:
+                raise
+            tts_stats.segment_retries += 1
+            logger.warning(f"TTS segment {index} with {voice} failed ({e}); retrying")
+            await asyncio.sleep(0.5 * (attempt + 1))
@@ -0,0 +1,192 @@
+# utils/web_cache.py
+"""
+Cache for web search results and scraped page content.
+
+Search results are cached per normalized query for WEB_SEARCH_CACHE_TTL_SECONDS,
+which saves the DuckDuckGo round-trips (and its rate limiting) for repeated
+queries. Pages are cached per URL as extracted content together with the
+response's ETag / Last-Modified validators: within WEB_PAGE_CACHE_TTL_SECONDS
+a page is served as-is; after that it is revalidated with a conditional
+request, and a 304 keeps the stored content without downloading the page
+again. Pages older than WEB_PAGE_CACHE_MAX_STALE_SECONDS are fetched afresh.
+
+Both live in an in-process LRU in front of a SQLite file, with entry limits
+on both. All methods block and are called through `asyncio.to_thread` from
+async code.
+
+Configuration (environment):
+    WEB_CACHE_ENABLED                  cache searches and pages (default true)
+    WEB_SEARCH_CACHE_TTL_SECONDS       search results (default 6 hours)
+    WEB_PAGE_CACHE_TTL_SECONDS         pages served without revalidation (default 1 hour)
+    WEB_PAGE_CACHE_MAX_STALE_SECONDS   pages kept for revalidation (default 7 days)
+    WEB_SEARCH_CACHE_MAX_ENTRIES       stored searches (default 2000)
+    WEB_PAGE_CACHE_MAX_ENTRIES         stored pages (default 5000)
+    WEB_CACHE_PATH                     SQLite file (default <BRAIN_CACHE_DIR>/web_cache.sqlite3)
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.llm_cache import CACHE_DIR, DISK_EVICT_FRACTION, MemoryTier
+
+logger = logging.getLogger(__name__)
+
+WEB_CACHE_ENABLED = os.getenv("WEB_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_TTL_SECONDS = float(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", str(6 * 3600)))
+PAGE_TTL_SECONDS = float(os.getenv("WEB_PAGE_CACHE_TTL_SECONDS", str(3600)))
+PAGE_MAX_STALE_SECONDS = float(os.getenv("WEB_PAGE_CACHE_MAX_STALE_SECONDS", str(7 * 24 * 3600)))
+SEARCH_MAX_ENTRIES = int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "2000"))
+PAGE_MAX_ENTRIES = int(os.getenv("WEB_PAGE_CACHE_MAX_ENTRIES", "5000"))
+CACHE_PATH = Path(os.getenv("WEB_CACHE_PATH", CACHE_DIR / "web_cache.sqlite3"))
+
+# Entries kept in memory in front of SQLite
+MEMORY_MAX_ENTRIES = 256
+
+
+def search_key(query: str, max_results: int) -> str:
+    return f"{' '.join(query.lower().split())}|{max_results}"
+
+
+class WebCache:
+    def __init__(self, path: Path = CACHE_PATH):
+        self.path = path
+        self.searches = MemoryTier(MEMORY_MAX_ENTRIES, SEARCH_TTL_SECONDS)
+        self.pages = MemoryTier(MEMORY_MAX_ENTRIES, PAGE_MAX_STALE_SECONDS)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._rows: Dict[str, int] = {}
+        self.counters = {
+            "search_hits": 0,
+            "search_misses": 0,
+            "page_hits": 0,
+            "page_revalidated": 0,
+            "page_changed": 0,
+            "page_misses": 0,
+            "bytes_not_downloaded": 0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS searches ("
+                "key TEXT PRIMARY KEY, results TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "url TEXT PRIMARY KEY, page TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            for table in ("searches", "pages"):
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)")
+                self._rows[table] = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return self._conn
+
+    def _store(self, table: str, key_column: str, key: str, value_column: str, value: str, max_entries: int):
+        """
+        Insert or replace a row; once the table is over `max_entries`, evict the
+        least recently used rows (and some headroom) through the accessed_at
+        index. The caller holds the lock.
+        """
+        conn = self._connect()
+        now = time.time()
+        exists = conn.execute(f"SELECT 1 FROM {table} WHERE {key_column} = ?", (key,)).fetchone()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {table} ({key_column}, {value_column}, fetched_at, accessed_at) "
+            "VALUES (?, ?, ?, ?)",
+            (key, value, now, now),
+        )
+        if not exists:
+            self._rows[table] += 1
+        if self._rows[table] > max_entries:
+            excess = self._rows[table] - max_entries + int(max_entries * DISK_EVICT_FRACTION)
+            self._rows[table] -= conn.execute(
+                f"DELETE FROM {table} WHERE {key_column} IN ("
+                f"SELECT {key_column} FROM {table} ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            ).rowcount
+        conn.commit()
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    # -------- Search results --------
+
+    def get_search(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        results = self.searches.get(key)
+        if results is None:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT results, fetched_at FROM searches WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] + SEARCH_TTL_SECONDS >= time.time():
+                    conn.execute("UPDATE searches SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                    conn.commit()
+                    results = json.loads(row[0])
+            if results is not None:
+                self.searches.set(key, results)
+        self.count("search_hits" if results is not None else "search_misses")
+        return results
+
+    def set_search(self, key: str, results: List[Dict[str, Any]]):
+        self.searches.set(key, results)
+        with self._lock:
+            self._store("searches", "key", key, "results", json.dumps(results), SEARCH_MAX_ENTRIES)
+
+    # -------- Pages --------
+
+    def get_page(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        The stored page (scraped_title, content, etag, last_modified, size,
+        fetched_at), fresh or not; None when unknown or too old to revalidate.
+        """
+        page = self.pages.get(url)
+        if page is None:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT page FROM pages WHERE url = ?", (url,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+                    conn.commit()
+                    page = json.loads(row[0])
+            if page is not None:
+                self.pages.set(url, page)
+        if page is not None and page["fetched_at"] + PAGE_MAX_STALE_SECONDS < time.time():
+            return None
+        return page
+
+    def set_page(self, url: str, page: Dict[str, Any]):
+        page = {**page, "fetched_at": time.time()}
+        self.pages.set(url, page)
+        with self._lock:
+            self._store("pages", "url", url, "page", json.dumps(page), PAGE_MAX_ENTRIES)
+
+    @staticmethod
+    def is_fresh(page: Dict[str, Any]) -> bool:
+        return page["fetched_at"] + PAGE_TTL_SECONDS >= time.time()
+
+    def get_stats(self) -> Dict[str, Any]:
+        c = self.counters
+        searches = c["search_hits"] + c["search_misses"]
+        pages = c["page_hits"] + c["page_revalidated"] + c["page_changed"] + c["page_misses"]
+        return {
+            "enabled": WEB_CACHE_ENABLED,
+            **c,
+            "search_hit_ratio": round(c["search_hits"] / searches, 3) if searches else 0.0,
+            # Revalidated pages were not downloaded again, so they count as hits
+            "page_hit_ratio": round((c["page_hits"] + c["page_revalidated"]) / pages, 3) if pages else 0.0,
+            "memory_searches": len(self.searches),
+            "memory_pages": len(self.pages),
+        }
+
+
+# Global web cache
+web_cache = WebCache()
@@ -1,16 +1,46 @@
 # utils/web_search.py
+import itertools
+import logging
+import sqlite3
 from duckduckgo_search import DDGS
+from utils.web_cache import WEB_CACHE_ENABLED, search_key, web_cache
+
+logger = logging.getLogger(__name__)
+
+def search_results(query, max_results, use_cache=WEB_CACHE_ENABLED, store=WEB_CACHE_ENABLED):
+    """Raw DuckDuckGo results that have a link, served from the web cache when possible (blocking)"""
+    key = search_key(query, max_results)
+    if use_cache:
+        try:
+            cached = web_cache.get_search(key)
+        except sqlite3.Error as e:
+            logger.warning(f"Web cache access failed: {e}")
+            cached = None
+        if cached is not None:
+            return cached
+
+    # Take only the results we need from the lazy iterator
+    with DDGS() as ddgs:
+        results = ddgs.text(query, max_results=max_results)
+        results = [r for r in itertools.islice(results, max_results) if r.get("href")]
+
+    if store and results:
+        try:
+            web_cache.set_search(key, results)
+        except sqlite3.Error as e:
+            logger.warning(f"Web cache access failed: {e}")
+    return results
 
 def perform_web_search(query, max_results=3):
     results = []
-    with DDGS() as ddgs:
-        for r in ddgs.text(query):
-            if r["body"]:
-                results.append({
-                    "title": r["title"],
-                    "snippet": r["body"],
-                    "link": r["href"]
-                })
-            if len(results) >= max_results:
-                break
+    # Some results have no snippet; ask for a few extra
+    for r in search_results(query, max_results * 2):
+        if r.get("body"):
+            results.append({
+                "title": r["title"],
+                "snippet": r["body"],
+                "link": r["href"]
+            })
+        if len(results) >= max_results:
+            break
     return results